@@ -1,32 +1,10 @@
-import http.server
-import socketserver
-import webbrowser
+import sys
 from pathlib import Path
-import os
 
-PORT = 8000
+# Reuse the root server, serving this directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-class CORSHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-    def end_headers(self):
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET')
-        self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate')
-        return super().end_headers()
+from server import main
 
 if __name__ == "__main__":
-    # Make sure the server serves files from the current directory
-    web_dir = Path(__file__).resolve().parent
-    os.chdir(web_dir)
-    
-    print(f"Starting server at http://localhost:{PORT}")
-    print("Press Ctrl+C to stop the server")
-    
-    # Open the browser with the correct file
-    webbrowser.open(f"http://localhost:{PORT}/multi_chart.html")
-    
-    # Start the server
-    with socketserver.TCPServer(("", PORT), CORSHTTPRequestHandler) as httpd:
-        try:
-            httpd.serve_forever()
-        except KeyboardInterrupt:
-            print("\nServer stopped.") 
\ No newline at end of file
+    main(web_dir=Path(__file__).resolve().parent, start_page="multi_chart.html")
@@ -1,9 +1,18 @@
+import argparse
+import functools
 import http.server
 import socketserver
+import sys
 import webbrowser
 from pathlib import Path
 import os
 
+# Allow importing src when this file is run directly from any working directory
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from src.server.static_files import (DEFAULT_COMPRESSED_CACHE_DIR, CompressedFileCache, ProductionHTTPServer,
+                                     ProductionRequestHandler, load_cache_rules)
+
 PORT = 8000
 
 class CORSHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
@@ -13,20 +22,72 @@ class CORSHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate')
         return super().end_headers()
 
-if __name__ == "__main__":
+def run_production_server(web_dir, port, cache_dir, cache_config, precompress, data_path, preload):
+    """Serve web_dir and the /api endpoints concurrently with compression, ETags, ranges and per-path caching"""
+    # Imported here: the analysis stack (pandas, pyarrow, ...) is only needed in production mode
+    from src.server.service import CRZServiceHandler
+    from src.utils.data_loader import DEFAULT_DATA_PATH, get_processed_data
+
+    if data_path is None:
+        data_path = str(Path(__file__).resolve().parent / DEFAULT_DATA_PATH)
+    ProductionRequestHandler.compressed_cache = CompressedFileCache(cache_dir)
+    ProductionRequestHandler.cache_rules = load_cache_rules(cache_config)
+    CRZServiceHandler.data_path = data_path
+    if precompress:
+        print("Precompressing static files...")
+        ProductionRequestHandler.compressed_cache.precompress(str(web_dir))
+    if preload:
+        get_processed_data(data_path)
+
+    handler = functools.partial(CRZServiceHandler, directory=str(web_dir))
+    with ProductionHTTPServer(("", port), handler) as httpd:
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("\nServer stopped.")
+
+def main(web_dir=None, start_page=".html"):
+    parser = argparse.ArgumentParser(description="Serve the dashboard files")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--directory", default=None, help="Directory to serve")
+    parser.add_argument("--production", action="store_true",
+                        help="Threaded server with compression, ETags, range requests and cache headers")
+    parser.add_argument("--cache-dir", default=DEFAULT_COMPRESSED_CACHE_DIR,
+                        help="Where compressed copies of the files are stored (production mode)")
+    parser.add_argument("--cache-config", default=None,
+                        help="JSON file with [path pattern, Cache-Control] pairs (production mode)")
+    parser.add_argument("--precompress", action="store_true",
+                        help="Compress all static files at startup (production mode)")
+    parser.add_argument("--data", default=None,
+                        help="CRZ dataset behind the /api endpoints (production mode; default: the bundled CSV)")
+    parser.add_argument("--preload", action="store_true",
+                        help="Load the dataset at startup instead of on the first /api request (production mode)")
+    parser.add_argument("--no-browser", action="store_true", help="Do not open a browser window")
+    args = parser.parse_args()
+    data_path = str(Path(args.data).resolve()) if args.data else None
+
     # Make sure the server serves files from the current directory
-    web_dir = Path(__file__).resolve().parent
+    web_dir = Path(args.directory or web_dir or Path(__file__).resolve().parent).resolve()
     os.chdir(web_dir)
     
-    print(f"Starting server at http://localhost:{PORT}")
+    print(f"Starting server at http://localhost:{args.port}")
     print("Press Ctrl+C to stop the server")
     
     # Open the browser
-    webbrowser.open(f"http://localhost:{PORT}/.html")
+    if not args.no_browser:
+        webbrowser.open(f"http://localhost:{args.port}/{start_page}")
+
+    if args.production:
+        run_production_server(web_dir, args.port, args.cache_dir, args.cache_config, args.precompress,
+                              data_path, args.preload)
+        return
     
     # Start the server
-    with socketserver.TCPServer(("", PORT), CORSHTTPRequestHandler) as httpd:
+    with socketserver.TCPServer(("", args.port), CORSHTTPRequestHandler) as httpd:
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
-            print("\nServer stopped.") 
\ No newline at end of file
+            print("\nServer stopped.")
+
+if __name__ == "__main__":
+    main()
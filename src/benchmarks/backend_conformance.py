@@ -0,0 +1,246 @@
+"""
+Conformance check of the execution backends against pandas
+
+Runs every analyze_* function over a set of cases covering each granularity,
+time unit, comparison dimension and kind of filter (including overnight hour
+ranges, numeric and named vehicle classes and filters that select no rows)
+on every other backend, and compares each result with the pandas backend's
+exactly: same keys in the same order, same values and types. Backends whose
+engine is not installed are skipped.
+
+The cases that ParallelCRZExecutor can shard are also run through it on
+every backend, since the analysis then reads the workers' pre-aggregated
+sums instead of the dataset's rows.
+
+Finally the dataset is edited in place (entries and vehicle classes change,
+the length stays) and its version bumped with bump_data_version: every
+backend, pandas included, must then match pandas on a fresh copy of the
+edited rows, so no cache (filter masks, date index, Arrow snapshot) serves
+the old ones. The script exits with status 1 on any difference.
+
+Usage:
+    python -m src.benchmarks.backend_conformance
+    python -m src.benchmarks.backend_conformance --rows 1000000 --backends duckdb
+    python -m src.benchmarks.backend_conformance --parallel-workers 0  # skip the sharded runs
+"""
+
+import argparse
+import math
+import sys
+import time
+
+from src.utils.data_loader import bump_data_version, process_data
+from src.utils.synthetic_data import generate_crz_data
+from src.workflow.backends import BACKENDS, create_backend, get_backend, set_backend
+from src.workflow.other_tools import call_crz_function, get_params_model, prepare_function_params
+from src.workflow.parallel import ParallelCRZExecutor, get_shard_dimensions
+
+CONFORMANCE_CASES = [
+    ("analyze_entry_point_volume", {}),
+    ("analyze_entry_point_volume", {"top_n": 3, "day_type": "weekday", "time_period": "Peak",
+                                    "include_excluded_roadways": True}),
+    ("analyze_entry_point_volume", {"start_date": "2025-01-10", "end_date": "2025-01-20", "vehicle_class": "1",
+                                    "hour_range": [22, 5]}),
+    ("analyze_entry_point_volume", {"start_date": "2030-01-01"}),
+    ("analyze_peak_periods", {"granularity": "hour"}),
+    ("analyze_peak_periods", {"granularity": "day_of_week", "entry_region": "Brooklyn"}),
+    ("analyze_peak_periods", {"granularity": "date", "vehicle_class": "TLC Taxi/FHV", "top_n": 10}),
+    ("analyze_peak_periods", {"granularity": "10_minute", "entry_point": "Holland Tunnel", "day_type": "Saturday"}),
+    ("analyze_peak_periods", {"granularity": "hour", "end_date": "2024-01-01"}),
+    ("analyze_vehicle_distribution", {}),
+    ("analyze_vehicle_distribution", {"hour_range": [7, 10], "entry_point": "Lincoln Tunnel"}),
+    ("analyze_vehicle_distribution", {"day_type": "weekday", "compare_with": {"day_type": "weekend"}}),
+    ("analyze_time_trends", {"time_unit": "hour"}),
+    ("analyze_time_trends", {"time_unit": "day", "vehicle_class": "2"}),
+    ("analyze_time_trends", {"time_unit": "day_of_week", "metric": "Excluded Roadway Entries"}),
+    ("analyze_time_trends", {"time_unit": "week", "entry_region": "New Jersey", "day_type": "weekend"}),
+    ("analyze_time_trends", {"time_unit": "month", "start_date": "2025-01-15"}),
+    ("analyze_time_trends", {"time_unit": "day", "start_date": "2025-01-12", "end_date": "2025-01-12"}),
+    ("analyze_time_trends", {"time_unit": "day", "start_date": "2030-01-01"}),
+    ("analyze_excluded_roadway_usage", {}),
+    ("analyze_excluded_roadway_usage", {"time_period": "Overnight", "vehicle_class": "4", "entry_region": "Queens"}),
+    ("compare_traffic_segments", {"dimension": "time", "segment_a": {"day_type": "weekday"},
+                                  "segment_b": {"day_type": "weekend", "hour_range": [10, 14]}}),
+    ("compare_traffic_segments", {"dimension": "location", "segment_a": {"entry_point": "Holland Tunnel"},
+                                  "segment_b": {"entry_region": "Brooklyn"}}),
+    ("compare_traffic_segments", {"dimension": "vehicle", "segment_a": {"vehicle_class": "1"},
+                                  "segment_b": {"vehicle_class": "TLC Taxi/FHV"},
+                                  "metric": "Excluded Roadway Entries"}),
+]
+
+
+def first_difference(expected, actual, path: str = 'result') -> str | None:
+    """Path and values of the first difference between two results, or None if they are identical"""
+    if type(expected) is not type(actual):
+        return f"{path}: {type(expected).__name__} {expected!r} != {type(actual).__name__} {actual!r}"
+    if isinstance(expected, dict):
+        if list(expected) != list(actual):
+            return f"{path}: keys {list(expected)} != {list(actual)}"
+        for key in expected:
+            difference = first_difference(expected[key], actual[key], f"{path}.{key}")
+            if difference:
+                return difference
+        return None
+    if isinstance(expected, (list, tuple)):
+        if len(expected) != len(actual):
+            return f"{path}: {len(expected)} items != {len(actual)}"
+        for index, (a, b) in enumerate(zip(expected, actual)):
+            difference = first_difference(a, b, f"{path}[{index}]")
+            if difference:
+                return difference
+        return None
+    if isinstance(expected, float) and math.isnan(expected) and math.isnan(actual):
+        return None
+    if expected != actual:
+        return f"{path}: {expected!r} != {actual!r}"
+    return None
+
+
+def run_cases(df) -> list:
+    """Results of every case on the current backend"""
+    results = []
+    for function_name, params in CONFORMANCE_CASES:
+        params_dict = prepare_function_params(function_name, get_params_model(function_name)(**params))
+        results.append(call_crz_function(function_name, params_dict, df))
+    return results
+
+
+def check_backends(df, backends: list) -> int:
+    """Compare each backend with pandas; returns the number of differing results"""
+    previous = get_backend().name
+    set_backend('pandas')
+    started = time.perf_counter()
+    expected = run_cases(df)
+    print(f"pandas: reference ({time.perf_counter() - started:.2f}s)")
+    failures = 0
+    try:
+        for name in backends:
+            try:
+                create_backend(name)
+            except ImportError as e:
+                print(f"SKIP {name}: {e}")
+                continue
+            set_backend(name)
+            started = time.perf_counter()
+            actual = run_cases(df)
+            elapsed = time.perf_counter() - started
+            mismatches = 0
+            for (function_name, params), a, b in zip(CONFORMANCE_CASES, expected, actual):
+                difference = first_difference(a, b)
+                if difference:
+                    mismatches += 1
+                    print(f"MISMATCH {name} {function_name} {params}\n    {difference}")
+            print(f"{name}: {len(CONFORMANCE_CASES) - mismatches}/{len(CONFORMANCE_CASES)} cases identical "
+                  f"({elapsed:.2f}s)")
+            failures += mismatches
+    finally:
+        set_backend(previous)
+    return failures
+
+
+def check_parallel(df, backends: list, workers: int) -> int:
+    """Compare ParallelCRZExecutor.execute on each backend with pandas on the full rows
+
+    Shardable cases are summed per shard; the rest run whole in a worker on the shared frame.
+    """
+    cases = []
+    sharded = 0
+    for function_name, params in CONFORMANCE_CASES:
+        params_dict = prepare_function_params(function_name, get_params_model(function_name)(**params))
+        cases.append((function_name, params, params_dict))
+        sharded += get_shard_dimensions(function_name, params_dict, list(df.columns)) is not None
+    previous = get_backend().name
+    failures = 0
+    try:
+        set_backend('pandas')
+        expected = [call_crz_function(function_name, params_dict, df) for function_name, _, params_dict in cases]
+        with ParallelCRZExecutor(df, max_workers=workers) as executor:
+            for name in ['pandas'] + [name for name in backends if name != 'pandas']:
+                try:
+                    set_backend(name)
+                except ImportError as e:
+                    print(f"SKIP parallel {name}: {e}")
+                    continue
+                started = time.perf_counter()
+                mismatches = 0
+                for (function_name, params, _), a in zip(cases, expected):
+                    try:
+                        b = executor.execute(function_name, params)
+                    except Exception as e:
+                        difference = f"{type(e).__name__}: {e}"
+                    else:
+                        difference = first_difference(a, b)
+                    if difference:
+                        mismatches += 1
+                        print(f"MISMATCH parallel {name} {function_name} {params}\n    {difference}")
+                print(f"parallel {name}: {len(cases) - mismatches}/{len(cases)} cases identical, {sharded} sharded "
+                      f"({time.perf_counter() - started:.2f}s)")
+                failures += mismatches
+    finally:
+        set_backend(previous)
+    return failures
+
+
+def check_edited(df, backends: list) -> int:
+    """
+    Edit df in place after every backend has read it, and compare each backend on it with
+    pandas on a copy; returns the number of differing results
+    """
+    previous = get_backend().name
+    available = ['pandas']
+    for name in backends:
+        try:
+            create_backend(name)
+        except ImportError as e:
+            print(f"SKIP edited {name}: {e}")
+            continue
+        if name not in available:
+            available.append(name)
+    failures = 0
+    try:
+        # Fill every backend's caches with the current rows
+        for name in available:
+            set_backend(name)
+            run_cases(df)
+        df['CRZ Entries'] = df['CRZ Entries'] * 2 + 1
+        df['Vehicle Class'] = df['Vehicle Class'].to_numpy()[::-1]
+        bump_data_version(df)
+        set_backend('pandas')
+        expected = run_cases(df.copy())
+        for name in available:
+            set_backend(name)
+            mismatches = 0
+            for (function_name, params), a, b in zip(CONFORMANCE_CASES, expected, run_cases(df)):
+                difference = first_difference(a, b)
+                if difference:
+                    mismatches += 1
+                    print(f"MISMATCH edited {name} {function_name} {params}\n    {difference}")
+            print(f"edited {name}: {len(CONFORMANCE_CASES) - mismatches}/{len(CONFORMANCE_CASES)} cases identical")
+            failures += mismatches
+    finally:
+        set_backend(previous)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that every execution backend matches the pandas results")
+    parser.add_argument('--rows', type=int, default=200_000, help="Rows of synthetic data")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backends', nargs='+', default=[name for name in BACKENDS if name != 'pandas'],
+                        help="Backends to check (default: all but pandas)")
+    parser.add_argument('--parallel-workers', type=int, default=2,
+                        help="Workers for the sharded runs through ParallelCRZExecutor (0 to skip them)")
+    args = parser.parse_args()
+
+    df, _ = process_data(generate_crz_data(args.rows, seed=args.seed))
+    failures = check_backends(df, args.backends)
+    if args.parallel_workers > 0:
+        failures += check_parallel(df, args.backends, args.parallel_workers)
+    failures += check_edited(df, args.backends)
+    if failures:
+        print(f"FAILED: {failures} differing results")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Cold-start import time check for the workflow
+
+Imports a module in fresh interpreters and fails when the median import time
+exceeds a budget, when the import itself fails, or when an LLM provider SDK is
+imported eagerly (they are loaded on the first get_model call for their provider).
+Exits with status 1 on any failure, so it can gate CI.
+
+Usage:
+    python -m src.benchmarks.import_time
+    python -m src.benchmarks.import_time --module src.workflow.workflow --budget 1.5 --repeat 5
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import List
+
+from src.llm.models import PROVIDER_CLASSES
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+DEFAULT_MODULE = 'src.workflow.workflow'
+DEFAULT_BUDGET_S = 2.0
+
+# Printed by the child interpreter: import seconds and the provider modules it loaded
+CHILD_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+providers = {providers!r}
+print(json.dumps({{'seconds': elapsed, 'providers': sorted(m for m in providers if m in sys.modules)}}))
+"""
+
+
+def provider_modules() -> list:
+    """Top-level modules of the third-party provider SDKs"""
+    return sorted(module for module, _ in PROVIDER_CLASSES.values() if not module.startswith('src.'))
+
+
+def measure_import(module: str) -> dict:
+    """Import a module in a new interpreter and report its import time and loaded provider SDKs"""
+    script = CHILD_SCRIPT.format(module=module, providers=provider_modules())
+    completed = subprocess.run([sys.executable, '-c', script], cwd=REPO_ROOT, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(module: str, limit: int = 15) -> list:
+    """(cumulative seconds, module) of the slowest imports, from python -X importtime"""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                               cwd=REPO_ROOT, capture_output=True, text=True)
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative) / 1e6, name.rstrip()))
+    rows.sort(reverse=True)
+    return rows[:limit]
+
+
+def check_import_time(module: str, budget: float, repeat: int) -> List[str]:
+    """Measure the import of a module and return why it fails its checks (empty when it passes)"""
+    try:
+        runs = [measure_import(module) for _ in range(repeat)]
+    except RuntimeError as e:
+        return [str(e)]
+    median = statistics.median(run['seconds'] for run in runs)
+    print(f"import {module}: median {median:.3f}s over {repeat} runs "
+          f"(min {min(run['seconds'] for run in runs):.3f}s, budget {budget:.3f}s)")
+    failures = []
+    eager = runs[0]['providers']
+    if eager:
+        failures.append(f"provider SDKs imported at startup: {', '.join(eager)}")
+    if median > budget:
+        failures.append(f"import time {median:.3f}s is over the {budget:.3f}s budget")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the cold-start import time of the workflow")
+    parser.add_argument('--module', default=DEFAULT_MODULE)
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET_S, help="Maximum median seconds")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help="Slowest imports to list")
+    args = parser.parse_args()
+
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    failures = check_import_time(args.module, args.budget, args.repeat)
+
+    if args.top > 0:
+        print("\nSlowest imports (cumulative):")
+        for seconds, name in slowest_imports(args.module, args.top):
+            print(f"{seconds:8.3f}s  {name}")
+
+    if failures:
+        for failure in failures:
+            print(f"\nFAIL: {failure}")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == '__main__':
+    main()
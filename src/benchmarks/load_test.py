@@ -0,0 +1,330 @@
+"""
+Open-loop load generator for the workflow, the analysis tools and the data server
+
+Requests arrive at a fixed target rate whatever the response times, and each
+latency is measured from the request's scheduled start, so queueing delay is
+included. Everything runs locally: the agents use the local LLM stand-in
+(src/llm/local_model.py) and the HTTP requests go to an in-process server
+unless --url is given.
+
+Usage:
+    python -m src.benchmarks.load_test --rate 20 --duration 60 --mix tool=3,http=6,workflow=1
+    python -m src.benchmarks.load_test --rows 1000000 --rate 50 --mix http=1 --output load.json
+"""
+
+import argparse
+import functools
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from src.benchmarks.tool_benchmarks import TOOL_CASES, environment_info
+from src.utils.data_loader import get_processed_data
+from src.utils.process_stats import RSSSampler
+from src.utils.synthetic_data import write_crz_csv
+from src.workflow.other_tools import execute_crz_function, get_params_model
+
+PUBLIC_DIR = Path(__file__).resolve().parents[2] / 'public'
+
+# Questions a chat user might ask
+QUESTIONS = [
+    "What is the total number of vehicles that entered the CRZ in the last 30 days?",
+    "Which entry points are the busiest during peak hours?",
+    "Compare weekday and weekend traffic at the Holland Tunnel",
+    "How has daily traffic through the Lincoln Tunnel changed over time?",
+    "What share of entries are trucks on weekdays?",
+    "When is the busiest hour for traffic from Brooklyn?",
+    "How many vehicles use the FDR Drive excluded roadway on weekends?",
+    "Show the weekly trend of taxi entries",
+]
+
+# Requests a dashboard refresh makes
+HTTP_PATHS = [
+    '/api/peaks?granularity=hour',
+    '/api/trends?time_unit=day&entry_point=Holland+Tunnel',
+    '/api/trends?time_unit=week&vehicle_class=2',
+    '/api/entry-points?day_type=weekday&time_period=Peak',
+    '/api/vehicles?hour_range=7,10',
+    '/api/excluded-roadways',
+    '/api/compare?dimension=time&segment_a={"day_type":"weekday"}&segment_b={"day_type":"weekend"}',
+    '/multi_chart.html',
+]
+
+DEFAULT_MIX = {'tool': 3, 'http': 6, 'workflow': 1}
+
+PERCENTILES = (50, 95, 99)
+
+
+def parse_mix(text: str) -> dict:
+    """Parse 'tool=3,http=6,workflow=1' into relative weights"""
+    mix = {}
+    for item in text.split(','):
+        kind, _, weight = item.partition('=')
+        kind = kind.strip()
+        if kind not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown request kind {kind!r}; expected one of {list(DEFAULT_MIX)}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+class QuietServiceHandler:
+    """Mixin silencing the per-request access log"""
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_local_server(data_path: str) -> tuple:
+    """
+    Serve public/ and the /api endpoints on an ephemeral port in a background thread
+
+    Returns:
+        (server, base URL)
+    """
+    from src.server.service import CRZServiceHandler
+    from src.server.static_files import DEFAULT_COMPRESSED_CACHE_DIR, CompressedFileCache, ProductionHTTPServer
+
+    handler_class = type('LoadTestHandler', (QuietServiceHandler, CRZServiceHandler), {
+        'data_path': data_path,
+        'compressed_cache': CompressedFileCache(DEFAULT_COMPRESSED_CACHE_DIR),
+    })
+    server = ProductionHTTPServer(('127.0.0.1', 0), functools.partial(handler_class, directory=str(PUBLIC_DIR)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def build_operations(kinds, data_path: str, df, base_url: str | None) -> dict:
+    """
+    Callables for each request kind
+
+    Returns:
+        Dictionary of kind -> list of (name, callable)
+    """
+    operations = {}
+    if 'tool' in kinds:
+        operations['tool'] = []
+        for function_name, params in TOOL_CASES:
+            model = get_params_model(function_name)(**params)
+            operations['tool'].append((function_name, functools.partial(execute_crz_function, function_name, model, df)))
+    if 'http' in kinds:
+        def fetch(url):
+            with urllib.request.urlopen(url, timeout=60) as response:
+                response.read()
+        operations['http'] = [(path.split('?', 1)[0],
+                               functools.partial(fetch, base_url + urllib.parse.quote(path, safe='/?=&,+')))
+                              for path in HTTP_PATHS]
+    if 'workflow' in kinds:
+        from src.workflow.workflow import run_workflow
+        operations['workflow'] = [
+            ('run_workflow', functools.partial(run_workflow, question, data_path=data_path, verbose=False))
+            for question in QUESTIONS
+        ]
+    return operations
+
+
+def latency_summary(latencies: list) -> dict:
+    if not latencies:
+        return {f'p{p}_ms': None for p in PERCENTILES} | {'max_ms': None, 'mean_ms': None}
+    values = np.array(latencies) * 1000
+    summary = {f'p{p}_ms': float(np.percentile(values, p)) for p in PERCENTILES}
+    summary.update({'max_ms': float(values.max()), 'mean_ms': float(values.mean())})
+    return summary
+
+
+def summarize(results: list, elapsed: float) -> dict:
+    """Latency percentiles, throughput and error rate overall and per request kind"""
+    def group_summary(items):
+        errors = sum(1 for item in items if not item['ok'])
+        return {
+            'requests': len(items),
+            'errors': errors,
+            'error_rate': errors / len(items) if items else 0.0,
+            'throughput_per_s': len(items) / elapsed if elapsed > 0 else None,
+            **latency_summary([item['latency_s'] for item in items if item['ok']]),
+        }
+
+    summary = {'overall': group_summary(results), 'by_kind': {}, 'by_operation': {}}
+    for key, field in (('by_kind', 'kind'), ('by_operation', 'operation')):
+        groups = {}
+        for item in results:
+            name = item[field] if field == 'kind' else f"{item['kind']}:{item['operation']}"
+            groups.setdefault(name, []).append(item)
+        summary[key] = {name: group_summary(items) for name, items in sorted(groups.items())}
+    return summary
+
+
+def timeline(results: list, memory_samples: list, window: float) -> list:
+    """Completed requests, errors, p95 latency and RSS per time window"""
+    if not results:
+        return []
+    end = max(item['scheduled_s'] + item['latency_s'] for item in results)
+    windows = []
+    for index in range(int(end // window) + 1):
+        start, stop = index * window, (index + 1) * window
+        done = [item for item in results if start <= item['scheduled_s'] + item['latency_s'] < stop]
+        rss = [value for t, value in memory_samples if start <= t < stop]
+        windows.append({
+            'start_s': start,
+            'completed': len(done),
+            'errors': sum(1 for item in done if not item['ok']),
+            'p95_ms': latency_summary([item['latency_s'] for item in done if item['ok']])['p95_ms'],
+            'rss_bytes': max(rss) if rss else None,
+        })
+    return windows
+
+
+def run_load_test(operations: dict, mix: dict, rate: float, duration: float, concurrency: int = 64,
+                  arrivals: str = 'poisson', seed: int = 0) -> tuple:
+    """
+    Issue requests at a target rate for a fixed duration
+
+    Args:
+        operations: Kind -> list of (name, callable), from build_operations
+        mix: Kind -> relative weight
+        rate: Target arrivals per second
+        duration: Seconds during which requests are issued
+        concurrency: Worker threads; requests beyond this wait in the queue (and count as latency)
+        arrivals: 'poisson' (exponential gaps) or 'uniform' (fixed gaps)
+        seed: Seed for the request mix and arrival times
+
+    Returns:
+        (list of per-request results, elapsed seconds, list of (seconds, RSS bytes) samples)
+    """
+    rng = random.Random(seed)
+    kinds = [kind for kind in mix if kind in operations]
+    weights = [mix[kind] for kind in kinds]
+    results = []
+    results_lock = threading.Lock()
+
+    def run(kind, name, func, scheduled):
+        ok, error = True, None
+        try:
+            func()
+        except Exception as e:
+            ok, error = False, f"{type(e).__name__}: {e}"
+        finished = time.perf_counter()
+        with results_lock:
+            results.append({
+                'kind': kind,
+                'operation': name,
+                'scheduled_s': scheduled - start,
+                'latency_s': finished - scheduled,
+                'ok': ok,
+                'error': error,
+            })
+
+    with RSSSampler(interval=0.5) as sampler, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        next_arrival = start
+        while next_arrival < start + duration:
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            kind = rng.choices(kinds, weights)[0]
+            name, func = rng.choice(operations[kind])
+            pool.submit(run, kind, name, func, next_arrival)
+            next_arrival += rng.expovariate(rate) if arrivals == 'poisson' else 1 / rate
+    elapsed = time.perf_counter() - start
+    # RSS samples are timed from sampler start, which is just before the first arrival
+    return results, elapsed, sampler.samples
+
+
+def print_report(summary: dict, memory_samples: list):
+    header = f"{'':<34} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+
+    def row(name, stats):
+        def ms(value):
+            return f"{value:9.1f}" if value is not None else f"{'-':>9}"
+        print(f"{name:<34.34} {stats['requests']:>9} {stats['errors']:>7} {stats['throughput_per_s']:8.1f} "
+              f"{ms(stats['p50_ms'])} {ms(stats['p95_ms'])} {ms(stats['p99_ms'])}")
+
+    print(header)
+    row('overall', summary['overall'])
+    for name, stats in summary['by_kind'].items():
+        row(f"  {name}", stats)
+    for name, stats in summary['by_operation'].items():
+        row(f"    {name}", stats)
+    if memory_samples:
+        rss = [value for _, value in memory_samples]
+        print(f"\nRSS: start {rss[0] / 2**20:.0f} MiB, peak {max(rss) / 2**20:.0f} MiB, "
+              f"end {rss[-1] / 2**20:.0f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the CRZ workflow, tools and data server locally")
+    parser.add_argument('--rate', type=float, default=10, help="Target requests per second")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds to issue requests for")
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help="Relative weights of request kinds, e.g. tool=3,http=6,workflow=1")
+    parser.add_argument('--concurrency', type=int, default=64, help="Worker threads issuing requests")
+    parser.add_argument('--arrivals', choices=['poisson', 'uniform'], default='poisson')
+    parser.add_argument('--data', help="Dataset CSV (default: synthetic data of --rows rows)")
+    parser.add_argument('--rows', type=int, default=500_000, help="Rows of synthetic data when --data is not given")
+    parser.add_argument('--url', help="Base URL of a running server (default: start one in-process)")
+    parser.add_argument('--llm-latency-ms', type=float, help="Local LLM time to first token")
+    parser.add_argument('--llm-tps', type=float, help="Local LLM response tokens per second")
+    parser.add_argument('--window', type=float, default=5, help="Seconds per timeline window")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the summary, timeline and raw results as JSON")
+    args = parser.parse_args()
+
+    # The agents read their model at call time; point them at the local stand-in
+    os.environ['CRZ_LLM_MODEL'] = 'local-replay'
+    os.environ['CRZ_LLM_PROVIDER'] = 'Local'
+    if args.llm_latency_ms is not None:
+        os.environ['CRZ_LOCAL_LLM_LATENCY_MS'] = str(args.llm_latency_ms)
+    if args.llm_tps is not None:
+        os.environ['CRZ_LOCAL_LLM_TPS'] = str(args.llm_tps)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_path = args.data
+        if data_path is None:
+            data_path = os.path.join(tmp_dir, 'crz.csv')
+            print(f"Writing {args.rows:,} rows of synthetic data...")
+            write_crz_csv(data_path, args.rows, seed=args.seed)
+        data_path = os.path.abspath(data_path)
+        df, _ = get_processed_data(data_path)
+
+        server, base_url = None, args.url
+        if 'http' in args.mix and base_url is None:
+            server, base_url = start_local_server(data_path)
+        try:
+            operations = build_operations(args.mix, data_path, df, base_url)
+            print(f"Running {args.rate:g} req/s for {args.duration:g}s, mix {args.mix}...")
+            results, elapsed, memory_samples = run_load_test(operations, args.mix, args.rate, args.duration,
+                                                             args.concurrency, args.arrivals, args.seed)
+        finally:
+            if server is not None:
+                server.shutdown()
+
+    summary = summarize(results, elapsed)
+    print_report(summary, memory_samples)
+    errors = [item['error'] for item in results if item['error']]
+    if errors:
+        print(f"\nFirst error: {errors[0]}")
+
+    if args.output:
+        report = {
+            'environment': environment_info(),
+            'config': {key: value for key, value in vars(args).items() if key != 'output'},
+            'summary': summary,
+            'timeline': timeline(results, memory_samples, args.window),
+            'memory_samples': memory_samples,
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Input tokens per agent call before and after the prompt restructuring
+
+Renders each agent stage's prompt for labeled questions with the current
+templates (src/workflow/prompts.py) and with the previous ones, and reports
+the mean input tokens per call and how many of them form a prefix that is
+byte-identical across calls (what provider-side prompt caching can reuse).
+Retrieved data and data descriptions are the same in both versions.
+
+Tokens are counted with tiktoken (cl100k_base) when it is installed, and
+estimated as characters / 4 otherwise.
+
+Usage:
+    python -m src.benchmarks.prompt_tokens
+"""
+
+import json
+import os
+
+from src.benchmarks.router_eval import LABELED_QUESTIONS
+from src.llm.local_model import choose_function, count_tokens
+from src.models.schemas import functions_info
+from src.workflow.other_tools import find_function_description
+from src.workflow.prompts import FUNCTION_SIGNATURES, ROLE_PREFIXES, render_prompt
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding('cl100k_base')
+except ImportError:
+    _encoding = None
+
+STAGES = ['reception', 'function_selection', 'data_retrieval', 'final_answer']
+RETRIEVED_DATA = json.dumps({'total_entries': 1234567, 'daily_average': 41152.2, 'trend': 'increasing'})
+
+# The agents' prompts before they were restructured (templates rebuilt per call,
+# query first, functions_info dict inlined), kept verbatim for comparison
+LEGACY_MESSAGES = {
+    'reception': [
+        ('system',
+         'You are data analyst specializing in NYC Congestion Relief Zone data.\n'
+         '                    '),
+        ('human',
+         "You are given a user's query.{query} You need to first determine if you need to retrieve data from the dataset to answer the user's query.\n"
+         '                    If you need to retrieve data, you need to describe the data needed to be retrieved, you should provide response as retrieving data from the dataset.\n'
+         "                    If you don't need to retrieve data, you need to provide a response to the user's query.\n"
+         "                    response: The response to the user's query, in a concise and informative manner\n"
+         "                    retrieve_data: do we need to retrieve data from the dataset to answer the user's query\n"
+         "                    data_description: a description of the data needed to be retrieved from the dataset to answer the user's query\n"
+         '                    '),
+    ],
+    'function_selection': [
+        ('system',
+         'You are data analyst specializing in NYC Congestion Relief Zone data.\n'
+         '                    '),
+        ('human',
+         'You are given a task to retrive data from NYC Congestion Relief Zone data. User is asking for {user_query} \n'
+         "                    To answer the user's query, you need to retrieve data that is described as {data_description}\n"
+         '                    You need to first determine if one of the functions in the following list can be used to retrieve the data:\n'
+         '                    {functions_info}\n'
+         '                    If yes, you need to provide the name of the function to call to retrieve the data.\n'
+         "                    If no, you need to provide a response to the user's query, informing the user that the data is not available in the dataset.\n"
+         "                    response: The response to the user's query, in a concise and informative manner\n"
+         "                    data_available: do we have the data needed to answer the user's query\n"
+         '                    function_name: the name of the function to call to retrieve the data\n'
+         '                    \n'
+         '                    '),
+    ],
+    'data_retrieval': [
+        ('system',
+         'You are data analyst specializing in NYC Congestion Relief Zone data.\n'
+         '                '),
+        ('human',
+         'You are given a task to retrieve data from NYC Congestion Relief Zone data. User is asking for {user_query} \n'
+         "                To answer the user's query, you need to retrieve data that is described as {functions_description}\n"
+         '                You need to provide the parameters to pass to the function to retrieve the data.\n'
+         "                response: The response to the user's query, in a concise and informative manner\n"
+         '                function_params: the parameters to pass to the function to retrieve the data\n'
+         '                '),
+    ],
+    'final_answer': [
+        ('system',
+         'You are data analyst specializing in NYC Congestion Relief Zone data.\n'
+         '                '),
+        ('human',
+         'You are given a task to retrieve data from NYC Congestion Relief Zone data. User is asking for {user_query} \n'
+         "                To answer the user's query, you have retrieved the following data: {retrieved_data}\n"
+         '                '),
+    ],
+}
+
+
+def token_count(text: str) -> int:
+    return len(_encoding.encode(text)) if _encoding else count_tokens(text)
+
+
+def prompt_values(stage: str, question: str) -> dict:
+    """Values for a stage's current and previous templates"""
+    function_name = choose_function(question)
+    return {
+        'query': question,
+        'user_query': question,
+        'data_description': f"CRZ entry counts needed to answer: {question}",
+        'functions_info': functions_info,
+        'functions_description': json.dumps(find_function_description(function_name)),
+        'function_signature': FUNCTION_SIGNATURES[function_name],
+        'retrieved_data': RETRIEVED_DATA,
+    }
+
+
+def render_legacy(stage: str, **values) -> str:
+    return '\n'.join(f"{ROLE_PREFIXES[role]}: {template.format(**values)}"
+                     for role, template in LEGACY_MESSAGES[stage])
+
+
+def measure(stage: str, render, questions: list) -> dict:
+    """Mean tokens per call and the tokens of the prefix shared by every call"""
+    prompts = [render(stage, **prompt_values(stage, question)) for question in questions]
+    shared_prefix = os.path.commonprefix(prompts)
+    return {
+        'tokens': sum(map(token_count, prompts)) / len(prompts),
+        'prefix_tokens': token_count(shared_prefix),
+    }
+
+
+def main():
+    questions = [question for question, _, _ in LABELED_QUESTIONS]
+    counter = 'tiktoken cl100k_base' if _encoding else 'characters / 4'
+    print(f"Mean input tokens per call over {len(questions)} questions ({counter})\n")
+    print(f"{'stage':<20} {'before':>8} {'after':>8} {'change':>8} {'shared prefix before':>21} {'after':>7}")
+    totals = {'before': 0.0, 'after': 0.0, 'uncached_after': 0.0}
+    for stage in STAGES:
+        before = measure(stage, render_legacy, questions)
+        after = measure(stage, render_prompt, questions)
+        totals['before'] += before['tokens']
+        totals['after'] += after['tokens']
+        totals['uncached_after'] += after['tokens'] - after['prefix_tokens']
+        change = after['tokens'] / before['tokens'] - 1
+        print(f"{stage:<20} {before['tokens']:>8.0f} {after['tokens']:>8.0f} {change:>+8.0%} "
+              f"{before['prefix_tokens']:>21} {after['prefix_tokens']:>7}")
+    change = totals['after'] / totals['before'] - 1
+    print(f"{'all four stages':<20} {totals['before']:>8.0f} {totals['after']:>8.0f} {change:>+8.0%}")
+    print(f"\nTokens per question outside the shared prefixes after: {totals['uncached_after']:.0f}")
+
+
+if __name__ == '__main__':
+    main()
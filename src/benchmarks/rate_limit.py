@@ -0,0 +1,115 @@
+"""
+Throughput of call_llm against a rate-limited provider, with and without the limiter
+
+Runs closed-loop workers calling call_llm on the local model, which rejects
+requests over CRZ_LOCAL_LLM_RPM with a 429 like a hosted provider. With the
+limiter the answered rate should sit at the provider's ceiling with few 429s
+and no default responses.
+
+Usage:
+    python -m src.benchmarks.rate_limit
+    python -m src.benchmarks.rate_limit --workers 64 --rpm 600 --duration 20 --mode both
+"""
+
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+from pydantic import BaseModel
+
+from src.llm.api_call import LLM_CALLS, LLM_ERRORS, call_llm
+from src.llm.local_model import LOCAL_MODEL_NAME
+from src.llm.models import ModelProvider
+from src.llm.rate_limiter import get_limiter, reset_limiters
+
+PROMPT = "You are given a user's query. {question} You need to answer in one sentence."
+
+
+class Answer(BaseModel):
+    answer: str
+
+
+def run(workers: int, duration: float, limiter: bool) -> dict:
+    """Call the local model from closed-loop workers for duration seconds"""
+    os.environ['CRZ_LLM_RATE_LIMITS'] = 'on' if limiter else 'off'
+    reset_limiters()
+    provider = ModelProvider.LOCAL.value
+    before = {
+        'ok': LLM_CALLS.value(provider=provider, model=LOCAL_MODEL_NAME, outcome='ok'),
+        'default': LLM_CALLS.value(provider=provider, model=LOCAL_MODEL_NAME, outcome='default'),
+        '429': LLM_ERRORS.value(provider=provider, model=LOCAL_MODEL_NAME, error='LocalRateLimitError'),
+    }
+    latencies = []
+    answered_in_window = 0
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def worker(number: int):
+        nonlocal answered_in_window
+        count = 0
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            result = call_llm(PROMPT.format(question=f"question {number}-{count}"), LOCAL_MODEL_NAME,
+                              ModelProvider.LOCAL, Answer)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                if time.monotonic() <= stop_at and not result.answer.startswith("Error in analysis"):
+                    answered_in_window += 1
+            count += 1
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(workers)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    ok = LLM_CALLS.value(provider=provider, model=LOCAL_MODEL_NAME, outcome='ok') - before['ok']
+    limiter_state = get_limiter(provider) if limiter else None
+    return {
+        'limiter': limiter,
+        'elapsed_s': elapsed,
+        'answered': ok,
+        # Rate inside the run window, so workers draining afterwards don't dilute it
+        'answered_per_s': answered_in_window / duration,
+        'default_responses': LLM_CALLS.value(provider=provider, model=LOCAL_MODEL_NAME, outcome='default')
+        - before['default'],
+        'rate_limited': LLM_ERRORS.value(provider=provider, model=LOCAL_MODEL_NAME, error='LocalRateLimitError')
+        - before['429'],
+        'p50_s': float(np.percentile(latencies, 50)) if latencies else 0.0,
+        'p95_s': float(np.percentile(latencies, 95)) if latencies else 0.0,
+        'concurrency_limit': limiter_state.limit if limiter_state else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare call_llm throughput with and without the rate limiter")
+    parser.add_argument('--workers', type=int, default=32, help="Concurrent callers")
+    parser.add_argument('--rpm', type=float, default=300, help="Simulated provider requests per minute")
+    parser.add_argument('--latency-ms', type=float, default=200, help="Simulated model latency")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per run")
+    parser.add_argument('--mode', choices=['both', 'limiter', 'none'], default='both')
+    args = parser.parse_args()
+
+    os.environ['CRZ_LOCAL_LLM_RPM'] = str(args.rpm)
+    os.environ['CRZ_LOCAL_LLM_LATENCY_MS'] = str(args.latency_ms)
+    os.environ['CRZ_LOCAL_LLM_TPS'] = '0'
+    os.environ['CRZ_LOCAL_LLM_PREFILL_TPS'] = '0'
+    os.environ[f'CRZ_LLM_RPM_{ModelProvider.LOCAL.value.upper()}'] = str(args.rpm)
+
+    modes = {'both': [False, True], 'limiter': [True], 'none': [False]}[args.mode]
+    print(f"{args.workers} workers, provider ceiling {args.rpm:g} rpm ({args.rpm / 60:.1f}/s), "
+          f"{args.duration:g}s per run\n")
+    print(f"{'limiter':>8} {'answered/s':>11} {'defaults':>9} {'429s':>6} {'p50':>8} {'p95':>8} {'limit':>6}")
+    for limiter in modes:
+        result = run(args.workers, args.duration, limiter)
+        limit = f"{result['concurrency_limit']:.1f}" if result['concurrency_limit'] is not None else '-'
+        print(f"{'on' if limiter else 'off':>8} {result['answered_per_s']:>11.2f} {result['default_responses']:>9.0f} "
+              f"{result['rate_limited']:>6.0f} {result['p50_s']:>7.2f}s {result['p95_s']:>7.2f}s {limit:>6}")
+
+
+if __name__ == '__main__':
+    main()
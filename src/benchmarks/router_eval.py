@@ -0,0 +1,212 @@
+"""
+Hit rate and accuracy of the rule-based router on labeled questions
+
+Each labeled question names the function and the non-default parameters a
+correct answer uses, or None when the question should go to the LLM agents.
+Relative dates are resolved against REFERENCE_DATE.
+
+Usage:
+    python -m src.benchmarks.router_eval
+    python -m src.benchmarks.router_eval --threshold 0.8 --verbose
+"""
+
+import argparse
+import sys
+
+from src.workflow.router import ROUTER_CONFIDENCE_THRESHOLD, route_question
+
+REFERENCE_DATE = '2025-04-04'
+
+# (question, function or None, expected non-default parameters)
+LABELED_QUESTIONS = [
+    ("busiest entry points last week", "analyze_entry_point_volume",
+     {"start_date": "2025-03-29", "end_date": "2025-04-04"}),
+    ("Which entry points are the busiest during peak hours?", "analyze_entry_point_volume",
+     {"time_period": "Peak"}),
+    ("Top 5 crossings for buses in March", "analyze_entry_point_volume",
+     {"top_n": 5, "vehicle_class": "4", "start_date": "2025-03-01", "end_date": "2025-03-31"}),
+    ("Which bridges carry the most cars overnight?", "analyze_entry_point_volume",
+     {"vehicle_class": "1", "time_period": "Overnight"}),
+    ("What percentage of traffic comes through each entry point on weekends?", "analyze_entry_point_volume",
+     {"day_type": "weekend"}),
+    ("Which tunnels are busiest during the morning rush?", "analyze_entry_point_volume",
+     {"hour_range": [7, 10]}),
+    ("peak hours on weekends for trucks", "analyze_peak_periods",
+     {"day_type": "weekend", "vehicle_class": "2"}),
+    ("When is the busiest hour for traffic from Brooklyn?", "analyze_peak_periods",
+     {"entry_region": "Brooklyn"}),
+    ("Which day of the week is busiest at the Queensboro Bridge?", "analyze_peak_periods",
+     {"granularity": "day_of_week", "entry_point": "Queensboro Bridge"}),
+    ("What are the peak 10-minute blocks at the Lincoln Tunnel?", "analyze_peak_periods",
+     {"granularity": "10_minute", "entry_point": "Lincoln Tunnel"}),
+    ("What were the busiest days for taxis last month?", "analyze_peak_periods",
+     {"granularity": "date", "vehicle_class": "TLC Taxi/FHV", "start_date": "2025-03-01",
+      "end_date": "2025-03-31"}),
+    ("peak times on Mondays", "analyze_peak_periods", {"day_type": "Monday"}),
+    ("daily trend at Holland Tunnel", "analyze_time_trends", {"entry_point": "Holland Tunnel"}),
+    ("How has daily traffic through the Lincoln Tunnel changed over time?", "analyze_time_trends",
+     {"entry_point": "Lincoln Tunnel"}),
+    ("Show the weekly trend of taxi entries", "analyze_time_trends",
+     {"time_unit": "week", "vehicle_class": "TLC Taxi/FHV"}),
+    ("What is the total number of vehicles that entered the CRZ in the last 30 days?", "analyze_time_trends",
+     {"start_date": "2025-03-06", "end_date": "2025-04-04"}),
+    ("How many motorcycles entered from New Jersey this month?", "analyze_time_trends",
+     {"vehicle_class": "5", "entry_region": "New Jersey", "start_date": "2025-04-01", "end_date": "2025-04-04"}),
+    ("monthly traffic trend for multi-unit trucks", "analyze_time_trends",
+     {"time_unit": "month", "vehicle_class": "3"}),
+    ("How many vehicles came through the Williamsburg Bridge yesterday?", "analyze_time_trends",
+     {"entry_point": "Williamsburg Bridge", "start_date": "2025-04-04", "end_date": "2025-04-04"}),
+    ("hourly entries at the Brooklyn Bridge on weekdays", "analyze_time_trends",
+     {"time_unit": "hour", "entry_point": "Brooklyn Bridge", "day_type": "weekday"}),
+    ("Trend of excluded roadway entries over time", "analyze_excluded_roadway_usage", {}),
+    ("How many vehicles use the FDR Drive excluded roadway on weekends?", "analyze_excluded_roadway_usage",
+     {"day_type": "weekend"}),
+    ("excluded roadway usage by trucks overnight", "analyze_excluded_roadway_usage",
+     {"vehicle_class": "2", "time_period": "Overnight"}),
+    ("What share of entries are trucks on weekdays?", "analyze_vehicle_distribution", {"day_type": "weekday"}),
+    ("vehicle mix at the Holland Tunnel", "analyze_vehicle_distribution", {"entry_point": "Holland Tunnel"}),
+    ("What types of vehicles enter from Queens during peak hours?", "analyze_vehicle_distribution",
+     {"entry_region": "Queens", "time_period": "Peak"}),
+    ("breakdown by vehicle class between 7am and 10am", "analyze_vehicle_distribution",
+     {"hour_range": [7, 10]}),
+    ("Compare weekday and weekend traffic at the Holland Tunnel", "compare_traffic_segments",
+     {"dimension": "time", "segment_a": {"entry_point": "Holland Tunnel", "day_type": "weekday"},
+      "segment_b": {"entry_point": "Holland Tunnel", "day_type": "weekend"}}),
+    ("Compare the Lincoln Tunnel vs the Holland Tunnel", "compare_traffic_segments",
+     {"dimension": "location", "segment_a": {"entry_point": "Lincoln Tunnel"},
+      "segment_b": {"entry_point": "Holland Tunnel"}}),
+    ("cars versus taxis on weekdays", "compare_traffic_segments",
+     {"dimension": "vehicle", "segment_a": {"vehicle_class": "1", "day_type": "weekday"},
+      "segment_b": {"vehicle_class": "TLC Taxi/FHV", "day_type": "weekday"}}),
+    ("What is the difference between Brooklyn and Queens traffic?", "compare_traffic_segments",
+     {"dimension": "location", "segment_a": {"entry_region": "Brooklyn"},
+      "segment_b": {"entry_region": "Queens"}}),
+    ("How does Saturday compare to Sunday?", "compare_traffic_segments",
+     {"dimension": "time", "segment_a": {"day_type": "Saturday"}, "segment_b": {"day_type": "Sunday"}}),
+    ("How many vehicles entered on March 5?", "analyze_time_trends",
+     {"start_date": "2025-03-05", "end_date": "2025-03-05"}),
+    ("How many vehicles entered on 3/5/2025?", "analyze_time_trends",
+     {"start_date": "2025-03-05", "end_date": "2025-03-05"}),
+    ("How many vehicles on May 5?", "analyze_time_trends", {"start_date": "2024-05-05", "end_date": "2024-05-05"}),
+    ("total entries in 2024", "analyze_time_trends", {"start_date": "2024-01-01", "end_date": "2024-12-31"}),
+    ("Daily trend from March 3 to March 10", "analyze_time_trends",
+     {"start_date": "2025-03-03", "end_date": "2025-03-10"}),
+    ("How many cars since the 10th of March?", "analyze_time_trends",
+     {"vehicle_class": "1", "start_date": "2025-03-10"}),
+    # Several filters at once
+    ("Which crossings are busiest for taxis on weekdays during the morning rush?", "analyze_entry_point_volume",
+     {"vehicle_class": "TLC Taxi/FHV", "day_type": "weekday", "hour_range": [7, 10]}),
+    ("daily trend of cars from Brooklyn on weekends in March", "analyze_time_trends",
+     {"vehicle_class": "1", "entry_region": "Brooklyn", "day_type": "weekend",
+      "start_date": "2025-03-01", "end_date": "2025-03-31"}),
+    ("hourly entries of buses at the Lincoln Tunnel on weekdays last week", "analyze_time_trends",
+     {"time_unit": "hour", "vehicle_class": "4", "entry_point": "Lincoln Tunnel", "day_type": "weekday",
+      "start_date": "2025-03-29", "end_date": "2025-04-04"}),
+    ("vehicle mix from New Jersey on Saturdays overnight", "analyze_vehicle_distribution",
+     {"entry_region": "New Jersey", "day_type": "Saturday", "time_period": "Overnight"}),
+    # Questions the router should leave to the LLM
+    ("What is congestion pricing?", None, {}),
+    ("Why did traffic drop in February?", None, {}),
+    ("Will traffic increase next year?", None, {}),
+    ("How much revenue did the toll raise last month?", None, {}),
+    ("Summarize the dataset for me", None, {}),
+    ("Is the program working?", None, {}),
+    ("Compare this with last year", None, {}),
+    ("Tell me something interesting about traffic", None, {}),
+    # Dates the router cannot resolve, which would otherwise widen the answer's scope
+    ("How many vehicles entered last Friday?", None, {}),
+    ("How many vehicles entered in the last 0 days?", None, {}),
+    ("How many taxis entered 3 days ago?", None, {}),
+    ("How many vehicles entered last year?", None, {}),
+    # Filters the router recognizes but cannot apply
+    ("busiest entry points in Queens last week", None, {}),
+    ("Which entry point is busiest before 6am?", None, {}),
+    ("vehicle distribution for buses at night", None, {}),
+    ("weekly trend in January and February", None, {}),
+    ("daily trend at the Holland Tunnel overnight and during peak hours", None, {}),
+    ("How many taxis entered in the evening?", None, {}),
+    ("daily trend at the Lincoln Tunnel between 6am and 9am", None, {}),
+    # Negated filters, which would otherwise be read as the opposite filter
+    ("Show the daily trend excluding trucks", None, {}),
+    ("Daily trend at the Holland Tunnel except on weekends", None, {}),
+    ("How many cars did not use the Holland Tunnel?", None, {}),
+    ("busiest entry points not counting taxis", None, {}),
+    ("vehicle mix without the Lincoln Tunnel", None, {}),
+    ("peak hours for traffic that doesn't come from New Jersey", None, {}),
+]
+
+
+def params_match(params, expected: dict) -> bool:
+    """Routed parameters equal the expected ones, with no extra non-default parameters"""
+    return params.model_dump(exclude_defaults=True) == expected
+
+
+def evaluate(threshold: float = ROUTER_CONFIDENCE_THRESHOLD, questions=None) -> dict:
+    """
+    Route every labeled question and score the decisions
+
+    Returns:
+        Dictionary with counts, rates and the list of mistakes
+    """
+    questions = questions or LABELED_QUESTIONS
+    counts = {'routable': 0, 'routed': 0, 'correct': 0, 'wrong_function': 0, 'wrong_params': 0,
+              'out_of_scope': 0, 'out_of_scope_routed': 0}
+    mistakes = []
+    for question, function_name, expected in questions:
+        decision = route_question(question, reference_date=REFERENCE_DATE)
+        routed = decision.params is not None and decision.confidence >= threshold
+        if function_name is None:
+            counts['out_of_scope'] += 1
+            if routed:
+                counts['out_of_scope_routed'] += 1
+                mistakes.append((question, 'should fall back', decision))
+            continue
+        counts['routable'] += 1
+        if not routed:
+            mistakes.append((question, 'fell back', decision))
+            continue
+        counts['routed'] += 1
+        if decision.function_name != function_name:
+            counts['wrong_function'] += 1
+            mistakes.append((question, f'expected {function_name}', decision))
+        elif not params_match(decision.params, expected):
+            counts['wrong_params'] += 1
+            mistakes.append((question, f'expected {expected}', decision))
+        else:
+            counts['correct'] += 1
+
+    routed_total = counts['routed'] + counts['out_of_scope_routed']
+    return {
+        **counts,
+        'hit_rate': counts['routed'] / counts['routable'] if counts['routable'] else 0.0,
+        'accuracy': counts['correct'] / routed_total if routed_total else 0.0,
+        'mistakes': mistakes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the rule-based router on labeled questions")
+    parser.add_argument('--threshold', type=float, default=ROUTER_CONFIDENCE_THRESHOLD)
+    parser.add_argument('--min-accuracy', type=float, default=0.95,
+                        help="Exit with status 1 below this accuracy on routed questions, or when a question "
+                             "labeled for the LLM is routed")
+    parser.add_argument('--verbose', action='store_true', help="Show the reasons behind each mistake")
+    args = parser.parse_args()
+
+    result = evaluate(args.threshold)
+    print(f"Routable questions routed (hit rate): {result['routed']}/{result['routable']} = {result['hit_rate']:.1%}")
+    print(f"Correct among routed (accuracy):      {result['correct']}/{result['routed'] + result['out_of_scope_routed']}"
+          f" = {result['accuracy']:.1%}")
+    print(f"  wrong function: {result['wrong_function']}, wrong parameters: {result['wrong_params']}, "
+          f"out-of-scope routed: {result['out_of_scope_routed']}/{result['out_of_scope']}")
+    for question, problem, decision in result['mistakes']:
+        params = decision.params.model_dump(exclude_defaults=True) if decision.params else None
+        print(f"\n- {question}\n  {problem}; got {decision.function_name} {params} ({decision.confidence:.2f})")
+        if args.verbose:
+            print(f"  reasons: {'; '.join(decision.reasons)}")
+    if result['accuracy'] < args.min_accuracy or result['out_of_scope_routed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Benchmarks for data loading, filter_crz_data and the analyze_* tools on synthetic data
+
+Usage:
+    python -m src.benchmarks.tool_benchmarks --rows 100000 1000000 --output bench.json
+    python -m src.benchmarks.tool_benchmarks --rows 1000000 --baseline bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from src.utils.data_loader import load_and_process_data, process_data
+from src.utils.process_stats import RSSSampler
+from src.utils.synthetic_data import generate_crz_data, write_crz_csv
+from src.workflow.other_tools import execute_crz_batch, execute_crz_function, get_params_model
+
+# (function name, parameters) mixes typical of the questions the agents send
+TOOL_CASES = [
+    ("filter_crz_data", {"day_type": "weekday", "vehicle_class": "1"}),
+    ("filter_crz_data", {"entry_region": "Brooklyn", "hour_range": [7, 10]}),
+    ("analyze_entry_point_volume", {}),
+    ("analyze_entry_point_volume", {"day_type": "weekday", "time_period": "Peak", "include_excluded_roadways": True}),
+    ("analyze_peak_periods", {"granularity": "hour"}),
+    ("analyze_peak_periods", {"granularity": "10_minute", "entry_region": "New Jersey"}),
+    ("analyze_peak_periods", {"granularity": "date", "vehicle_class": "2"}),
+    ("analyze_vehicle_distribution", {"hour_range": [7, 10]}),
+    ("analyze_vehicle_distribution", {"day_type": "weekday", "compare_with": {"day_type": "weekend"}}),
+    ("analyze_time_trends", {"time_unit": "day"}),
+    ("analyze_time_trends", {"time_unit": "week", "vehicle_class": "2", "entry_point": "Lincoln Tunnel"}),
+    ("analyze_time_trends", {"time_unit": "hour", "day_type": "weekend"}),
+    ("analyze_excluded_roadway_usage", {"day_type": "weekday"}),
+    ("compare_traffic_segments", {"dimension": "time", "segment_a": {"day_type": "weekday"},
+                                  "segment_b": {"day_type": "weekend"}}),
+    ("compare_traffic_segments", {"dimension": "location", "segment_a": {"entry_point": "Holland Tunnel"},
+                                  "segment_b": {"entry_point": "Lincoln Tunnel"}}),
+    ("compare_traffic_segments", {"dimension": "vehicle", "segment_a": {"vehicle_class": "1"},
+                                  "segment_b": {"vehicle_class": "TLC Taxi/FHV"}}),
+]
+
+# Loading parses every timestamp; above this size it dominates the run time
+DEFAULT_LOAD_MAX_ROWS = 5_000_000
+
+
+def case_name(function_name: str, params: dict) -> str:
+    """Stable, readable identifier for a benchmark case"""
+    if not params:
+        return function_name
+    return f"{function_name}[{json.dumps(params, sort_keys=True, separators=(',', ':'))}]"
+
+
+def measure(func, repeat: int) -> dict:
+    """
+    Run func repeat times and record wall time and peak resident memory
+
+    Returns:
+        Dictionary with the wall times of every run, their min/median/max and
+        the peak RSS seen while running
+    """
+    times = []
+    with RSSSampler(interval=0.01) as sampler:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+    return {
+        'wall_times_s': times,
+        'min_s': min(times),
+        'median_s': statistics.median(times),
+        'max_s': max(times),
+        'peak_rss_bytes': sampler.peak,
+    }
+
+
+def run_benchmarks(row_counts, repeat: int = 3, load_max_rows: int = DEFAULT_LOAD_MAX_ROWS,
+                   seed: int = 0, cases=None) -> list:
+    """
+    Time loading and every tool case on synthetic datasets of the given sizes
+
+    Args:
+        row_counts: Dataset sizes to benchmark
+        repeat: Runs per case; the median is reported as the headline number
+        load_max_rows: Skip the CSV load benchmark above this size
+        seed: Seed for the synthetic data
+        cases: (function name, parameters) pairs (default: TOOL_CASES)
+
+    Returns:
+        List of result records, one per (size, case)
+    """
+    cases = cases or TOOL_CASES
+    results = []
+
+    def record(rows, name, stats):
+        stats.update({
+            'rows': rows,
+            'case': name,
+            'rows_per_s': rows / stats['median_s'] if stats['median_s'] > 0 else None,
+        })
+        results.append(stats)
+        print(f"{rows:>12,} rows  {name:<60.60} {stats['median_s'] * 1000:10.1f} ms  "
+              f"{stats['peak_rss_bytes'] / 2**20:8.0f} MiB")
+
+    for rows in row_counts:
+        if rows <= load_max_rows:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                csv_path = os.path.join(tmp_dir, 'crz.csv')
+                write_crz_csv(csv_path, rows, seed=seed)
+                record(rows, 'load_and_process_data', measure(lambda: load_and_process_data(csv_path), repeat))
+
+        raw_df = generate_crz_data(rows, seed=seed)
+        record(rows, 'process_data', measure(lambda: process_data(raw_df.copy()), 1))
+        df, _ = process_data(raw_df)
+        del raw_df
+
+        for function_name, params in cases:
+            model = get_params_model(function_name)(**params)
+            record(rows, case_name(function_name, params),
+                   measure(lambda: execute_crz_function(function_name, model, df), repeat))
+
+        record(rows, 'execute_crz_batch[all cases]',
+               measure(lambda: execute_crz_batch(cases, df), repeat))
+        del df
+
+    return results
+
+
+def environment_info() -> dict:
+    """Versions and machine details stored with every result file"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'git_commit': commit,
+        'python': sys.version.split()[0],
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare_results(current: list, baseline: list, threshold: float) -> list:
+    """
+    Find cases whose median time grew by more than threshold (e.g. 0.2 = 20%)
+
+    Returns:
+        List of (rows, case, baseline seconds, current seconds) regressions
+    """
+    previous = {(item['rows'], item['case']): item['median_s'] for item in baseline}
+    regressions = []
+    for item in current:
+        before = previous.get((item['rows'], item['case']))
+        if before and item['median_s'] > before * (1 + threshold):
+            regressions.append((item['rows'], item['case'], before, item['median_s']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CRZ analysis tools on synthetic data")
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000],
+                        help="Dataset sizes, e.g. 100000 1000000 10000000 100000000")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--load-max-rows', type=int, default=DEFAULT_LOAD_MAX_ROWS,
+                        help="Largest size for which CSV loading is benchmarked")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    parser.add_argument('--baseline', help="JSON results of a previous run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Relative slowdown reported as a regression (default: 0.2)")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.rows, repeat=args.repeat, load_max_rows=args.load_max_rows, seed=args.seed)
+    report = {'environment': environment_info(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare_results(results, baseline, args.threshold)
+        for rows, name, before, after in regressions:
+            print(f"REGRESSION {rows:,} rows {name}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms")
+        if regressions:
+            sys.exit(1)
+        print("No regressions")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,48 @@
 """Helper functions for LLM"""
 
+import contextvars
 import json
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import TypeVar, Type, Optional, Any
 from pydantic import BaseModel
-from src.llm.models import get_model, get_model_info
+from src.llm.models import AVAILABLE_MODELS, get_model, get_model_info
+from src.llm.rate_limiter import is_rate_limit_error, limited
+from src.utils.deadline import DeadlineExceeded, deadline, deadline_at
+from src.utils.metrics import REGISTRY
+from src.utils.tracing import set_attribute, trace_span
 
 T = TypeVar('T', bound=BaseModel)
 
+LLM_LATENCY = REGISTRY.histogram('crz_llm_request_latency_seconds', 'Latency of each LLM attempt',
+                                 ['provider', 'model'])
+LLM_ERRORS = REGISTRY.counter('crz_llm_errors_total', 'Failed LLM attempts by provider, model and error type',
+                              ['provider', 'model', 'error'])
+LLM_CALLS = REGISTRY.counter('crz_llm_calls_total', 'call_llm results by provider and outcome (ok or default)',
+                             ['provider', 'model', 'outcome'])
+LLM_HEDGES = REGISTRY.counter('crz_llm_hedges_total', 'Hedged requests by model and outcome (fired or won)',
+                              ['model', 'outcome'])
+
+# Exponential backoff between attempts, with full jitter
+BACKOFF_BASE_S = float(os.getenv("CRZ_LLM_BACKOFF_BASE", "0.5"))
+BACKOFF_CAP_S = float(os.getenv("CRZ_LLM_BACKOFF_CAP", "8"))
+# Seconds before a hedged request is sent to the alternative model; unset disables hedging
+HEDGE_AFTER_S = float(os.environ["CRZ_LLM_HEDGE_AFTER"]) if os.getenv("CRZ_LLM_HEDGE_AFTER") else None
+# Retries after a 429, on top of max_retries, and their longer backoff cap
+RATE_LIMIT_RETRIES = int(os.getenv("CRZ_LLM_RATE_LIMIT_RETRIES", "6"))
+RATE_LIMIT_BACKOFF_CAP_S = float(os.getenv("CRZ_LLM_RATE_LIMIT_BACKOFF_CAP", "30"))
+
+# Requests run here when they have a deadline or may be hedged, so the caller can stop waiting.
+# A request that is given up on keeps its thread until the provider answers.
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("CRZ_LLM_THREADS", "32")), thread_name_prefix="llm")
+
+
+class NoJSONError(ValueError):
+    """A model without JSON mode answered without a JSON block"""
+
+
 def call_llm(
     prompt: Any,
     model_name: str,
@@ -14,11 +50,20 @@ def call_llm(
     pydantic_model: Type[T],
     agent_name: Optional[str] = None,
     max_retries: int = 3,
-    default_factory = None
+    default_factory = None,
+    timeout: Optional[float] = None,
+    hedge_after: Optional[float] = None,
+    hedge_model: Optional[str] = None,
 ) -> T:
     """
     Makes an LLM call with retry logic, handling both Deepseek and non-Deepseek models.
     
+    Requests wait their turn in the provider's rate limiter (src.llm.rate_limiter).
+    Retries back off exponentially with jitter, and rate-limited (429) attempts
+    are retried up to RATE_LIMIT_RETRIES extra times. The call gives up when its
+    timeout or the caller's deadline (see src.utils.deadline) runs out, and
+    returns the default response like any other failure.
+    
     Args:
         prompt: The prompt to send to the LLM
         model_name: Name of the model to use
@@ -27,46 +72,236 @@ def call_llm(
         agent_name: Optional name of the agent for progress updates
         max_retries: Maximum number of retries (default: 3)
         default_factory: Optional factory function to create default response on failure
+        timeout: Optional seconds for the whole call, on top of any enclosing deadline
+        hedge_after: Seconds after which an attempt also asks hedge_model, keeping the first
+            valid result (default: CRZ_LLM_HEDGE_AFTER, unset disables hedging)
+        hedge_model: Model for hedged requests (default: see pick_hedge_model)
         
     Returns:
         An instance of the specified Pydantic model
     """
     
+    provider = getattr(model_provider, "value", model_provider)
+    hedge_after = HEDGE_AFTER_S if hedge_after is None else hedge_after
+    request = structured_request(model_name, model_provider, pydantic_model)
+    # Built when a hedge first fires, so a hedge model that cannot be set up only disables hedging
+    hedge = None
+    if hedge_after is not None:
+        hedge = lazy_hedge_request(model_name, model_provider, pydantic_model, hedge_model)
+    
+    with trace_span("call_llm",
+                    model=model_name,
+                    provider=provider,
+                    schema=pydantic_model.__name__,
+                    prompt_chars=len(str(prompt))) as call_span, deadline(timeout):
+        finish_by = deadline_at()
+        if finish_by is not None:
+            call_span.set_attribute("budget_s", round(finish_by - time.monotonic(), 3))
+        # Call the LLM with retries; 429s back off without using up max_retries
+        failures = rate_limited = 0
+        while True:
+            call_span.set_attribute("retry_count", failures + rate_limited)
+            try:
+                with trace_span("llm_attempt", attempt=failures + rate_limited + 1):
+                    result = run_attempt(request, hedge, prompt, finish_by, hedge_after)
+                LLM_CALLS.inc(provider=provider, model=model_name, outcome="ok")
+                return result
+            except Exception as e:
+                error = "NoJSON" if isinstance(e, NoJSONError) else type(e).__name__
+                LLM_ERRORS.inc(provider=provider, model=model_name, error=error)
+                if isinstance(e, DeadlineExceeded):
+                    call_span.set_attribute("deadline_exceeded", True)
+                    print(f"LLM call ran out of time after {failures + rate_limited + 1} attempts: {e}")
+                    break
+                if is_rate_limit_error(e) and rate_limited < RATE_LIMIT_RETRIES:
+                    rate_limited += 1
+                    call_span.set_attribute("rate_limited", rate_limited)
+                    delay = backoff_delay(rate_limited, cap=RATE_LIMIT_BACKOFF_CAP_S)
+                else:
+                    failures += 1
+                    if failures == max_retries:
+                        print(f"Error in LLM call after {max_retries} attempts: {e}")
+                        break
+                    delay = backoff_delay(failures - 1)
+                if finish_by is not None and time.monotonic() + delay >= finish_by:
+                    call_span.set_attribute("deadline_exceeded", True)
+                    print(f"Error in LLM call, no time left to retry: {e}")
+                    break
+                time.sleep(delay)
+
+        call_span.set_attribute("default_response", True)
+        LLM_CALLS.inc(provider=provider, model=model_name, outcome="default")
+        # Use default_factory if provided, otherwise create a basic default
+        if default_factory:
+            return default_factory()
+        return create_default_response(pydantic_model)
+
+def structured_request(model_name: str, model_provider: str, pydantic_model: Type[T], hedge: bool = False):
+    """
+    Build a function that sends one prompt to a model and returns the parsed result
+    
+    Models with JSON mode use structured output; for the others the JSON block is
+    extracted from the response text. Invalid or empty output raises.
+    """
     model_info = get_model_info(model_name)
     llm = get_model(model_name, model_provider)
+    json_mode = not (model_info and not model_info.has_json_mode())
     
     # For non-JSON support models, we can use structured output
-    if not (model_info and not model_info.has_json_mode()):
+    if json_mode:
         llm = llm.with_structured_output(
             pydantic_model,
             method="json_mode",
+            include_raw=True,
         )
-    
-    # Call the LLM with retries
-    for attempt in range(max_retries):
-        try:
-            # Call the LLM
-            result = llm.invoke(prompt)
+    provider = getattr(model_provider, "value", model_provider)
+
+    def send(prompt: Any) -> T:
+        with trace_span("llm_request", model=model_name, hedge=hedge) as span:
+            with limited(provider, prompt) as permit:
+                started = time.perf_counter()
+                try:
+                    result = llm.invoke(prompt)
+                finally:
+                    LLM_LATENCY.observe(time.perf_counter() - started, provider=provider, model=model_name)
+                permit.used(total_tokens(result if not json_mode else result["raw"]))
             
             # For non-JSON support models, we need to extract and parse the JSON manually
-            if model_info and not model_info.has_json_mode():
+            if not json_mode:
+                record_usage(span, result)
                 parsed_result = extract_json_from_deepseek_response(result.content)
-                if parsed_result:
-                    return pydantic_model(**parsed_result)
-            else:
-                return result
-                
-        except Exception as e:
-            
-            if attempt == max_retries - 1:
-                print(f"Error in LLM call after {max_retries} attempts: {e}")
-                # Use default_factory if provided, otherwise create a basic default
-                if default_factory:
-                    return default_factory()
-                return create_default_response(pydantic_model)
-
-    # This should never be reached due to the retry logic above
-    return create_default_response(pydantic_model)
+                if not parsed_result:
+                    raise NoJSONError("The model response contained no JSON")
+                return pydantic_model(**parsed_result)
+            record_usage(span, result["raw"])
+            if result.get("parsing_error") is not None:
+                raise result["parsing_error"]
+            if result["parsed"] is None:
+                raise ValueError("The model returned no structured output")
+            return result["parsed"]
+
+    send.model_name = model_name
+    return send
+
+def lazy_hedge_request(model_name: str, model_provider: str, pydantic_model: Type[T],
+                       hedge_model: Optional[str] = None):
+    """
+    Build a function returning the hedged request of a call, set up on first use
+    
+    Returns None, after logging why, when the hedge model cannot be set up
+    (e.g. its provider's API key is missing), so the call goes on without hedging.
+    """
+    built = []
+
+    def build():
+        if not built:
+            hedge_name = hedge_model
+            try:
+                hedge_name, hedge_provider = pick_hedge_model(model_name, model_provider, hedge_model)
+                built.append(structured_request(hedge_name, hedge_provider, pydantic_model, hedge=True))
+            except Exception as e:
+                print(f"Hedging disabled for this call, could not set up {hedge_name or 'the hedge model'}: {e}")
+                set_attribute("hedge_error", type(e).__name__)
+                built.append(None)
+        return built[0]
+
+    return build
+
+def run_attempt(primary, hedge, prompt: Any, finish_by: Optional[float], hedge_after: Optional[float]):
+    """
+    Run one attempt: the primary request, plus the hedged one if the primary is slow
+    
+    hedge is a function returning the hedged request (see lazy_hedge_request), or None
+    without hedging. Without a deadline or hedging the request runs in the calling
+    thread. Otherwise requests run in worker threads with a copy of the caller's
+    context, so trace spans and deadlines carry over, and the first valid result wins.
+    A failed request leaves the other one to finish; the attempt fails when both have.
+    """
+    if finish_by is None and hedge is None:
+        return primary(prompt)
+
+    started = time.monotonic()
+    pending = {_executor.submit(contextvars.copy_context().run, primary, prompt): primary}
+    hedged = hedge is None
+    error = None
+    while pending:
+        now = time.monotonic()
+        wait_for = None if finish_by is None else finish_by - now
+        if wait_for is not None and wait_for <= 0:
+            raise DeadlineExceeded(f"no response within the deadline from {', '.join(r.model_name for r in pending.values())}")
+        if not hedged:
+            until_hedge = hedge_after - (now - started)
+            if until_hedge <= 0:
+                hedged = True
+                request = hedge()
+                if request is not None:
+                    pending[_executor.submit(contextvars.copy_context().run, request, prompt)] = request
+                    LLM_HEDGES.inc(model=request.model_name, outcome="fired")
+                    set_attribute("hedged", True)
+                continue
+            wait_for = until_hedge if wait_for is None else min(wait_for, until_hedge)
+
+        done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for future in done:
+            request = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                error = e
+                continue
+            if request is not primary:
+                LLM_HEDGES.inc(model=request.model_name, outcome="won")
+            set_attribute("answered_by", request.model_name)
+            return result
+        if error is not None and not pending:
+            raise error
+    raise error
+
+def pick_hedge_model(model_name: str, model_provider: str, hedge_model: Optional[str] = None) -> tuple:
+    """
+    Model for hedged requests: hedge_model or CRZ_LLM_HEDGE_MODEL when set, otherwise
+    another model from the same provider (preferring a lighter variant such as
+    gemini-2.0-flash-lite for gemini-2.0-flash), otherwise the same model again
+    """
+    hedge_model = hedge_model or os.getenv("CRZ_LLM_HEDGE_MODEL")
+    if hedge_model:
+        info = get_model_info(hedge_model)
+        return hedge_model, info.provider if info else model_provider
+    alternatives = [model for model in AVAILABLE_MODELS
+                    if model.provider == model_provider and model.model_name != model_name]
+    alternatives.sort(key=lambda model: not model.model_name.startswith(model_name))
+    if alternatives:
+        return alternatives[0].model_name, alternatives[0].provider
+    return model_name, model_provider
+
+def backoff_delay(attempt: int, cap: float = BACKOFF_CAP_S) -> float:
+    """Seconds to wait after a failed attempt: full jitter over an exponentially growing cap"""
+    return random.uniform(0, min(cap, BACKOFF_BASE_S * 2 ** attempt))
+
+def total_tokens(message: Any) -> Optional[int]:
+    """Prompt plus response tokens of a raw LLM message, if it reports usage"""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return None
+    return usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+
+def record_usage(span, message: Any):
+    """Record token counts and response size of a raw LLM message on a trace span"""
+    usage = getattr(message, "usage_metadata", None) or {}
+    if usage:
+        span.set_attribute("prompt_tokens", usage.get("input_tokens", 0))
+        span.set_attribute("response_tokens", usage.get("output_tokens", 0))
+        # Roll the counts up to the enclosing call_llm span
+        parent = span.parent
+        while parent is not None:
+            parent.add("prompt_tokens", usage.get("input_tokens", 0))
+            parent.add("response_tokens", usage.get("output_tokens", 0))
+            if parent.name == "call_llm":
+                break
+            parent = parent.parent
+    content = getattr(message, "content", None)
+    if content is not None:
+        span.set_attribute("response_chars", len(str(content)))
 
 def create_default_response(model_class: Type[T]) -> T:
     """Creates a safe default response based on the model's fields."""
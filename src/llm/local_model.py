@@ -0,0 +1,375 @@
+"""
+Offline stand-in for the chat models, for benchmarks and load tests
+
+LocalChatModel answers the agents' structured-output calls without network
+access. Responses come from a cassette of recorded responses when one
+matches, and are otherwise synthesized deterministically from the question.
+Latency is simulated from the prompt and response token counts.
+
+Configure with the environment (or constructor arguments):
+
+    CRZ_LOCAL_LLM_CASSETTE=cassette.json   recorded responses to replay
+    CRZ_LOCAL_LLM_MODE=replay|record       record: call CRZ_LOCAL_LLM_RECORD_MODEL
+                                           and save its responses to the cassette
+    CRZ_LOCAL_LLM_RECORD_MODEL=gemini-2.0-flash
+    CRZ_LOCAL_LLM_LATENCY_MS=250           time to first token
+    CRZ_LOCAL_LLM_PREFILL_TPS=4000         prompt tokens processed per second
+    CRZ_LOCAL_LLM_TPS=150                  response tokens generated per second
+    CRZ_LOCAL_LLM_JITTER=0.1               +/- fraction of latency, seeded by the prompt
+    CRZ_LOCAL_LLM_RPM=0                    reject requests over this rate with a 429,
+                                           like a provider (0 for no limit)
+
+Set the latency settings to 0 for instant responses.
+"""
+
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+
+from pydantic import BaseModel, ValidationError
+
+from src.utils.crz_constants import DETECTION_GROUPS, DETECTION_REGIONS
+
+LOCAL_MODEL_NAME = "local-replay"
+
+# Rough characters per token of English text and JSON
+CHARS_PER_TOKEN = 4
+
+# Question keywords -> analysis function, checked in order
+FUNCTION_KEYWORDS = [
+    ("compare_traffic_segments", ("compare", " versus ", " vs ", "difference between")),
+    ("analyze_excluded_roadway_usage", ("excluded", "fdr", "west side highway")),
+    ("analyze_peak_periods", ("peak", "busiest", "rush hour", "highest traffic")),
+    ("analyze_vehicle_distribution", ("vehicle class", "vehicle type", "truck", "taxi", "bus", "motorcycle")),
+    ("analyze_entry_point_volume", ("entry point", "bridge", "tunnel", "which crossing")),
+    ("analyze_time_trends", ("trend", "over time", "daily", "weekly", "per day", "per week")),
+]
+DEFAULT_FUNCTION = "analyze_time_trends"
+
+# Placeholders for required parameters that have no default
+REQUIRED_PARAMETER_DEFAULTS = {
+    "dimension": "time",
+    "segment_a": {"day_type": "weekday"},
+    "segment_b": {"day_type": "weekend"},
+    "vehicle_class": "1",
+    "chart_type": "line",
+    "x_column": "Toll Date",
+    "y_column": "CRZ Entries",
+}
+
+# Where the agents' prompts quote the user's question (last, see src/workflow/prompts.py)
+QUESTION_PATTERNS = [
+    re.compile(r"\nUser query: (.*)\Z", re.S),
+]
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count of a text"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def prompt_text(prompt) -> str:
+    """Prompt as plain text, whether given as a string, a prompt value or messages"""
+    if isinstance(prompt, str):
+        return prompt
+    if hasattr(prompt, "to_string"):
+        return prompt.to_string()
+    if isinstance(prompt, (list, tuple)):
+        return "\n".join(str(getattr(message, "content", message)) for message in prompt)
+    return str(prompt)
+
+
+def extract_question(prompt: str) -> str | None:
+    """The user's question quoted in an agent prompt, if it can be found"""
+    for pattern in QUESTION_PATTERNS:
+        match = pattern.search(prompt)
+        if match and match.group(1).strip():
+            return " ".join(match.group(1).split())
+    return None
+
+
+def schema_key(schema: type) -> str:
+    """Cassette key of a response schema, e.g. 'FunctionParams.AnalyzeTimeTrendsParams'"""
+    return schema.__qualname__
+
+
+class LocalRateLimitError(Exception):
+    """Raised like a provider's HTTP 429 when requests exceed the simulated rate"""
+    status_code = 429
+
+
+class ProviderRateLimit:
+    """
+    Provider-side token bucket shared by all local models
+
+    Holds one second of requests and refills at requests_per_minute / 60 per
+    second, the way hosted providers enforce their limits.
+    """
+
+    def __init__(self):
+        self.level = None
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def admit(self, requests_per_minute: float):
+        rate = requests_per_minute / 60
+        capacity = max(1.0, rate)
+        now = time.monotonic()
+        with self.lock:
+            level = capacity if self.level is None else self.level + (now - self.updated) * rate
+            self.level = min(capacity, level)
+            self.updated = now
+            if self.level < 1:
+                raise LocalRateLimitError(f"429 Too Many Requests: over {requests_per_minute:g} requests per minute")
+            self.level -= 1
+
+
+_provider_rate_limit = ProviderRateLimit()
+
+
+class LocalMessage:
+    """Minimal chat message with the attributes call_llm reads"""
+
+    def __init__(self, content: str, input_tokens: int, output_tokens: int, model_name: str):
+        self.content = content
+        self.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        self.response_metadata = {"model_name": model_name}
+
+    def __repr__(self):
+        return f"LocalMessage(content={self.content!r})"
+
+
+class Cassette:
+    """
+    Recorded structured responses, stored as JSON
+
+    Entries are keyed by schema and question (or a hash of the whole prompt
+    when the question cannot be found), so recordings survive small prompt
+    template changes.
+    """
+
+    def __init__(self, path: str | None):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for entry in json.load(f)["responses"]:
+                    self.entries[(entry["schema"], entry["key"])] = entry
+
+    @staticmethod
+    def entry_key(prompt: str) -> str:
+        question = extract_question(prompt)
+        if question is not None:
+            return question.lower()
+        return "sha256:" + hashlib.sha256(prompt.encode()).hexdigest()
+
+    def lookup(self, schema: type, prompt: str) -> dict | None:
+        entry = self.entries.get((schema_key(schema), self.entry_key(prompt)))
+        return entry["response"] if entry else None
+
+    def record(self, schema: type, prompt: str, response: dict):
+        """Add or replace a response and rewrite the cassette file"""
+        entry = {
+            "schema": schema_key(schema),
+            "key": self.entry_key(prompt),
+            "response": response,
+        }
+        with self._lock:
+            self.entries[(entry["schema"], entry["key"])] = entry
+            if not self.path:
+                return
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".json")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"responses": list(self.entries.values())}, f, indent=2, default=str)
+            os.replace(tmp_path, self.path)
+
+
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(path: str | None) -> Cassette:
+    """Cassette for a path, loaded once per process"""
+    with _cassettes_lock:
+        if path not in _cassettes:
+            _cassettes[path] = Cassette(path)
+        return _cassettes[path]
+
+
+def choose_function(question: str) -> str:
+    """Analysis function for a question by keyword, for synthesized FindFunction responses"""
+    text = f" {question.lower()} "
+    for function_name, keywords in FUNCTION_KEYWORDS:
+        if any(keyword in text for keyword in keywords):
+            return function_name
+    return DEFAULT_FUNCTION
+
+
+def question_filters(question: str) -> dict:
+    """Filters plainly named in a question (day type, crossing, region)"""
+    text = question.lower()
+    filters = {}
+    if "weekend" in text:
+        filters["day_type"] = "weekend"
+    elif "weekday" in text:
+        filters["day_type"] = "weekday"
+    for group in DETECTION_GROUPS:
+        if group.lower() in text:
+            filters["entry_point"] = group
+            break
+    else:
+        for region in DETECTION_REGIONS:
+            if region.lower() in text:
+                filters["entry_region"] = region
+                break
+    return filters
+
+
+def synthesize_response(schema: type, prompt: str) -> dict:
+    """Deterministic response for a schema when the cassette has none"""
+    question = extract_question(prompt) or "the question"
+    name = schema_key(schema)
+    if name == "Reception":
+        return {
+            "response": "Retrieving the data needed to answer this question.",
+            "retrieve_data": True,
+            "data_description": f"CRZ entry counts needed to answer: {question}",
+        }
+    if name == "FindFunction":
+        function_name = choose_function(question)
+        return {
+            "response": f"Using {function_name} to retrieve the data.",
+            "data_available": True,
+            "function_name": function_name,
+        }
+    if name == "FinalAnswer":
+        data = prompt.split("retrieved the following data:", 1)[-1].strip()
+        return {"response": f"Answer to '{question}' based on the retrieved data: {data[:300]}"}
+
+    response = {}
+    fields = schema.model_fields
+    for field_name, value in question_filters(question).items():
+        if field_name in fields:
+            response[field_name] = value
+    for field_name, field in fields.items():
+        if field.is_required() and field_name not in response:
+            response[field_name] = REQUIRED_PARAMETER_DEFAULTS.get(field_name, "")
+    return response
+
+
+class LocalStructuredModel:
+    """Result of LocalChatModel.with_structured_output"""
+
+    def __init__(self, model: "LocalChatModel", schema: type, include_raw: bool):
+        self.model = model
+        self.schema = schema
+        self.include_raw = include_raw
+
+    def invoke(self, prompt):
+        text = prompt_text(prompt)
+        if self.model.mode == "record":
+            result = self.model.record_structured(self.schema, prompt)
+        else:
+            response = self.model.cassette.lookup(self.schema, text)
+            if response is None:
+                response = synthesize_response(self.schema, text)
+            raw = self.model.respond(text, json.dumps(response))
+            try:
+                result = {"raw": raw, "parsed": self.schema(**response), "parsing_error": None}
+            except ValidationError as e:
+                result = {"raw": raw, "parsed": None, "parsing_error": e}
+        if self.include_raw:
+            return result
+        if result["parsing_error"] is not None:
+            raise result["parsing_error"]
+        return result["parsed"]
+
+
+class LocalChatModel:
+    """
+    Deterministic chat model with the interface call_llm uses
+
+    Supports invoke() and with_structured_output(schema, method=..., include_raw=...).
+    """
+
+    def __init__(self, model_name: str = LOCAL_MODEL_NAME, cassette: str | None = None, mode: str | None = None,
+                 record_model: str | None = None, latency_ms: float | None = None,
+                 prefill_tps: float | None = None, tokens_per_second: float | None = None,
+                 jitter: float | None = None, requests_per_minute: float | None = None):
+        self.model_name = model_name
+        self.cassette = get_cassette(cassette if cassette is not None else os.getenv("CRZ_LOCAL_LLM_CASSETTE"))
+        self.mode = mode or os.getenv("CRZ_LOCAL_LLM_MODE", "replay")
+        if self.mode not in ("replay", "record"):
+            raise ValueError(f"Unsupported local model mode: {self.mode}")
+        self.record_model = record_model or os.getenv("CRZ_LOCAL_LLM_RECORD_MODEL", "gemini-2.0-flash")
+        self.latency_ms = latency_ms if latency_ms is not None else _env_float("CRZ_LOCAL_LLM_LATENCY_MS", 250)
+        self.prefill_tps = prefill_tps if prefill_tps is not None else _env_float("CRZ_LOCAL_LLM_PREFILL_TPS", 4000)
+        self.tokens_per_second = (tokens_per_second if tokens_per_second is not None
+                                  else _env_float("CRZ_LOCAL_LLM_TPS", 150))
+        self.jitter = jitter if jitter is not None else _env_float("CRZ_LOCAL_LLM_JITTER", 0.1)
+        self.requests_per_minute = (requests_per_minute if requests_per_minute is not None
+                                    else _env_float("CRZ_LOCAL_LLM_RPM", 0))
+
+    def simulated_latency(self, prompt: str, input_tokens: int, output_tokens: int) -> float:
+        """Seconds a hosted model would take for these token counts"""
+        seconds = self.latency_ms / 1000
+        if self.prefill_tps > 0:
+            seconds += input_tokens / self.prefill_tps
+        if self.tokens_per_second > 0:
+            seconds += output_tokens / self.tokens_per_second
+        if self.jitter > 0:
+            # Seeded by the prompt, so a replayed run has the same timings
+            rng = random.Random(hashlib.sha256(prompt.encode()).digest())
+            seconds *= 1 + rng.uniform(-self.jitter, self.jitter)
+        return seconds
+
+    def respond(self, prompt: str, content: str) -> LocalMessage:
+        """Wait out the simulated latency and return the message"""
+        if self.requests_per_minute > 0:
+            _provider_rate_limit.admit(self.requests_per_minute)
+        input_tokens, output_tokens = count_tokens(prompt), count_tokens(content)
+        delay = self.simulated_latency(prompt, input_tokens, output_tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return LocalMessage(content, input_tokens, output_tokens, self.model_name)
+
+    def record_structured(self, schema: type, prompt) -> dict:
+        """Call the recording model and save its parsed response to the cassette"""
+        from src.llm.models import get_model, get_model_info
+
+        model_info = get_model_info(self.record_model)
+        if model_info is None:
+            raise ValueError(f"Unknown recording model: {self.record_model}")
+        llm = get_model(model_info.model_name, model_info.provider)
+        result = llm.with_structured_output(schema, method="json_mode", include_raw=True).invoke(prompt)
+        if result.get("parsed") is not None:
+            self.cassette.record(schema, prompt_text(prompt), result["parsed"].model_dump())
+        return result
+
+    def with_structured_output(self, schema: type, method: str | None = None, include_raw: bool = False,
+                               **kwargs) -> LocalStructuredModel:
+        if not (isinstance(schema, type) and issubclass(schema, BaseModel)):
+            raise TypeError("LocalChatModel only supports Pydantic schemas")
+        return LocalStructuredModel(self, schema, include_raw)
+
+    def invoke(self, prompt) -> LocalMessage:
+        text = prompt_text(prompt)
+        question = extract_question(text) or "the question"
+        return self.respond(text, f"This is a local response to {question}.")
@@ -0,0 +1,282 @@
+"""
+Per-stage model selection with latency and cost targets
+
+Each agent stage names its models in order of preference, a latency SLO
+(90th percentile of recent calls, in seconds) and an optional cost ceiling
+per call. A stage uses the first of its models that fits the cost ceiling
+and whose recent latency meets the SLO, so a slow preferred model is
+automatically replaced by a lighter one such as gemini-2.0-flash-lite.
+Models are tried in list order, not by price: list the cheaper model first
+to prefer it whenever it meets the SLO.
+
+Latencies older than LATENCY_MAX_AGE_S are forgotten. One call in
+PROBE_EVERY still goes to the preferred model, and a probe that meets the
+SLO clears that model's slow samples, so the stage moves back as soon as
+the preferred model is fast again.
+
+Override the defaults with a JSON file in CRZ_MODEL_POLICY:
+
+    {"final_answer": {"models": ["gemini-2.0-flash", "gemini-2.0-flash-lite"],
+                      "latency_slo_s": 6, "max_cost_usd": 0.001}}
+
+CRZ_LLM_MODEL / CRZ_LLM_PROVIDER pin every stage to one model instead.
+
+Report observed latency and cost per stage and model from a trace file:
+
+    python -m src.llm.model_policy traces.jsonl
+"""
+
+import argparse
+import collections
+import json
+import os
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+from pydantic import BaseModel
+
+from src.llm.api_call import call_llm
+from src.llm.models import LLMModel, ModelProvider, get_model_info
+from src.llm.rate_limiter import CHARS_PER_TOKEN, RESPONSE_TOKEN_ESTIMATE
+from src.utils.metrics import REGISTRY
+from src.utils.tracing import trace_span
+
+DEFAULT_MODEL_NAME = "gemini-2.0-flash"
+
+# Recent calls per stage and model that the latency percentile is taken over
+LATENCY_WINDOW = 50
+# Calls older than this no longer count, in seconds
+LATENCY_MAX_AGE_S = float(os.getenv("CRZ_LLM_LATENCY_MAX_AGE", "300"))
+# Calls needed before a model's latency counts against the SLO
+MIN_SAMPLES = 5
+# Every PROBE_EVERY-th call of a downgraded stage goes to its preferred model
+PROBE_EVERY = 20
+
+STAGE_LATENCY = REGISTRY.histogram('crz_llm_stage_latency_seconds', 'call_llm latency by agent stage and model',
+                                   ['stage', 'model'])
+STAGE_COST = REGISTRY.counter('crz_llm_stage_cost_usd_total', 'Estimated LLM spend by agent stage and model',
+                              ['stage', 'model'])
+STAGE_DOWNGRADES = REGISTRY.counter('crz_llm_stage_downgrades_total',
+                                    'Stage calls sent to a lighter model than preferred', ['stage', 'model'])
+
+
+class StagePolicy(BaseModel):
+    """Models for one agent stage, preferred first, and its targets"""
+    models: List[str]
+    latency_slo_s: float
+    max_cost_usd: Optional[float] = None
+
+
+# The reception step is a yes/no with a short description, so it starts on the lightest model
+DEFAULT_POLICY = {
+    "reception": StagePolicy(models=["gemini-2.0-flash-lite"], latency_slo_s=2.0),
+    "function_selection": StagePolicy(models=["gemini-2.0-flash", "gemini-2.0-flash-lite"], latency_slo_s=3.0),
+    "data_retrieval": StagePolicy(models=["gemini-2.0-flash", "gemini-2.0-flash-lite"], latency_slo_s=3.0),
+    "final_answer": StagePolicy(models=["gemini-2.0-flash", "gemini-2.0-flash-lite"], latency_slo_s=8.0),
+}
+
+
+def pinned_model() -> LLMModel | None:
+    """The model set with CRZ_LLM_MODEL / CRZ_LLM_PROVIDER, which every stage then uses"""
+    model_name = os.getenv("CRZ_LLM_MODEL")
+    if not model_name:
+        return None
+    info = get_model_info(model_name)
+    provider = os.getenv("CRZ_LLM_PROVIDER") or (info.provider if info else None)
+    if provider is None:
+        raise ValueError(f"Set CRZ_LLM_PROVIDER for the unknown model {model_name}")
+    if info is not None and info.provider == provider:
+        return info
+    return LLMModel(display_name=model_name, model_name=model_name, provider=ModelProvider(provider))
+
+
+class ModelPolicy:
+    """Chooses a model for each stage call from the stage's policy and recent latencies"""
+
+    def __init__(self, stages: dict):
+        self.stages = stages
+        self._latencies = collections.defaultdict(lambda: collections.deque(maxlen=LATENCY_WINDOW))
+        self._calls = collections.Counter()
+        self._lock = threading.Lock()
+
+    def observed_latency(self, stage: str, model_name: str) -> float | None:
+        """90th percentile latency of the recent calls, or None with too few of them"""
+        oldest = time.monotonic() - LATENCY_MAX_AGE_S
+        with self._lock:
+            samples = [latency for recorded, latency in self._latencies[(stage, model_name)] if recorded >= oldest]
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return float(np.percentile(samples, 90))
+
+    def candidates(self, stage: str, prompt_chars: int = 0) -> list:
+        """The stage's known models in list order (preferred first), without those over the cost ceiling"""
+        policy = self.stages.get(stage)
+        names = policy.models if policy else [DEFAULT_MODEL_NAME]
+        models = [info for info in map(get_model_info, names) if info is not None]
+        if not models:
+            raise ValueError(f"No known models for stage {stage}: {names}")
+        if policy is None or policy.max_cost_usd is None:
+            return models
+
+        def estimated_cost(model):
+            return model.cost(prompt_chars // CHARS_PER_TOKEN, RESPONSE_TOKEN_ESTIMATE)
+
+        affordable = [model for model in models
+                      if estimated_cost(model) is None or estimated_cost(model) <= policy.max_cost_usd]
+        # Nothing fits: the cheapest model is the closest to the target
+        return affordable or [min(models, key=lambda model: estimated_cost(model) or 0.0)]
+
+    def choose(self, stage: str, prompt_chars: int = 0) -> LLMModel:
+        """Model for the next call of a stage"""
+        models = self.candidates(stage, prompt_chars)
+        policy = self.stages.get(stage)
+        with self._lock:
+            self._calls[stage] += 1
+            probe = self._calls[stage] % PROBE_EVERY == 0
+        if policy is None or probe or len(models) == 1:
+            return models[0]
+
+        latencies = {model.model_name: self.observed_latency(stage, model.model_name) for model in models}
+        chosen = next((model for model in models
+                       if latencies[model.model_name] is None or latencies[model.model_name] <= policy.latency_slo_s),
+                      None)
+        if chosen is None:
+            # No model meets the SLO: take the fastest
+            chosen = min(models, key=lambda model: latencies[model.model_name])
+        if chosen is not models[0]:
+            STAGE_DOWNGRADES.inc(stage=stage, model=chosen.model_name)
+        return chosen
+
+    def record(self, stage: str, model_name: str, latency: float):
+        policy = self.stages.get(stage)
+        if policy is not None and latency <= policy.latency_slo_s:
+            observed = self.observed_latency(stage, model_name)
+            if observed is not None and observed > policy.latency_slo_s:
+                # A fast call of a model that was too slow (usually a probe): start its window over
+                with self._lock:
+                    self._latencies[(stage, model_name)].clear()
+        with self._lock:
+            self._latencies[(stage, model_name)].append((time.monotonic(), latency))
+
+
+def load_policy(path: str | None = None) -> ModelPolicy:
+    """The default policy, with stages overridden from a JSON file"""
+    stages = dict(DEFAULT_POLICY)
+    path = path or os.getenv("CRZ_MODEL_POLICY")
+    if path:
+        with open(path) as f:
+            stages.update({stage: StagePolicy(**config) for stage, config in json.load(f).items()})
+    return ModelPolicy(stages)
+
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def get_policy() -> ModelPolicy:
+    global _policy
+    with _policy_lock:
+        if _policy is None:
+            _policy = load_policy()
+        return _policy
+
+
+def call_stage(stage: str, prompt, pydantic_model, max_retries: int = 3):
+    """
+    call_llm with the model the policy chooses for an agent stage
+
+    Records the call's latency for later choices, and its token counts and
+    estimated cost on an llm_stage trace span.
+    """
+    model = pinned_model()
+    policy = get_policy()
+    if model is None:
+        model = policy.choose(stage, len(str(prompt)))
+    with trace_span("llm_stage", stage=stage, model=model.model_name,
+                    provider=getattr(model.provider, "value", model.provider)) as span:
+        started = time.perf_counter()
+        result = call_llm(prompt, model.model_name, model.provider, pydantic_model, max_retries=max_retries)
+        latency = time.perf_counter() - started
+        calls = [child for child in span.trace if child.parent is span and child.name == "call_llm"]
+        input_tokens = sum(call.attributes.get("prompt_tokens", 0) for call in calls)
+        output_tokens = sum(call.attributes.get("response_tokens", 0) for call in calls)
+        span.set_attribute("prompt_tokens", input_tokens)
+        span.set_attribute("response_tokens", output_tokens)
+        span.set_attribute("default_response", any(call.attributes.get("default_response") for call in calls))
+        cost = model.cost(input_tokens, output_tokens)
+        if cost is not None:
+            span.set_attribute("cost_usd", cost)
+            STAGE_COST.inc(cost, stage=stage, model=model.model_name)
+    policy.record(stage, model.model_name, latency)
+    STAGE_LATENCY.observe(latency, stage=stage, model=model.model_name)
+    return result
+
+
+def stage_report(spans: list, stages: dict | None = None) -> list:
+    """
+    Latency and cost per stage and model from llm_stage spans (dicts as written to trace files)
+
+    Args:
+        spans: Span dictionaries
+        stages: Stage policies the SLOs come from (default: load_policy())
+
+    Returns:
+        Rows sorted by stage and model
+    """
+    stages = stages if stages is not None else load_policy().stages
+    groups = collections.defaultdict(list)
+    for span in spans:
+        if span.get('name') == 'llm_stage':
+            groups[(span['attributes']['stage'], span['attributes']['model'])].append(span)
+    rows = []
+    for (stage, model_name), group in sorted(groups.items()):
+        latencies = [span['duration_ms'] / 1000 for span in group]
+        costs = [span['attributes'].get('cost_usd') for span in group]
+        known_costs = [cost for cost in costs if cost is not None]
+        policy = stages.get(stage)
+        p90 = float(np.percentile(latencies, 90))
+        rows.append({
+            'stage': stage,
+            'model': model_name,
+            'calls': len(group),
+            'p50_s': float(np.percentile(latencies, 50)),
+            'p90_s': p90,
+            'mean_cost_usd': sum(known_costs) / len(known_costs) if known_costs else None,
+            'default_rate': sum(bool(span['attributes'].get('default_response')) for span in group) / len(group),
+            'slo_s': policy.latency_slo_s if policy else None,
+            'meets_slo': p90 <= policy.latency_slo_s if policy else None,
+        })
+    return rows
+
+
+def format_stage_report(rows: list) -> str:
+    lines = [f"{'stage':<20} {'model':<24} {'calls':>6} {'p50':>8} {'p90':>8} {'SLO':>6} "
+             f"{'cost/call':>11} {'defaults':>9}"]
+    for row in rows:
+        slo = f"{row['slo_s']:.1f}s" if row['slo_s'] is not None else '-'
+        if row['meets_slo'] is False:
+            slo += '!'
+        cost = f"${row['mean_cost_usd']:.6f}" if row['mean_cost_usd'] is not None else '-'
+        lines.append(f"{row['stage']:<20} {row['model']:<24} {row['calls']:>6} {row['p50_s']:>7.2f}s "
+                     f"{row['p90_s']:>7.2f}s {slo:>6} {cost:>11} {row['default_rate']:>8.0%}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage latency and cost report from a JSON lines trace file")
+    parser.add_argument('trace_file', help="File written with CRZ_TRACE_FILE (jsonl format)")
+    args = parser.parse_args()
+    with open(args.trace_file) as f:
+        spans = [json.loads(line) for line in f if line.strip()]
+    rows = stage_report(spans)
+    if not rows:
+        print("No llm_stage spans in the trace file")
+        return
+    print(format_stage_report(rows))
+    print("\n! = 90th percentile latency over the stage's SLO")
+
+
+if __name__ == '__main__':
+    main()
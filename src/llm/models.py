@@ -1,12 +1,14 @@
+import importlib
 import os
-from langchain_anthropic import ChatAnthropic
-from langchain_deepseek import ChatDeepSeek
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_groq import ChatGroq
-from langchain_openai import ChatOpenAI
 from enum import Enum
+from functools import lru_cache
 from pydantic import BaseModel
-from typing import Tuple
+from typing import TYPE_CHECKING, Optional, Tuple
+
+if TYPE_CHECKING:
+    from langchain_groq import ChatGroq
+    from langchain_openai import ChatOpenAI
+    from src.llm.local_model import LocalChatModel
 
 
 class ModelProvider(str, Enum):
@@ -16,6 +18,7 @@ class ModelProvider(str, Enum):
     GEMINI = "Gemini"
     GROQ = "Groq"
     OPENAI = "OpenAI"
+    LOCAL = "Local"
 
 
 
@@ -24,6 +27,9 @@ class LLMModel(BaseModel):
     display_name: str
     model_name: str
     provider: ModelProvider
+    # List price in USD per million input / output tokens; None when unknown
+    input_cost_per_mtok: Optional[float] = None
+    output_cost_per_mtok: Optional[float] = None
 
     def to_choice_tuple(self) -> Tuple[str, str, str]:
         """Convert to format needed for questionary choices"""
@@ -40,6 +46,12 @@ class LLMModel(BaseModel):
     def is_gemini(self) -> bool:
         """Check if the model is a Gemini model"""
         return self.model_name.startswith("gemini")
+    
+    def cost(self, input_tokens: int, output_tokens: int) -> float | None:
+        """Price in USD of a call with these token counts, if the model's prices are known"""
+        if self.input_cost_per_mtok is None or self.output_cost_per_mtok is None:
+            return None
+        return (input_tokens * self.input_cost_per_mtok + output_tokens * self.output_cost_per_mtok) / 1e6
 
 
 # Define available models
@@ -47,37 +59,51 @@ AVAILABLE_MODELS = [
     LLMModel(
         display_name="[anthropic] claude-3.5-haiku",
         model_name="claude-3-5-haiku-latest",
-        provider=ModelProvider.ANTHROPIC
+        provider=ModelProvider.ANTHROPIC,
+        input_cost_per_mtok=0.8,
+        output_cost_per_mtok=4.0
     ),
     LLMModel(
         display_name="[anthropic] claude-3.5-sonnet",
         model_name="claude-3-5-sonnet-latest",
-        provider=ModelProvider.ANTHROPIC
+        provider=ModelProvider.ANTHROPIC,
+        input_cost_per_mtok=3.0,
+        output_cost_per_mtok=15.0
     ),
     LLMModel(
         display_name="[anthropic] claude-3.7-sonnet",
         model_name="claude-3-7-sonnet-latest",
-        provider=ModelProvider.ANTHROPIC
+        provider=ModelProvider.ANTHROPIC,
+        input_cost_per_mtok=3.0,
+        output_cost_per_mtok=15.0
     ),
     LLMModel(
         display_name="[deepseek] deepseek-r1",
         model_name="deepseek-reasoner",
-        provider=ModelProvider.DEEPSEEK
+        provider=ModelProvider.DEEPSEEK,
+        input_cost_per_mtok=0.55,
+        output_cost_per_mtok=2.19
     ),
     LLMModel(
         display_name="[deepseek] deepseek-v3",
         model_name="deepseek-chat",
-        provider=ModelProvider.DEEPSEEK
+        provider=ModelProvider.DEEPSEEK,
+        input_cost_per_mtok=0.27,
+        output_cost_per_mtok=1.1
     ),
     LLMModel(
         display_name="[gemini] gemini-2.0-flash",
         model_name="gemini-2.0-flash",
-        provider=ModelProvider.GEMINI
+        provider=ModelProvider.GEMINI,
+        input_cost_per_mtok=0.1,
+        output_cost_per_mtok=0.4
     ),
     LLMModel(
         display_name="[gemini] gemini-2.0-flash-lite",
         model_name="gemini-2.0-flash-lite",
-        provider=ModelProvider.GEMINI
+        provider=ModelProvider.GEMINI,
+        input_cost_per_mtok=0.075,
+        output_cost_per_mtok=0.3
     ),
     LLMModel(
         display_name="[gemini] gemini-2.0-pro",
@@ -87,43 +113,79 @@ AVAILABLE_MODELS = [
     LLMModel(
         display_name="[groq] llama-3.3 70b",
         model_name="llama-3.3-70b-versatile",
-        provider=ModelProvider.GROQ
+        provider=ModelProvider.GROQ,
+        input_cost_per_mtok=0.59,
+        output_cost_per_mtok=0.79
     ),
     LLMModel(
         display_name="[openai] gpt-4.5",
         model_name="gpt-4.5-preview",
-        provider=ModelProvider.OPENAI
+        provider=ModelProvider.OPENAI,
+        input_cost_per_mtok=75.0,
+        output_cost_per_mtok=150.0
     ),
     LLMModel(
         display_name="[openai] gpt-4o",
         model_name="gpt-4o",
-        provider=ModelProvider.OPENAI
+        provider=ModelProvider.OPENAI,
+        input_cost_per_mtok=2.5,
+        output_cost_per_mtok=10.0
     ),
     LLMModel(
         display_name="[openai] o1",
         model_name="o1",
-        provider=ModelProvider.OPENAI
+        provider=ModelProvider.OPENAI,
+        input_cost_per_mtok=15.0,
+        output_cost_per_mtok=60.0
     ),
     LLMModel(
         display_name="[openai] o3-mini",
         model_name="o3-mini",
-        provider=ModelProvider.OPENAI
+        provider=ModelProvider.OPENAI,
+        input_cost_per_mtok=1.1,
+        output_cost_per_mtok=4.4
+    ),
+    LLMModel(
+        display_name="[local] replay",
+        model_name="local-replay",
+        provider=ModelProvider.LOCAL,
+        input_cost_per_mtok=0.0,
+        output_cost_per_mtok=0.0
     ),
 ]
 
 
+# Provider -> (module, chat model class). Provider SDKs take seconds to import,
+# so each is imported on the first get_model call for that provider.
+PROVIDER_CLASSES = {
+    ModelProvider.ANTHROPIC: ("langchain_anthropic", "ChatAnthropic"),
+    ModelProvider.DEEPSEEK: ("langchain_deepseek", "ChatDeepSeek"),
+    ModelProvider.GEMINI: ("langchain_google_genai", "ChatGoogleGenerativeAI"),
+    ModelProvider.GROQ: ("langchain_groq", "ChatGroq"),
+    ModelProvider.OPENAI: ("langchain_openai", "ChatOpenAI"),
+    ModelProvider.LOCAL: ("src.llm.local_model", "LocalChatModel"),
+}
+
+
+@lru_cache(maxsize=None)
+def get_chat_model_class(model_provider: ModelProvider) -> type:
+    """Import and return the chat model class of a provider"""
+    module_name, class_name = PROVIDER_CLASSES[ModelProvider(model_provider)]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
 def get_model_info(model_name: str) -> LLMModel | None:
     """Get model information by model_name"""
     return next((model for model in AVAILABLE_MODELS if model.model_name == model_name), None)
 
-def get_model(model_name: str, model_provider: ModelProvider) -> ChatOpenAI | ChatGroq | None:
+def get_model(model_name: str, model_provider: ModelProvider) -> "ChatOpenAI | ChatGroq | LocalChatModel | None":
     if model_provider == ModelProvider.GROQ:
         api_key = os.getenv("GROQ_API_KEY")
         if not api_key:
             # Print error to console
             print(f"API Key Error: Please make sure GROQ_API_KEY is set in your .env file.")
             raise ValueError("Groq API key not found.  Please make sure GROQ_API_KEY is set in your .env file.")
-        return ChatGroq(model=model_name, api_key=api_key)
+        return get_chat_model_class(model_provider)(model=model_name, api_key=api_key)
     elif model_provider == ModelProvider.OPENAI:
         # Get and validate API key
         api_key = os.getenv("OPENAI_API_KEY")
@@ -131,22 +193,25 @@ def get_model(model_name: str, model_provider: ModelProvider) -> ChatOpenAI | Ch
             # Print error to console
             print(f"API Key Error: Please make sure OPENAI_API_KEY is set in your .env file.")
             raise ValueError("OpenAI API key not found.  Please make sure OPENAI_API_KEY is set in your .env file.")
-        return ChatOpenAI(model=model_name, api_key=api_key)
+        return get_chat_model_class(model_provider)(model=model_name, api_key=api_key)
     elif model_provider == ModelProvider.ANTHROPIC:
         api_key = os.getenv("ANTHROPIC_API_KEY")
         if not api_key:
             print(f"API Key Error: Please make sure ANTHROPIC_API_KEY is set in your .env file.")
             raise ValueError("Anthropic API key not found.  Please make sure ANTHROPIC_API_KEY is set in your .env file.")
-        return ChatAnthropic(model=model_name, api_key=api_key)
+        return get_chat_model_class(model_provider)(model=model_name, api_key=api_key)
     elif model_provider == ModelProvider.DEEPSEEK:
         api_key = os.getenv("DEEPSEEK_API_KEY")
         if not api_key:
             print(f"API Key Error: Please make sure DEEPSEEK_API_KEY is set in your .env file.")
             raise ValueError("DeepSeek API key not found.  Please make sure DEEPSEEK_API_KEY is set in your .env file.")
-        return ChatDeepSeek(model=model_name, api_key=api_key)
+        return get_chat_model_class(model_provider)(model=model_name, api_key=api_key)
     elif model_provider == ModelProvider.GEMINI:
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
             print(f"API Key Error: Please make sure GEMINI_API_KEY is set in your .env file.")
             raise ValueError("Gemini API key not found.  Please make sure GEMINI_API_KEY is set in your .env file.")
-        return ChatGoogleGenerativeAI(model=model_name, api_key=api_key)
\ No newline at end of file
+        return get_chat_model_class(model_provider)(model=model_name, api_key=api_key)
+    elif model_provider == ModelProvider.LOCAL:
+        # Offline stand-in: recorded or synthesized responses, simulated latency
+        return get_chat_model_class(model_provider)(model_name=model_name)
\ No newline at end of file
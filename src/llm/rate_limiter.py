@@ -0,0 +1,275 @@
+"""
+Per-provider rate limiting for LLM requests
+
+Each provider gets one ProviderLimiter shared by every caller in the process.
+It combines token buckets for requests per minute and tokens per minute with
+an adaptive concurrency limit: the limit grows by about one request per
+round trip while responses are fast, is halved on a 429, and shrinks by 10%
+when latency exceeds the provider's target (AIMD). Waiting requests are
+admitted in arrival order, and give up when their deadline passes.
+
+Limits come from PROVIDER_LIMITS and can be overridden per provider:
+
+    CRZ_LLM_RPM_GEMINI=15            requests per minute (0 for no limit)
+    CRZ_LLM_TPM_GEMINI=1000000       prompt + response tokens per minute
+    CRZ_LLM_CONCURRENCY_GEMINI=4     maximum concurrent requests
+    CRZ_LLM_RATE_LIMITS=off          disable all limiters
+"""
+
+import collections
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from src.utils.deadline import DeadlineExceeded, deadline_at
+from src.utils.metrics import REGISTRY
+
+# Seconds of budget that may be used in one burst
+BURST_SECONDS = 1.0
+# Fraction of the provider's limits to use, so clock skew and bursts stay under them
+HEADROOM = 0.95
+# Response tokens assumed before the actual count is known
+RESPONSE_TOKEN_ESTIMATE = 500
+CHARS_PER_TOKEN = 4
+
+# (requests/minute, tokens/minute, maximum concurrency, latency target in seconds); None means no limit.
+# Starting points for a paid tier; set the environment variables above to match your account.
+PROVIDER_LIMITS = {
+    "Anthropic": (50, 40_000, 8, 20.0),
+    "DeepSeek": (None, None, 16, 60.0),
+    "Gemini": (2_000, 4_000_000, 32, 10.0),
+    "Groq": (30, 6_000, 4, 5.0),
+    "OpenAI": (500, 200_000, 16, 20.0),
+    "Local": (None, None, 64, 30.0),
+}
+DEFAULT_LIMITS = (60, 100_000, 8, 20.0)
+
+QUEUE_DEPTH = REGISTRY.gauge('crz_llm_queue_depth', 'LLM requests waiting for the rate limiter', ['provider'])
+IN_FLIGHT = REGISTRY.gauge('crz_llm_in_flight', 'LLM requests admitted by the rate limiter', ['provider'])
+CONCURRENCY_LIMIT = REGISTRY.gauge('crz_llm_concurrency_limit', 'Adaptive LLM concurrency limit', ['provider'])
+QUEUE_WAIT = REGISTRY.histogram('crz_llm_queue_wait_seconds', 'Time LLM requests waited for the rate limiter',
+                                ['provider'])
+RATE_LIMITED = REGISTRY.counter('crz_llm_rate_limited_total', 'LLM requests rejected by the provider with a 429',
+                                ['provider'])
+
+
+def estimate_tokens(prompt) -> int:
+    """Prompt tokens from the prompt length, plus an allowance for the response"""
+    return len(str(prompt)) // CHARS_PER_TOKEN + RESPONSE_TOKEN_ESTIMATE
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Whether a provider error means the request was rate limited (HTTP 429)"""
+    for attribute in ('status_code', 'code', 'status'):
+        if getattr(error, attribute, None) == 429:
+            return True
+    response = getattr(error, 'response', None)
+    if getattr(response, 'status_code', None) == 429:
+        return True
+    name = type(error).__name__
+    return 'RateLimit' in name or 'ResourceExhausted' in name or '429' in str(error)
+
+
+class TokenBucket:
+    """
+    Refills at HEADROOM * per_minute / 60 per second up to a burst capacity
+
+    A request may take more than the current level as long as the level
+    covers min(amount, capacity); the debt delays the requests after it.
+    """
+
+    def __init__(self, per_minute: float | None):
+        self.rate = per_minute / 60 * HEADROOM if per_minute else None
+        self.capacity = max(1.0, per_minute / 60 * BURST_SECONDS) if per_minute else None
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken; 0 when it can be taken now"""
+        if self.rate is None:
+            return 0.0
+        self._refill(now)
+        needed = min(amount, self.capacity) - self.level
+        return max(0.0, needed / self.rate)
+
+    def take(self, amount: float):
+        if self.rate is not None:
+            self.level -= amount
+
+
+class ProviderLimiter:
+    """Token buckets, an AIMD concurrency limit and a FIFO queue for one provider"""
+
+    def __init__(self, provider: str, requests_per_minute: float | None = None,
+                 tokens_per_minute: float | None = None, max_concurrency: int = 8,
+                 latency_target: float = 20.0, min_concurrency: int = 1):
+        self.provider = provider
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.latency_target = latency_target
+        # Start at half the ceiling and let successes raise it
+        self.limit = float(max(min_concurrency, max_concurrency // 2))
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        CONCURRENCY_LIMIT.set(self.limit, provider=provider)
+
+    @contextmanager
+    def acquire(self, tokens: int = RESPONSE_TOKEN_ESTIMATE):
+        """
+        Wait for a turn, then hold a slot for the duration of the request
+
+        Raises DeadlineExceeded when the current deadline passes while waiting.
+        Yields a Permit; call permit.used(tokens) with the actual token count and
+        permit.rate_limited() if the provider answered with a 429.
+        """
+        finish_by = deadline_at()
+        started = time.monotonic()
+        ticket = object()
+        with self._condition:
+            self._queue.append(ticket)
+            QUEUE_DEPTH.inc(provider=self.provider)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait_for = None
+                    if self._queue[0] is ticket and self.in_flight < int(self.limit):
+                        wait_for = max(self.requests.delay(1, now), self.tokens.delay(tokens, now))
+                        if wait_for == 0:
+                            break
+                    if finish_by is not None:
+                        if finish_by <= now:
+                            raise DeadlineExceeded(f"deadline passed while queued for {self.provider}")
+                        wait_for = finish_by - now if wait_for is None else min(wait_for, finish_by - now)
+                    self._condition.wait(wait_for)
+            finally:
+                self._queue.remove(ticket)
+                QUEUE_DEPTH.dec(provider=self.provider)
+                self._condition.notify_all()
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.in_flight += 1
+            IN_FLIGHT.set(self.in_flight, provider=self.provider)
+        QUEUE_WAIT.observe(time.monotonic() - started, provider=self.provider)
+
+        permit = Permit(tokens)
+        admitted = time.monotonic()
+        try:
+            yield permit
+        finally:
+            self._release(permit, time.monotonic() - admitted)
+
+    def _release(self, permit: "Permit", latency: float):
+        with self._condition:
+            self.in_flight -= 1
+            IN_FLIGHT.set(self.in_flight, provider=self.provider)
+            if permit.actual_tokens is not None:
+                # Settle the estimate against the real count
+                self.tokens.take(permit.actual_tokens - permit.estimated_tokens)
+            now = time.monotonic()
+            if permit.was_rate_limited:
+                RATE_LIMITED.inc(provider=self.provider)
+                # The provider saw more than the bucket allowed; spend the burst before sending more
+                self.requests.take(max(0.0, self.requests.level))
+                self._decrease(0.5, now)
+            elif latency > self.latency_target:
+                self._decrease(0.9, now)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            CONCURRENCY_LIMIT.set(self.limit, provider=self.provider)
+            self._condition.notify_all()
+
+    def _decrease(self, factor: float, now: float):
+        # Requests already in flight when the limit dropped report the same congestion; count it once
+        if now - self.last_decrease < self.latency_target / 4:
+            return
+        self.limit = max(self.min_concurrency, self.limit * factor)
+        self.last_decrease = now
+
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+
+class Permit:
+    """Outcome of one admitted request, reported back to its limiter"""
+
+    def __init__(self, estimated_tokens: int):
+        self.estimated_tokens = estimated_tokens
+        self.actual_tokens = None
+        self.was_rate_limited = False
+
+    def used(self, tokens: int):
+        self.actual_tokens = tokens
+
+    def rate_limited(self):
+        self.was_rate_limited = True
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _env_limit(name: str, provider: str, default):
+    value = os.getenv(f"CRZ_LLM_{name}_{provider.upper()}")
+    if value in (None, ""):
+        return default
+    return float(value) or None
+
+
+def rate_limits_enabled() -> bool:
+    return os.getenv("CRZ_LLM_RATE_LIMITS", "on").lower() not in ("0", "off", "false", "no")
+
+
+def get_limiter(provider) -> ProviderLimiter | None:
+    """The shared limiter for a provider, or None when rate limiting is disabled"""
+    if not rate_limits_enabled():
+        return None
+    provider = getattr(provider, "value", provider)
+    with _limiters_lock:
+        if provider not in _limiters:
+            rpm, tpm, concurrency, latency_target = PROVIDER_LIMITS.get(provider, DEFAULT_LIMITS)
+            _limiters[provider] = ProviderLimiter(
+                provider,
+                requests_per_minute=_env_limit("RPM", provider, rpm),
+                tokens_per_minute=_env_limit("TPM", provider, tpm),
+                max_concurrency=int(_env_limit("CONCURRENCY", provider, concurrency) or concurrency),
+                latency_target=latency_target,
+            )
+        return _limiters[provider]
+
+
+def reset_limiters():
+    """Forget the limiters, so the next request picks up new settings"""
+    with _limiters_lock:
+        _limiters.clear()
+
+
+@contextmanager
+def limited(provider, prompt):
+    """
+    Hold the provider's limiter around one request
+
+    Usage:
+        with limited(provider, prompt) as permit:
+            result = llm.invoke(prompt)
+            permit.used(total_tokens)
+    """
+    limiter = get_limiter(provider)
+    if limiter is None:
+        yield Permit(0)
+        return
+    with limiter.acquire(estimate_tokens(prompt)) as permit:
+        try:
+            yield permit
+        except Exception as e:
+            if is_rate_limit_error(e):
+                permit.rate_limited()
+            raise
@@ -1,5 +1,10 @@
-from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Type
+from pydantic import BaseModel, Field, field_validator
+from typing import Annotated, List, Dict, Any, Literal, Type
+
+# [start_hour, end_hour], inclusive; a start after the end wraps past midnight
+HourRange = Annotated[List[Annotated[int, Field(ge=0, le=23)]], Field(min_length=2, max_length=2)]
+# Columns the analysis functions can sum
+Metric = Literal["CRZ Entries", "Excluded Roadway Entries"]
 
 class FunctionParams:
     """Container for all function parameter models"""
@@ -9,7 +14,7 @@ class FunctionParams:
         start_date: str | None = None
         end_date: str | None = None
         day_type: str | None = None
-        hour_range: List[int] | None = None  # Changed from Tuple to List
+        hour_range: HourRange | None = None
         time_period: str | None = None
         vehicle_class: str | None = None
         entry_point: str | None = None
@@ -20,7 +25,7 @@ class FunctionParams:
         start_date: str | None = None
         end_date: str | None = None
         day_type: str | None = None
-        hour_range: List[int] | None = None  # Changed from Tuple to List
+        hour_range: HourRange | None = None
         time_period: str | None = None
         vehicle_class: str | None = None
         entry_point: str | None = None
@@ -33,7 +38,7 @@ class FunctionParams:
         start_date: str | None = None
         end_date: str | None = None
         day_type: str | None = None
-        hour_range: List[int] | None = None  # Changed from Tuple to List
+        hour_range: HourRange | None = None
         time_period: str | None = None
         vehicle_class: str | None = None
         entry_point: str | None = None
@@ -46,24 +51,29 @@ class FunctionParams:
         start_date: str | None = None
         end_date: str | None = None
         day_type: str | None = None
-        hour_range: List[int] | None = None  # Changed from Tuple to List
+        hour_range: HourRange | None = None
         time_period: str | None = None
         vehicle_class: str | None = None
         entry_point: str | None = None
         entry_region: str | None = None
         compare_with: Dict[str, Any] | None = None
+
+        @field_validator('compare_with')
+        @classmethod
+        def check_filters(cls, value):
+            return _check_filters(value)
     
     class AnalyzeTimeTrendsParams(BaseModel):
         """Parameters for analyze_time_trends function"""
         start_date: str | None = None
         end_date: str | None = None
         day_type: str | None = None
-        hour_range: List[int] | None = None  # Changed from Tuple to List
+        hour_range: HourRange | None = None
         time_period: str | None = None
         vehicle_class: str | None = None
         entry_point: str | None = None
         entry_region: str | None = None
-        metric: str | None = "CRZ Entries"
+        metric: Metric | None = "CRZ Entries"
         time_unit: str | None = "day"
     
     class AnalyzeExcludedRoadwayUsageParams(BaseModel):
@@ -71,7 +81,7 @@ class FunctionParams:
         start_date: str | None = None
         end_date: str | None = None
         day_type: str | None = None
-        hour_range: List[int] | None = None  # Changed from Tuple to List
+        hour_range: HourRange | None = None
         time_period: str | None = None
         vehicle_class: str | None = None
         entry_point: str | None = None
@@ -82,7 +92,7 @@ class FunctionParams:
         start_date: str | None = None
         end_date: str | None = None
         day_type: str | None = None
-        hour_range: List[int] | None = None  # Changed from Tuple to List
+        hour_range: HourRange | None = None
         time_period: str | None = None
         vehicle_class: str  # Required field
         entry_point: str | None = None
@@ -93,14 +103,19 @@ class FunctionParams:
         dimension: str  # Required field
         segment_a: Dict[str, Any]  # Required field
         segment_b: Dict[str, Any]  # Required field
-        metric: str | None = "CRZ Entries"
+        metric: Metric | None = "CRZ Entries"
+
+        @field_validator('segment_a', 'segment_b')
+        @classmethod
+        def check_filters(cls, value):
+            return _check_filters(value)
     
     class GenerateVisualizationParams(BaseModel):
         """Parameters for generate_visualization function"""
         start_date: str | None = None
         end_date: str | None = None
         day_type: str | None = None
-        hour_range: List[int] | None = None  # Changed from Tuple to List
+        hour_range: HourRange | None = None
         time_period: str | None = None
         vehicle_class: str | None = None
         entry_point: str | None = None
@@ -109,6 +124,23 @@ class FunctionParams:
         x_column: str  # Required field
         y_column: str  # Required field
         title: str | None = "Congestion Relief Zone Analysis"
+    
+    class QueryCRZSQLParams(BaseModel):
+        """Parameters for query_crz_sql function"""
+        query: str  # Required field
+        max_rows: int | None = 100
+
+def _check_filters(filters: dict | None) -> dict | None:
+    """Validate a dict of filter_crz_data arguments (a comparison segment) like the top-level filters"""
+    if filters is not None:
+        errors = []
+        try:
+            FunctionParams.FilterCRZDataParams(**filters)
+        except ValueError as e:
+            errors = [f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()]
+        if errors:
+            raise ValueError(f"invalid filters: {'; '.join(errors)}")
+    return filters
 
 # State definitions
 class Reception(BaseModel):
@@ -220,6 +252,13 @@ functions_info = {
       "optional_parameters": ["metric"],
       "returns": "Dictionary with comparison results between segments"
     },
+    {
+      "function_name": "query_crz_sql",
+      "description": "Run one read-only SQL SELECT (DuckDB dialect) over the table crz for breakdowns the other functions do not offer; columns include \"Toll Date\", \"Hour of Day\", \"Day of Week\", \"Time Period\", \"Vehicle Class\", \"Detection Group\", \"Detection Region\", \"CRZ Entries\", \"Excluded Roadway Entries\"",
+      "required_parameters": ["query"],
+      "optional_parameters": ["max_rows"],
+      "returns": "Dictionary with the result columns and rows"
+    },
     {
       "function_name": "generate_visualization",
       "description": "Generate a visualization based on the data",
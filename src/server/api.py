@@ -0,0 +1,367 @@
+"""JSON query endpoints backed by the CRZ analysis functions"""
+
+import json
+import typing
+from datetime import date, datetime
+from http import HTTPStatus
+from urllib.parse import parse_qs
+
+import numpy as np
+import pandas as pd
+from pydantic import ValidationError
+
+from src.utils.deadline import DeadlineExceeded
+from src.utils.snapshot import (ARROW_STREAM_CONTENT_TYPE, arrow_available, get_columnar_snapshot,
+                                records_to_table, table_to_ipc_stream)
+from src.workflow.approximate import DEFAULT_TIME_BUDGET_S, approximate_crz_function
+from src.workflow.other_tools import execute_crz_batch, execute_crz_function, get_params_model
+from src.workflow.sql_tool import SQL_DEFAULT_ROWS, SQLQueryError, describe_sql_schema, query_crz_sql, run_sql
+
+# URL path -> analysis function
+API_ROUTES = {
+    '/api/entry-points': 'analyze_entry_point_volume',
+    '/api/peaks': 'analyze_peak_periods',
+    '/api/vehicles': 'analyze_vehicle_distribution',
+    '/api/trends': 'analyze_time_trends',
+    '/api/excluded-roadways': 'analyze_excluded_roadway_usage',
+    '/api/compare': 'compare_traffic_segments',
+}
+
+# Route serving slices of the processed dataset itself (Arrow only)
+TABLE_ROUTE = '/api/table'
+# Read-only SQL over the dataset (GET with query=..., or POST {"query": ...}) and its schema
+SQL_ROUTE = '/api/sql'
+SQL_SCHEMA_ROUTE = '/api/sql/schema'
+
+# Result key sent as the Arrow table when a response is requested as Arrow;
+# the other keys travel as JSON in the schema metadata
+ARROW_TABLE_KEYS = {
+    'analyze_entry_point_volume': 'top_entry_points',
+    'analyze_peak_periods': 'peak_periods',
+    'analyze_vehicle_distribution': 'vehicle_distribution',
+    'analyze_time_trends': 'time_series',
+    'analyze_excluded_roadway_usage': 'by_time',
+}
+
+JSON_CONTENT_TYPE = 'application/json'
+
+# Query parameter that trims the response to some top-level keys, e.g. fields=time_series
+FIELDS_PARAM = 'fields'
+# approximate=1 answers from the stratified sample (src.workflow.approximate); tolerance is the
+# relative error to stop at and time_budget_ms the time to answer within
+APPROXIMATE_PARAMS = ('approximate', 'tolerance', 'time_budget_ms')
+
+
+class APIError(Exception):
+    """Error reported to the client as a JSON body with an HTTP status"""
+
+    def __init__(self, status: HTTPStatus, message: str, details=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.details = details
+
+
+def to_jsonable(value):
+    """Convert analysis results (numpy scalars, timestamps, non-string keys) to JSON types"""
+    if isinstance(value, dict):
+        return {str(to_jsonable(key)): to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, pd.DataFrame):
+        return to_jsonable(value.to_dict(orient='records'))
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, datetime, date)):
+        return value.isoformat()
+    if isinstance(value, pd.Period):
+        return str(value)
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def encode_json(payload) -> bytes:
+    """Compact JSON encoding of an API payload"""
+    return json.dumps(to_jsonable(payload), separators=(',', ':')).encode('utf-8')
+
+
+def _field_kind(annotation) -> str:
+    """'list', 'dict' or 'scalar' for a parameter model field annotation"""
+    origin = typing.get_origin(annotation)
+    if origin in (list, tuple):
+        return 'list'
+    if origin is dict:
+        return 'dict'
+    for arg in typing.get_args(annotation):
+        kind = _field_kind(arg)
+        if kind != 'scalar':
+            return kind
+    return 'scalar'
+
+
+def parse_query_params(function_name: str, query: dict) -> dict:
+    """
+    Convert query string values into parameters for a CRZ function
+
+    Lists are given comma separated (hour_range=7,10) and nested filters as
+    JSON (segment_a={"day_type":"weekday"}); everything else is validated by
+    the function's parameter model.
+
+    Args:
+        function_name: Name of the function the route maps to
+        query: Parsed query string from urllib.parse.parse_qs
+
+    Returns:
+        Dictionary of raw parameters for the function's parameter model
+    """
+    model_fields = get_params_model(function_name).model_fields
+    params = {}
+    for name, values in query.items():
+        if name == FIELDS_PARAM or name in APPROXIMATE_PARAMS:
+            continue
+        if name not in model_fields:
+            raise APIError(HTTPStatus.BAD_REQUEST, f"Unknown parameter for {function_name}: {name}")
+        value = values[-1]
+        kind = _field_kind(model_fields[name].annotation)
+        if kind == 'list':
+            params[name] = [item for item in value.split(',') if item != '']
+        elif kind == 'dict':
+            try:
+                params[name] = json.loads(value)
+            except json.JSONDecodeError as e:
+                raise APIError(HTTPStatus.BAD_REQUEST, f"Parameter {name} must be a JSON object: {e}")
+        else:
+            params[name] = value
+    return params
+
+
+def select_fields(result, fields: str | None):
+    """Keep only the requested top-level keys of a result"""
+    if not fields or not isinstance(result, dict):
+        return result
+    wanted = [field for field in fields.split(',') if field]
+    missing = [field for field in wanted if field not in result]
+    if missing:
+        raise APIError(HTTPStatus.BAD_REQUEST, f"Unknown fields: {', '.join(missing)}")
+    return {field: result[field] for field in wanted}
+
+
+def run_route(path: str, query_string: str, df: pd.DataFrame):
+    """
+    Run the analysis behind a GET /api/... route
+
+    Args:
+        path: URL path, e.g. /api/trends
+        query_string: Raw query string, e.g. entry_point=Holland+Tunnel&time_unit=day
+        df: Processed CRZ dataset
+
+    Returns:
+        The (optionally trimmed) analysis result
+    """
+    if path in ('/api', '/api/'):
+        return describe_routes()
+    if path not in API_ROUTES:
+        raise APIError(HTTPStatus.NOT_FOUND, f"Unknown endpoint: {path}")
+
+    function_name = API_ROUTES[path]
+    query = parse_qs(query_string, keep_blank_values=False)
+    params = parse_query_params(function_name, query)
+    try:
+        params = get_params_model(function_name)(**params)
+        if query.get('approximate', ['0'])[-1].lower() in ('1', 'true', 'yes'):
+            result = approximate_route(function_name, params, query, df)
+        else:
+            result = execute_crz_function(function_name, params, df)
+    except ValidationError as e:
+        raise APIError(HTTPStatus.BAD_REQUEST, "Invalid parameters",
+                       e.errors(include_url=False, include_context=False))
+    except ValueError as e:
+        raise APIError(HTTPStatus.BAD_REQUEST, str(e))
+    return select_fields(result, query.get(FIELDS_PARAM, [None])[-1])
+
+
+def approximate_route(function_name: str, params, query: dict, df: pd.DataFrame) -> dict:
+    """Estimate a route's result from the sample, within the request's tolerance and time budget"""
+    try:
+        tolerance = float(query['tolerance'][-1]) if 'tolerance' in query else None
+        time_budget = float(query['time_budget_ms'][-1]) / 1000 if 'time_budget_ms' in query else DEFAULT_TIME_BUDGET_S
+    except ValueError:
+        raise APIError(HTTPStatus.BAD_REQUEST, "tolerance and time_budget_ms must be numbers")
+    return approximate_crz_function(function_name, params, df, tolerance=tolerance, time_budget=time_budget)
+
+
+def wants_arrow(accept: str | None) -> bool:
+    """Whether an Accept header asks for an Arrow IPC stream"""
+    return bool(accept) and ARROW_STREAM_CONTENT_TYPE in accept
+
+
+def result_to_arrow(function_name: str, result, fields: str | None) -> bytes:
+    """
+    Encode an analysis result as an Arrow IPC stream
+
+    The table holds the result's main list of points (or the single list named
+    in fields); the remaining keys are stored as JSON in the schema metadata
+    under 'crz_result'.
+    """
+    table_key = ARROW_TABLE_KEYS.get(function_name)
+    if fields and len(fields.split(',')) == 1 and isinstance(result.get(fields), list):
+        table_key = fields
+    if table_key is None or not isinstance(result.get(table_key), list):
+        raise APIError(HTTPStatus.NOT_ACCEPTABLE, f"{function_name} results have no tabular form; request JSON")
+    rest = {key: value for key, value in result.items() if key != table_key}
+    table = records_to_table(to_jsonable(result[table_key]),
+                             {'crz_table': table_key, 'crz_result': encode_json(rest).decode('utf-8')})
+    return table_to_ipc_stream(table)
+
+
+def read_table_slice(query_string: str, df: pd.DataFrame) -> bytes:
+    """
+    Run a GET /api/table request: rows of the processed dataset as an Arrow stream
+
+    Query parameters are start_date and end_date (inclusive, 'YYYY-MM-DD') and
+    columns (comma separated). The rows are zero-copy slices of the cached
+    columnar snapshot.
+    """
+    query = parse_qs(query_string)
+    unknown = set(query) - {'start_date', 'end_date', 'columns'}
+    if unknown:
+        raise APIError(HTTPStatus.BAD_REQUEST, f"Unknown parameters: {', '.join(sorted(unknown))}")
+    columns = [column for column in query.get('columns', [''])[-1].split(',') if column]
+    try:
+        table = get_columnar_snapshot(df).select(
+            start_date=query.get('start_date', [None])[-1],
+            end_date=query.get('end_date', [None])[-1],
+            columns=columns or None,
+        )
+    except KeyError as e:
+        raise APIError(HTTPStatus.BAD_REQUEST, str(e.args[0]))
+    except ValueError as e:
+        raise APIError(HTTPStatus.BAD_REQUEST, str(e))
+    return table_to_ipc_stream(table)
+
+
+def run_sql_route(payload: dict, df: pd.DataFrame, arrow: bool = False):
+    """
+    Run a /api/sql request
+
+    Args:
+        payload: {"query": "SELECT ...", "max_rows": 100}
+        df: Processed CRZ dataset
+        arrow: Return the result table as an Arrow IPC stream instead of a dict
+
+    Returns:
+        query_crz_sql's result, or the Arrow stream bytes
+    """
+    unknown = set(payload) - {'query', 'max_rows'}
+    if unknown:
+        raise APIError(HTTPStatus.BAD_REQUEST, f"Unknown parameters: {', '.join(sorted(unknown))}")
+    if not isinstance(payload.get('query'), str) or not payload['query'].strip():
+        raise APIError(HTTPStatus.BAD_REQUEST, "query is required")
+    try:
+        max_rows = int(payload.get('max_rows', SQL_DEFAULT_ROWS))
+    except (TypeError, ValueError):
+        raise APIError(HTTPStatus.BAD_REQUEST, "max_rows must be an integer")
+    try:
+        if arrow:
+            table, truncated_by = run_sql(df, payload['query'], max_rows=max_rows)
+            metadata = {'crz_truncated_by': truncated_by} if truncated_by else None
+            return table_to_ipc_stream(table.replace_schema_metadata(metadata))
+        return query_crz_sql(df, payload['query'], max_rows=max_rows)
+    except SQLQueryError as e:
+        raise APIError(HTTPStatus.BAD_REQUEST, str(e))
+    except DeadlineExceeded as e:
+        raise APIError(HTTPStatus.GATEWAY_TIMEOUT, str(e))
+    except ImportError as e:
+        raise APIError(HTTPStatus.NOT_IMPLEMENTED, str(e))
+
+
+def sql_schema(df: pd.DataFrame) -> dict:
+    try:
+        return describe_sql_schema(df)
+    except ImportError as e:
+        raise APIError(HTTPStatus.NOT_IMPLEMENTED, str(e))
+
+
+def render_route(path: str, query_string: str, df: pd.DataFrame, accept: str | None = None):
+    """
+    Run a GET /api/... request and encode the response for the client
+
+    Args:
+        path: URL path, e.g. /api/trends
+        query_string: Raw query string
+        df: Processed CRZ dataset
+        accept: Value of the Accept header; Arrow IPC is sent when it lists
+            application/vnd.apache.arrow.stream, JSON otherwise
+
+    Returns:
+        Tuple of (body bytes, content type)
+    """
+    arrow = wants_arrow(accept)
+    if arrow and not arrow_available():
+        raise APIError(HTTPStatus.NOT_ACCEPTABLE, "Arrow responses need the pyarrow package on the server")
+
+    if path == TABLE_ROUTE:
+        if not arrow:
+            raise APIError(HTTPStatus.NOT_ACCEPTABLE, f"{TABLE_ROUTE} is only served as {ARROW_STREAM_CONTENT_TYPE}")
+        return read_table_slice(query_string, df), ARROW_STREAM_CONTENT_TYPE
+    if path == SQL_SCHEMA_ROUTE:
+        return encode_json(sql_schema(df)), JSON_CONTENT_TYPE
+    if path == SQL_ROUTE:
+        payload = {name: values[-1] for name, values in parse_qs(query_string).items()}
+        result = run_sql_route(payload, df, arrow)
+        return (result, ARROW_STREAM_CONTENT_TYPE) if arrow else (encode_json(result), JSON_CONTENT_TYPE)
+
+    result = run_route(path, query_string, df)
+    if arrow and path in API_ROUTES:
+        fields = parse_qs(query_string).get(FIELDS_PARAM, [None])[-1]
+        return result_to_arrow(API_ROUTES[path], result, fields), ARROW_STREAM_CONTENT_TYPE
+    return encode_json(result), JSON_CONTENT_TYPE
+
+
+def run_batch(body: bytes, df: pd.DataFrame) -> list:
+    """
+    Run a POST /api/batch request
+
+    The body is {"requests": [{"function": "analyze_time_trends", "params": {...}}, ...]};
+    the response lists the results in the same order.
+    """
+    try:
+        payload = json.loads(body or b'{}')
+        requests = [(item['function'], item.get('params') or {}) for item in payload['requests']]
+    except (json.JSONDecodeError, KeyError, TypeError, AttributeError) as e:
+        raise APIError(HTTPStatus.BAD_REQUEST, f"Malformed batch request: {e}")
+    for index, (function_name, params) in enumerate(requests):
+        if not isinstance(function_name, str) or not isinstance(params, dict):
+            raise APIError(HTTPStatus.BAD_REQUEST, f"Malformed batch request: item {index} needs a string "
+                                                   f"function and an object of params")
+    try:
+        return execute_crz_batch(requests, df)
+    except ValidationError as e:
+        raise APIError(HTTPStatus.BAD_REQUEST, "Invalid parameters",
+                       e.errors(include_url=False, include_context=False))
+    except ValueError as e:
+        raise APIError(HTTPStatus.BAD_REQUEST, str(e))
+
+
+def describe_routes() -> dict:
+    """List the endpoints and the parameters each one accepts"""
+    return {
+        'endpoints': [
+            {
+                'path': path,
+                'function': function_name,
+                'parameters': list(get_params_model(function_name).model_fields),
+            }
+            for path, function_name in API_ROUTES.items()
+        ] + [
+            {'path': '/api/batch', 'method': 'POST', 'body': {'requests': [{'function': '...', 'params': {}}]}},
+            {'path': TABLE_ROUTE, 'parameters': ['start_date', 'end_date', 'columns'],
+             'accept': ARROW_STREAM_CONTENT_TYPE},
+            {'path': SQL_ROUTE, 'method': 'GET or POST', 'parameters': ['query', 'max_rows']},
+            {'path': SQL_SCHEMA_ROUTE},
+        ],
+        'fields_parameter': FIELDS_PARAM,
+        'approximate_parameters': list(APPROXIMATE_PARAMS),
+        'arrow_content_type': ARROW_STREAM_CONTENT_TYPE,
+    }
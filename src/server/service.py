@@ -0,0 +1,142 @@
+"""HTTP handler serving the dashboard files and the CRZ query API"""
+
+import json
+from http import HTTPStatus
+from urllib.parse import urlsplit
+
+from src.server.api import (API_ROUTES, JSON_CONTENT_TYPE, SQL_ROUTE, SQL_SCHEMA_ROUTE, TABLE_ROUTE, APIError,
+                            encode_json, render_route, run_batch, run_sql_route, wants_arrow)
+from src.server.static_files import ProductionRequestHandler
+from src.utils.data_loader import DEFAULT_DATA_PATH, get_processed_data
+from src.utils.metrics import PROMETHEUS_CONTENT_TYPE, render_prometheus
+from src.utils.snapshot import ARROW_STREAM_CONTENT_TYPE
+
+# Largest accepted POST body
+MAX_BODY_SIZE = 1024 * 1024
+
+METRICS_PATH = '/metrics'
+BATCH_ROUTE = '/api/batch'
+
+
+def is_api_path(path: str) -> bool:
+    return path == '/api' or path.startswith('/api/')
+
+
+class CRZServiceHandler(ProductionRequestHandler):
+    """
+    Production static handler that also answers /api/... queries
+
+    Analyses run on the processed dataset held in memory by get_processed_data,
+    so charts receive only the aggregated points they plot. Set data_path to an
+    absolute path before starting the server. /metrics exposes the process
+    metrics in the Prometheus text format.
+    """
+
+    data_path = DEFAULT_DATA_PATH
+    allowed_methods = 'GET, HEAD, POST, OPTIONS'
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == METRICS_PATH:
+            return self.serve_metrics(send_body=True)
+        if is_api_path(path):
+            return self.serve_api(send_body=True)
+        return super().do_GET()
+
+    def do_HEAD(self):
+        path = urlsplit(self.path).path
+        if path == METRICS_PATH:
+            return self.serve_metrics(send_body=False)
+        if is_api_path(path):
+            return self.serve_api(send_body=False)
+        return super().do_HEAD()
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        # Errors before the body is read close the connection, so the unread body
+        # is not taken for the next request on it
+        if path not in (BATCH_ROUTE, SQL_ROUTE):
+            self.close_connection = True
+            return self.send_api_error(APIError(HTTPStatus.METHOD_NOT_ALLOWED,
+                                                f"POST is only supported on {BATCH_ROUTE} and {SQL_ROUTE}"))
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            return self.send_api_error(APIError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length"))
+        if length > MAX_BODY_SIZE:
+            self.close_connection = True
+            return self.send_api_error(APIError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large"))
+        body = self.rfile.read(length)
+        try:
+            if path == SQL_ROUTE:
+                return self.serve_sql(body)
+            result = run_batch(body, self.get_dataset())
+        except APIError as e:
+            return self.send_api_error(e)
+        except Exception as e:
+            print(f"Error serving POST {self.path}: {e}")
+            return self.send_api_error(APIError(HTTPStatus.INTERNAL_SERVER_ERROR, "Internal error"))
+        self.send_content(encode_json({'results': result}), JSON_CONTENT_TYPE)
+
+    def serve_sql(self, body: bytes):
+        try:
+            payload = json.loads(body or b'{}')
+        except json.JSONDecodeError as e:
+            raise APIError(HTTPStatus.BAD_REQUEST, f"Malformed SQL request: {e}")
+        if not isinstance(payload, dict):
+            raise APIError(HTTPStatus.BAD_REQUEST, 'Malformed SQL request: expected {"query": ...}')
+        arrow = wants_arrow(self.headers.get('Accept'))
+        result = run_sql_route(payload, self.get_dataset(), arrow)
+        if arrow:
+            return self.send_content(result, ARROW_STREAM_CONTENT_TYPE)
+        self.send_content(encode_json(result), JSON_CONTENT_TYPE)
+
+    def do_OPTIONS(self):
+        # CORS preflight for JSON POSTs
+        self.send_response(HTTPStatus.NO_CONTENT)
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def metrics_route(self) -> str:
+        path = urlsplit(self.path).path
+        if path in API_ROUTES or path in (TABLE_ROUTE, SQL_ROUTE, SQL_SCHEMA_ROUTE, BATCH_ROUTE, METRICS_PATH):
+            return path
+        return 'api_other' if is_api_path(path) else super().metrics_route()
+
+    def serve_metrics(self, send_body: bool):
+        body = render_prometheus().encode('utf-8')
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def get_dataset(self):
+        try:
+            df, _ = get_processed_data(self.data_path)
+        except FileNotFoundError:
+            raise APIError(HTTPStatus.SERVICE_UNAVAILABLE, f"Dataset not found: {self.data_path}")
+        return df
+
+    def serve_api(self, send_body: bool):
+        url = urlsplit(self.path)
+        try:
+            body, content_type = render_route(url.path, url.query, self.get_dataset(), self.headers.get('Accept'))
+        except APIError as e:
+            return self.send_api_error(e, send_body)
+        except Exception as e:
+            print(f"Error serving {self.path}: {e}")
+            return self.send_api_error(APIError(HTTPStatus.INTERNAL_SERVER_ERROR, "Internal error"), send_body)
+        self.send_content(body, content_type, send_body=send_body)
+
+    def send_api_error(self, error: APIError, send_body: bool = True):
+        payload = {'error': error.message}
+        if error.details is not None:
+            payload['details'] = error.details
+        self.send_content(encode_json(payload), JSON_CONTENT_TYPE, status=error.status, send_body=send_body)
@@ -0,0 +1,484 @@
+"""Production static file serving: precompressed responses, strong ETags and byte ranges"""
+
+import email.utils
+import fnmatch
+import gzip
+import hashlib
+import http.server
+import json
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http import HTTPStatus
+
+from src.utils.metrics import CACHE_LOOKUPS, REGISTRY
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Content types worth compressing; images and archives are already compressed
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/javascript',
+    'application/json',
+    'image/svg+xml',
+)
+
+# Files smaller than this are sent as-is
+MIN_COMPRESS_SIZE = 1024
+# Files larger than this are encoded in a background thread on their first request, and sent
+# unencoded until the copy is ready; smaller ones are encoded while the request waits
+BACKGROUND_COMPRESS_SIZE = 4 * 2**20
+
+# Levels of copies encoded while serving; precompress, which runs ahead of time, uses the best ones
+ON_DEMAND_BROTLI_QUALITY = 5
+ON_DEMAND_GZIP_LEVEL = 6
+
+# (path pattern, Cache-Control value); the first matching pattern wins
+DEFAULT_CACHE_RULES = [
+    ('/api/*', 'no-cache'),
+    ('/data/*.csv', 'public, max-age=300, must-revalidate'),
+    ('*.csv', 'public, max-age=300, must-revalidate'),
+    ('*.js', 'public, max-age=3600'),
+    ('*.css', 'public, max-age=3600'),
+    ('*.png', 'public, max-age=86400'),
+    ('*.jpg', 'public, max-age=86400'),
+    ('*.svg', 'public, max-age=86400'),
+    ('*', 'no-cache'),
+]
+
+DEFAULT_COMPRESSED_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'crz-compressed-cache')
+
+CHUNK_SIZE = 64 * 1024
+
+
+def is_compressible(content_type: str) -> bool:
+    """Whether responses of this content type are worth compressing"""
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def load_cache_rules(config_path: str | None) -> list:
+    """
+    Load Cache-Control rules from a JSON file
+
+    The file holds a list of [pattern, value] pairs matched in order against the
+    request path with fnmatch, e.g. [["/data/*.csv", "public, max-age=600"], ["*", "no-cache"]].
+
+    Args:
+        config_path: Path to the JSON file, or None for the defaults
+
+    Returns:
+        List of (pattern, value) tuples
+    """
+    if not config_path:
+        return list(DEFAULT_CACHE_RULES)
+    with open(config_path) as f:
+        rules = json.load(f)
+    return [(pattern, value) for pattern, value in rules]
+
+
+def parse_accept_encoding(header: str | None) -> dict:
+    """Return {coding: q-value} from an Accept-Encoding header"""
+    codings = {}
+    if not header:
+        return codings
+    for part in header.split(','):
+        fields = part.strip().split(';')
+        coding = fields[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in fields[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def parse_range(header: str | None, size: int):
+    """
+    Parse a single-range Range header
+
+    Returns:
+        None if the header is absent, unsupported or spans several ranges (the
+        full body is sent), 'unsatisfiable' if no byte of the range exists, or an
+        inclusive (start, end) tuple
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    start, _, end = header[len('bytes='):].strip().partition('-')
+    try:
+        if not start:
+            # Suffix range: the last N bytes
+            length = int(end)
+            if length <= 0:
+                return 'unsatisfiable'
+            return (max(size - length, 0), size - 1)
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return 'unsatisfiable'
+    return (start, min(end, size - 1))
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+class CompressedFileCache:
+    """
+    On-disk cache of gzip/brotli encoded copies of static files
+
+    Files are hashed once per (path, size, mtime) and their encoded copies are
+    stored under the content hash, so they survive restarts and are shared by
+    every path with identical content. Encoding streams the file, so memory use
+    does not grow with its size.
+    """
+
+    ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+    def __init__(self, cache_dir: str = DEFAULT_COMPRESSED_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        # path -> (size, mtime, digest) of its current content
+        self._digests = {}
+        # encoded copy path -> lock held while it is written
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def available_encodings(self) -> list:
+        """Encodings this process can produce, in order of preference"""
+        return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+    def digest(self, path: str, stat: os.stat_result) -> str:
+        """Content hash of a file, recomputed only when it changes"""
+        version = (stat.st_size, stat.st_mtime_ns)
+        cached = self._digests.get(path)
+        if cached is not None and cached[:2] == version:
+            return cached[2]
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        self._digests[path] = (*version, digest)
+        return digest
+
+    def _target(self, digest: str, encoding: str) -> str:
+        return os.path.join(self.cache_dir, digest + self.ENCODINGS[encoding])
+
+    def ready_path(self, digest: str, encoding: str) -> str | None:
+        """Path of the encoded copy of a file if it exists, without creating it"""
+        target = self._target(digest, encoding)
+        return target if os.path.exists(target) else None
+
+    def encoded_path(self, path: str, digest: str, encoding: str, best: bool = False) -> str:
+        """
+        Path of the encoded copy of a file, creating it on first use
+
+        best=True encodes at the highest level, for copies made ahead of time.
+        """
+        target = self._target(digest, encoding)
+        if os.path.exists(target):
+            CACHE_LOOKUPS.inc(cache='compressed_files', result='hit')
+            return target
+        CACHE_LOOKUPS.inc(cache='compressed_files', result='miss')
+        with self._lock:
+            lock = self._locks.setdefault(target, threading.Lock())
+        # Only one thread compresses a given file; the others wait for it
+        with lock:
+            if not os.path.exists(target):
+                self._encode(path, target, encoding, best)
+        with self._lock:
+            self._locks.pop(target, None)
+        return target
+
+    def encode_in_background(self, path: str, digest: str, encoding: str):
+        """Start creating the encoded copy of a file unless it exists or is being created"""
+        target = self._target(digest, encoding)
+        with self._lock:
+            if target in self._locks or os.path.exists(target):
+                return
+            lock = self._locks[target] = threading.Lock()
+            lock.acquire()
+        CACHE_LOOKUPS.inc(cache='compressed_files', result='miss')
+
+        def encode():
+            try:
+                self._encode(path, target, encoding, best=False)
+            except Exception as e:
+                print(f"Could not encode {path} as {encoding}: {e}")
+            finally:
+                lock.release()
+                with self._lock:
+                    self._locks.pop(target, None)
+
+        threading.Thread(target=encode, name=f"encode-{encoding}", daemon=True).start()
+
+    def _encode(self, path: str, target: str, encoding: str, best: bool):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+        try:
+            with open(path, 'rb') as source, os.fdopen(fd, 'wb') as out:
+                if encoding == 'gzip':
+                    level = 9 if best else ON_DEMAND_GZIP_LEVEL
+                    with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=level, mtime=0) as gz:
+                        shutil.copyfileobj(source, gz, CHUNK_SIZE)
+                else:
+                    compressor = brotli.Compressor(quality=11 if best else ON_DEMAND_BROTLI_QUALITY)
+                    for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                        out.write(compressor.process(chunk))
+                    out.write(compressor.finish())
+            os.replace(tmp_path, target)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def precompress(self, directory: str):
+        """Encode every compressible file under a directory ahead of time"""
+        for root, _, files in os.walk(directory):
+            for name in files:
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+                if stat.st_size < MIN_COMPRESS_SIZE or not is_compressible(content_type):
+                    continue
+                digest = self.digest(path, stat)
+                for encoding in self.available_encodings():
+                    self.encoded_path(path, digest, encoding, best=True)
+
+
+HTTP_REQUESTS = REGISTRY.counter('crz_http_requests_total', 'HTTP requests by method, route and status',
+                                 ['method', 'route', 'status'])
+HTTP_LATENCY = REGISTRY.histogram('crz_http_request_duration_seconds', 'Time to answer an HTTP request',
+                                  ['method', 'route'])
+
+
+class ProductionRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    Static file handler for production
+
+    Serves precompressed gzip/brotli copies when the client accepts them, tags
+    every representation with a strong content-hash ETag, answers matching
+    If-None-Match requests with 304, supports single byte ranges and sets
+    Cache-Control per path from a list of rules.
+
+    Configure with functools.partial (directory=...) and by setting the class
+    attributes compressed_cache and cache_rules.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    compressed_cache: CompressedFileCache = None
+    cache_rules = DEFAULT_CACHE_RULES
+    allowed_methods = 'GET, HEAD'
+
+    def parse_request(self):
+        # Timed from here rather than handle_one_request, which includes keep-alive idle time
+        self._request_start = time.perf_counter()
+        self._response_status = None
+        return super().parse_request()
+
+    def send_response_only(self, code, message=None):
+        self._response_status = int(code)
+        super().send_response_only(code, message)
+
+    def handle_one_request(self):
+        self._request_start = None
+        super().handle_one_request()
+        if self._request_start is not None and self._response_status is not None:
+            method = self.command or 'UNKNOWN'
+            route = self.metrics_route()
+            HTTP_REQUESTS.inc(method=method, route=route, status=self._response_status)
+            HTTP_LATENCY.observe(time.perf_counter() - self._request_start, method=method, route=route)
+
+    def metrics_route(self) -> str:
+        """Route label for request metrics; all files share one label to keep the series count bounded"""
+        return 'static'
+
+    def end_headers(self):
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', self.allowed_methods)
+        self.send_header('Access-Control-Expose-Headers', 'ETag, Content-Range, Content-Encoding')
+        return super().end_headers()
+
+    def do_GET(self):
+        self.serve_file(send_body=True)
+
+    def do_HEAD(self):
+        self.serve_file(send_body=False)
+
+    def cache_control_for(self, url_path: str) -> str:
+        for pattern, value in self.cache_rules:
+            if fnmatch.fnmatch(url_path, pattern):
+                return value
+        return 'no-cache'
+
+    def send_content(self, body: bytes, content_type: str, status=HTTPStatus.OK, send_body: bool = True):
+        """
+        Send a generated response with a strong ETag, 304 handling and gzip
+
+        Args:
+            body: Uncompressed response body
+            content_type: Value of the Content-Type header
+            status: HTTP status for the full response
+            send_body: False for HEAD requests
+        """
+        url_path = self.path.split('?', 1)[0]
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        encoding = None
+        if len(body) >= MIN_COMPRESS_SIZE and is_compressible(content_type):
+            accepted = parse_accept_encoding(self.headers.get('Accept-Encoding'))
+            if accepted.get('gzip', accepted.get('*', 0)) > 0:
+                encoding = 'gzip'
+                etag = etag[:-1] + '-gzip"'
+
+        common_headers = [
+            ('ETag', etag),
+            ('Cache-Control', self.cache_control_for(url_path)),
+            ('Vary', 'Accept-Encoding'),
+        ]
+        if status == HTTPStatus.OK and etag_matches(self.headers.get('If-None-Match'), etag):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            for name, value in common_headers:
+                self.send_header(name, value)
+            self.end_headers()
+            return
+
+        if encoding:
+            # Generated bodies change often; a fast level beats a small one here
+            body = gzip.compress(body, compresslevel=5, mtime=0)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        for name, value in common_headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def serve_file(self, send_body: bool):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            # Directories, index pages and 404s keep the stock behaviour
+            if send_body:
+                return super().do_GET()
+            return super().do_HEAD()
+
+        url_path = self.path.split('?', 1)[0].split('#', 1)[0]
+        stat = os.stat(path)
+        digest = self.compressed_cache.digest(path, stat)
+        content_type = self.guess_type(path)
+
+        # Pick the representation; ranges are only served from the identity body
+        encoding = None
+        body_path = path
+        range_header = self.headers.get('Range')
+        if (stat.st_size >= MIN_COMPRESS_SIZE and is_compressible(content_type)
+                and range_header is None):
+            accepted = parse_accept_encoding(self.headers.get('Accept-Encoding'))
+            candidates = [candidate for candidate in self.compressed_cache.available_encodings()
+                          if accepted.get(candidate, accepted.get('*', 0)) > 0]
+            if candidates and stat.st_size < BACKGROUND_COMPRESS_SIZE:
+                encoding = candidates[0]
+                body_path = self.compressed_cache.encoded_path(path, digest, encoding)
+            elif candidates:
+                # A large file is not encoded while the request waits: send the best copy
+                # that is ready, and have the preferred one made for later requests
+                for candidate in candidates:
+                    ready = self.compressed_cache.ready_path(digest, candidate)
+                    if ready:
+                        encoding, body_path = candidate, ready
+                        break
+                if encoding != candidates[0]:
+                    self.compressed_cache.encode_in_background(path, digest, candidates[0])
+
+        if encoding:
+            etag = f'"{digest[:32]}-{encoding}"'
+        else:
+            etag = f'"{digest[:32]}"'
+        size = os.path.getsize(body_path)
+
+        common_headers = [
+            ('ETag', etag),
+            ('Last-Modified', email.utils.formatdate(stat.st_mtime, usegmt=True)),
+            ('Cache-Control', self.cache_control_for(url_path)),
+            ('Vary', 'Accept-Encoding'),
+            ('Accept-Ranges', 'bytes'),
+        ]
+
+        if etag_matches(self.headers.get('If-None-Match'), etag):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            for name, value in common_headers:
+                self.send_header(name, value)
+            self.end_headers()
+            return
+
+        byte_range = None
+        if encoding is None:
+            byte_range = parse_range(range_header, size)
+            if_range = self.headers.get('If-Range')
+            if if_range is not None and if_range.strip() != etag:
+                # The client's copy is stale: send the whole file
+                byte_range = None
+
+        if byte_range == 'unsatisfiable':
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if byte_range:
+            start, end = byte_range
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            start, end = 0, size - 1
+            self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(end - start + 1))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        for name, value in common_headers:
+            self.send_header(name, value)
+        self.end_headers()
+
+        if send_body:
+            with open(body_path, 'rb') as f:
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+
+
+class ProductionHTTPServer(http.server.ThreadingHTTPServer):
+    """Thread-per-request HTTP server whose worker threads exit with the process"""
+    daemon_threads = True
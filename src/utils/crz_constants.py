@@ -0,0 +1,45 @@
+"""Known values of the categorical columns in the MTA CRZ dataset (see infor.md)"""
+
+# Detection Group -> Detection Region
+DETECTION_GROUPS = {
+    'Brooklyn Bridge': 'Brooklyn',
+    'Manhattan Bridge': 'Brooklyn',
+    'Williamsburg Bridge': 'Brooklyn',
+    'Hugh L. Carey Tunnel': 'Brooklyn',
+    'Holland Tunnel': 'New Jersey',
+    'Lincoln Tunnel': 'New Jersey',
+    'Queensboro Bridge': 'Queens',
+    'Queens Midtown Tunnel': 'Queens',
+    'East 60th St': 'East 60th St',
+    'FDR Drive at 60th St': 'FDR Drive',
+    'West 60th St': 'West 60th St',
+    'West Side Highway at 60th St': 'West Side Highway',
+}
+
+DETECTION_REGIONS = sorted(set(DETECTION_GROUPS.values()))
+
+VEHICLE_CLASSES = [
+    '1 - Cars, Pickups and Vans',
+    '2 - Single-Unit Trucks',
+    '3 - Multi-Unit Trucks',
+    '4 - Buses',
+    '5 - Motorcycles',
+    'TLC Taxi/FHV',
+]
+
+# Day of Week Int (1 = Sunday ... 7 = Saturday) -> Day of Week
+DAY_NAMES = {
+    1: 'Sunday',
+    2: 'Monday',
+    3: 'Tuesday',
+    4: 'Wednesday',
+    5: 'Thursday',
+    6: 'Friday',
+    7: 'Saturday',
+}
+
+# Peak toll hours, [start, end): 5am-9pm on weekdays, 9am-9pm on weekends
+WEEKDAY_PEAK_HOURS = (5, 21)
+WEEKEND_PEAK_HOURS = (9, 21)
+
+TIME_PERIODS = ['Peak', 'Overnight']
@@ -1,9 +1,35 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+import itertools
+import os
+import threading
 import warnings
+from src.utils.metrics import CACHE_LOOKUPS, REGISTRY
+from src.utils.process_stats import current_rss_bytes
 warnings.filterwarnings('ignore')
 
+DEFAULT_DATA_PATH = "data/MTA_Congestion_Relief_Zone_Vehicle_Entries__Beginning_2025_20250404.csv"
+
+# Draw the stratified sample as soon as a dataset is loaded; CRZ_SAMPLE_AT_LOAD=0 draws it on first use
+SAMPLE_AT_LOAD = os.getenv("CRZ_SAMPLE_AT_LOAD", "1").lower() in ("1", "true", "yes")
+
+# Key of the dataset version in df.attrs: caches built from a dataset's rows (e.g. the
+# filter masks of src.workflow.filter_masks) are only reused for the same version
+DATA_VERSION_ATTR = 'crz_version'
+_data_versions = itertools.count(1)
+
+# file path -> (modification time, df, aggregations)
+_loaded_data = {}
+_load_lock = threading.Lock()
+
+DATASET_ROWS = REGISTRY.gauge('crz_dataset_rows', 'Rows in each loaded dataset', ['path'])
+DATASET_BYTES = REGISTRY.gauge('crz_dataset_memory_bytes', 'Memory used by each loaded dataset', ['path'])
+DATASET_LOAD_SECONDS = REGISTRY.histogram('crz_dataset_load_seconds', 'Time to load and process a dataset',
+                                          buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+REGISTRY.gauge('crz_process_resident_memory_bytes', 'Resident set size of this process',
+               function=current_rss_bytes)
+
 def load_and_process_data(file_path):
     """
     Load and process MTA Congestion Relief Zone data with comprehensive cleaning and feature engineering
@@ -11,7 +37,14 @@ def load_and_process_data(file_path):
     # Load data
     print(f"Loading data from {file_path}...")
     df = pd.read_csv(file_path)
+    return process_data(df)
+
+def process_data(df):
+    """
+    Clean and add derived columns to raw MTA Congestion Relief Zone data (as read from the CSV)
     
+    Returns the processed dataframe and a dictionary of aggregate views.
+    """
     # Convert date and time columns to appropriate types
     date_columns = ['Toll Date', 'Toll Week']
     for col in date_columns:
@@ -74,5 +107,53 @@ def load_and_process_data(file_path):
         'entry_point': entry_point_entries
     }
     
+    bump_data_version(df)
     print(f"Processed {df.shape[0]} records with {df.shape[1]} features")
-    return df, aggregations 
\ No newline at end of file
+    return df, aggregations
+
+def bump_data_version(df):
+    """
+    Give a processed dataset a new version, so caches built from its rows are rebuilt
+    
+    process_data versions every dataset it returns; call this after editing one in place.
+    """
+    df.attrs[DATA_VERSION_ATTR] = next(_data_versions)
+    return df.attrs[DATA_VERSION_ATTR]
+
+def data_version(df) -> tuple:
+    """
+    Token that changes whenever a dataset's rows may have: its version and row count
+    
+    Caches keyed by dataframe identity (filter masks, date index, Arrow snapshot,
+    sample, SQL schema) rebuild their entry when it changes. Frames without a
+    version fall back to their row count.
+    """
+    return df.attrs.get(DATA_VERSION_ATTR), len(df)
+
+def get_processed_data(file_path=DEFAULT_DATA_PATH):
+    """
+    Return the processed dataset for a file, loading it only once per process
+    
+    The result of load_and_process_data is kept in memory and shared by every
+    caller (workflow runs, the data server); the file is reloaded only when its
+    modification time changes. Callers must treat the returned frames as read-only.
+    """
+    mtime = os.path.getmtime(file_path)
+    with _load_lock:
+        cached = _loaded_data.get(file_path)
+        if cached is None or cached[0] != mtime:
+            CACHE_LOOKUPS.inc(cache='dataset', result='miss')
+            with DATASET_LOAD_SECONDS.time():
+                df, aggregations = load_and_process_data(file_path)
+            cached = (mtime, df, aggregations)
+            _loaded_data[file_path] = cached
+            DATASET_ROWS.set(len(df), path=file_path)
+            DATASET_BYTES.set(int(df.memory_usage(deep=True).sum()), path=file_path)
+            if SAMPLE_AT_LOAD:
+                # Imported here: sampling imports this module
+                from src.utils.sampling import get_sample
+                # Approximate answers (src.workflow.approximate) then never wait for the sample
+                get_sample(df)
+        else:
+            CACHE_LOOKUPS.inc(cache='dataset', result='hit')
+    return cached[1], cached[2]
@@ -0,0 +1,48 @@
+"""
+Request deadlines shared down the call chain
+
+A deadline set with deadline(seconds) applies to everything called inside
+the block, including threads started with contextvars.copy_context(), so
+later stages of a workflow only get the time that is left. Nested deadlines
+can only shorten the current one.
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+
+_deadline = contextvars.ContextVar('crz_deadline', default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's time budget ran out"""
+
+
+@contextmanager
+def deadline(seconds: float | None):
+    """Limit the block (and the calls it makes) to a number of seconds; None adds no limit"""
+    if seconds is None:
+        yield
+        return
+    new_deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(new_deadline if current is None else min(current, new_deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def deadline_at(timeout: float | None = None) -> float | None:
+    """Monotonic time by which work must finish: the current deadline, or sooner with a timeout"""
+    current = _deadline.get()
+    if timeout is None:
+        return current
+    own = time.monotonic() + timeout
+    return own if current is None else min(current, own)
+
+
+def remaining_time() -> float | None:
+    """Seconds left before the current deadline, or None without one"""
+    current = _deadline.get()
+    return None if current is None else current - time.monotonic()
@@ -0,0 +1,78 @@
+"""Process memory measurements for benchmarks and metrics"""
+
+import os
+import resource
+import sys
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:  # psutil is optional; /proc or getrusage are used instead
+    psutil = None
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process since it started"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def current_rss_bytes() -> int:
+    """Current resident set size of this process"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    # No way to read the current value: the peak is the closest upper bound
+    return peak_rss_bytes()
+
+
+class RSSSampler:
+    """
+    Background thread recording the resident set size at a fixed interval
+
+    Usage:
+        with RSSSampler(interval=0.01) as sampler:
+            run_workload()
+        print(sampler.peak, sampler.samples)
+    """
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples = []  # (seconds since start, rss bytes)
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._start = None
+
+    def _record(self):
+        rss = current_rss_bytes()
+        self.samples.append((time.perf_counter() - self._start, rss))
+        self.peak = max(self.peak, rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._record()
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._record()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._record()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,285 @@
+"""
+Opt-in profiling of workflow runs and tool calls
+
+A profiled request records a cProfile call graph and the top tracemalloc
+allocations, saved with the request parameters to the profile directory:
+
+    <id>.prof   pstats data (python -m pstats, snakeviz, ...)
+    <id>.json   name, parameters, duration, top functions and allocations
+
+Enable per request (profile=True on run_workflow / execute_crz_function) or
+through the environment:
+
+    CRZ_PROFILE=1                   profile every request
+    CRZ_PROFILE_SAMPLE_RATE=0.01    profile a random 1% of requests
+    CRZ_PROFILE_DIR=profiles        where profiles are written
+    CRZ_PROFILE_MEMORY=0            skip tracemalloc (it slows Python code 2-4x)
+
+Only one request is profiled at a time; nested requests (the tool call inside
+a profiled workflow) are part of the outer profile.
+
+Usage:
+    python -m src.utils.profiling list
+    python -m src.utils.profiling show <id>
+    python -m src.utils.profiling diff <id> <other id>
+"""
+
+import argparse
+import contextvars
+import cProfile
+import glob
+import json
+import os
+import pstats
+import random
+import secrets
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+_config = {
+    'enabled': os.getenv('CRZ_PROFILE', '0').lower() in ('1', 'true', 'yes', 'always'),
+    'sample_rate': float(os.getenv('CRZ_PROFILE_SAMPLE_RATE', '0') or 0),
+    'directory': os.getenv('CRZ_PROFILE_DIR', 'profiles'),
+    'memory': os.getenv('CRZ_PROFILE_MEMORY', '1').lower() not in ('0', 'false', 'no'),
+}
+
+# Functions and allocation sites kept in the JSON summary
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+_active = contextvars.ContextVar('crz_active_profile', default=False)
+_profile_lock = threading.Lock()
+
+
+def configure_profiling(enabled: bool | None = None, sample_rate: float | None = None,
+                        directory: str | None = None, memory: bool | None = None):
+    """Override the CRZ_PROFILE* environment settings; None keeps the current value"""
+    if sample_rate is not None and not 0 <= sample_rate <= 1:
+        raise ValueError("sample_rate must be between 0 and 1")
+    for key, value in (('enabled', enabled), ('sample_rate', sample_rate),
+                       ('directory', directory), ('memory', memory)):
+        if value is not None:
+            _config[key] = value
+
+
+def should_profile(force: bool = False) -> bool:
+    """Whether a new request is profiled: forced, always-on, or sampled"""
+    if _active.get():
+        return False
+    if force or _config['enabled']:
+        return True
+    return _config['sample_rate'] > 0 and random.random() < _config['sample_rate']
+
+
+def _function_label(func: tuple) -> str:
+    filename, line, name = func
+    return f"{filename}:{line}({name})" if line else name
+
+
+def summarize_stats(stats: pstats.Stats, limit: int = TOP_FUNCTIONS) -> list:
+    """Functions with the largest cumulative time, as JSON-ready records"""
+    rows = []
+    for func, (primitive_calls, calls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            'function': _function_label(func),
+            'calls': calls,
+            'primitive_calls': primitive_calls,
+            'tottime_s': tottime,
+            'cumtime_s': cumtime,
+        })
+    rows.sort(key=lambda row: row['cumtime_s'], reverse=True)
+    return rows[:limit]
+
+
+def summarize_allocations(snapshot: tracemalloc.Snapshot, limit: int = TOP_ALLOCATIONS) -> list:
+    """Allocation sites holding the most memory when the request finished"""
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+    return [{
+        'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+        'size_bytes': stat.size,
+        'count': stat.count,
+    } for stat in snapshot.statistics('lineno')[:limit]]
+
+
+@contextmanager
+def profile_request(name: str, params=None, force: bool = False):
+    """
+    Profile a block if profiling is forced, enabled or sampled for this request
+
+    Args:
+        name: Request kind, e.g. the tool or "run_workflow"
+        params: Request parameters saved with the profile (JSON-serializable or str-able)
+        force: Profile this request regardless of the configured sample rate
+
+    Yields:
+        The profile id when this block is profiled, otherwise None
+    """
+    if not should_profile(force) or not _profile_lock.acquire(blocking=False):
+        yield None
+        return
+
+    profile_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{name}-{secrets.token_hex(3)}"
+    token = _active.set(True)
+    trace_memory = _config['memory'] and not tracemalloc.is_tracing()
+    profiler = cProfile.Profile()
+    error = None
+    try:
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger) owns this thread; run unprofiled
+            profiler = None
+        try:
+            yield profile_id
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            duration = time.perf_counter() - start
+            allocations, peak = [], None
+            if trace_memory:
+                allocations = summarize_allocations(tracemalloc.take_snapshot())
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            if profiler is not None:
+                try:
+                    save_profile(profile_id, name, params, duration, profiler, allocations, peak, error)
+                except OSError as e:
+                    print(f"Could not save profile {profile_id}: {e}")
+    finally:
+        _active.reset(token)
+        _profile_lock.release()
+
+
+def save_profile(profile_id: str, name: str, params, duration: float, profiler: cProfile.Profile,
+                 allocations: list, peak_traced_bytes: int | None, error: str | None):
+    """Write the pstats file and JSON summary of a profiled request"""
+    directory = _config['directory']
+    os.makedirs(directory, exist_ok=True)
+    profiler.dump_stats(os.path.join(directory, profile_id + '.prof'))
+    stats = pstats.Stats(profiler)
+    summary = {
+        'id': profile_id,
+        'name': name,
+        'params': params,
+        'created': datetime.now(timezone.utc).isoformat(),
+        'duration_s': duration,
+        'error': error,
+        'peak_traced_bytes': peak_traced_bytes,
+        'top_functions': summarize_stats(stats),
+        'top_allocations': allocations,
+    }
+    with open(os.path.join(directory, profile_id + '.json'), 'w') as f:
+        json.dump(summary, f, indent=2, default=str)
+
+
+def list_profiles(directory: str) -> list:
+    """Summaries of the saved profiles, oldest first"""
+    profiles = []
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        with open(path) as f:
+            profiles.append(json.load(f))
+    return sorted(profiles, key=lambda summary: summary['created'])
+
+
+def load_profile(directory: str, profile_id: str) -> tuple:
+    """
+    Load a saved profile by id or unique id prefix
+
+    Returns:
+        (summary dict, pstats.Stats)
+    """
+    matches = glob.glob(os.path.join(directory, profile_id + '*.json'))
+    if len(matches) != 1:
+        raise ValueError(f"{len(matches)} profiles match {profile_id!r} in {directory}")
+    with open(matches[0]) as f:
+        summary = json.load(f)
+    return summary, pstats.Stats(os.path.join(directory, summary['id'] + '.prof'))
+
+
+def diff_profiles(stats_a: pstats.Stats, stats_b: pstats.Stats, limit: int = 20) -> list:
+    """
+    Functions whose cumulative time changed most between two profiles
+
+    Returns:
+        List of (function, cumtime in a, cumtime in b, calls in a, calls in b)
+    """
+    functions = set(stats_a.stats) | set(stats_b.stats)
+    rows = []
+    for func in functions:
+        a = stats_a.stats.get(func, (0, 0, 0, 0, None))
+        b = stats_b.stats.get(func, (0, 0, 0, 0, None))
+        rows.append((_function_label(func), a[3], b[3], a[1], b[1]))
+    rows.sort(key=lambda row: abs(row[2] - row[1]), reverse=True)
+    return rows[:limit]
+
+
+def diff_allocations(summary_a: dict, summary_b: dict, limit: int = 20) -> list:
+    """Allocation sites whose retained size changed most: (location, bytes in a, bytes in b)"""
+    sizes_a = {item['location']: item['size_bytes'] for item in summary_a['top_allocations']}
+    sizes_b = {item['location']: item['size_bytes'] for item in summary_b['top_allocations']}
+    rows = [(location, sizes_a.get(location, 0), sizes_b.get(location, 0))
+            for location in set(sizes_a) | set(sizes_b)]
+    rows.sort(key=lambda row: abs(row[2] - row[1]), reverse=True)
+    return rows[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List, inspect and diff saved CRZ request profiles")
+    parser.add_argument('--dir', default=_config['directory'], help="Profile directory (default: CRZ_PROFILE_DIR)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help="List saved profiles")
+    show = subparsers.add_parser('show', help="Top functions and allocations of one profile")
+    show.add_argument('id')
+    show.add_argument('--top', type=int, default=20)
+    diff = subparsers.add_parser('diff', help="Compare two profiles")
+    diff.add_argument('a')
+    diff.add_argument('b')
+    diff.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for summary in list_profiles(args.dir):
+            params = json.dumps(summary['params'], default=str)
+            status = ' ERROR' if summary.get('error') else ''
+            print(f"{summary['id']:<60} {summary['duration_s'] * 1000:10.1f} ms{status}  {params[:80]}")
+    elif args.command == 'show':
+        summary, stats = load_profile(args.dir, args.id)
+        print(f"{summary['id']}: {summary['name']} {summary['duration_s'] * 1000:.1f} ms")
+        print(f"Parameters: {json.dumps(summary['params'], default=str)}")
+        if summary.get('error'):
+            print(f"Error: {summary['error']}")
+        stats.sort_stats('cumulative').print_stats(args.top)
+        if summary['top_allocations']:
+            print(f"Peak traced memory: {summary['peak_traced_bytes'] / 2**20:.1f} MiB")
+            for item in summary['top_allocations'][:args.top]:
+                print(f"{item['size_bytes'] / 2**10:12.1f} KiB {item['count']:8} blocks  {item['location']}")
+    else:
+        summary_a, stats_a = load_profile(args.dir, args.a)
+        summary_b, stats_b = load_profile(args.dir, args.b)
+        print(f"A: {summary_a['id']} {summary_a['duration_s'] * 1000:.1f} ms")
+        print(f"B: {summary_b['id']} {summary_b['duration_s'] * 1000:.1f} ms")
+        print(f"\n{'cumtime A':>12} {'cumtime B':>12} {'delta':>12} {'calls A':>9} {'calls B':>9}  function")
+        for label, time_a, time_b, calls_a, calls_b in diff_profiles(stats_a, stats_b, args.top):
+            print(f"{time_a * 1000:10.1f}ms {time_b * 1000:10.1f}ms {(time_b - time_a) * 1000:+10.1f}ms "
+                  f"{calls_a:9} {calls_b:9}  {label}")
+        allocations = diff_allocations(summary_a, summary_b, args.top)
+        if allocations:
+            print(f"\n{'bytes A':>12} {'bytes B':>12} {'delta':>12}  location")
+            for location, size_a, size_b in allocations:
+                print(f"{size_a:12} {size_b:12} {size_b - size_a:+12}  {location}")
+
+
+if __name__ == '__main__':
+    main()
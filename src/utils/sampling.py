@@ -0,0 +1,126 @@
+"""
+Stratified samples of the CRZ dataset for approximate answers
+
+Rows are stratified by date, detection group and vehicle class, and a fixed
+fraction of each stratum (at least MIN_PER_STRATUM rows) is drawn without
+replacement. Every sampled row carries its Horvitz-Thompson weight N_h / n_h,
+and the entry columns are stored multiplied by it, so a sum over sampled rows
+estimates the same sum over the full dataset.
+
+The sample is split into blocks, each a random share of every stratum. The
+first k blocks, with the entries scaled by blocks / k, are a smaller sample
+of the same design; the spread of the estimates from single blocks gives
+their standard error (random groups). See src.workflow.approximate.
+"""
+
+import os
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from src.utils.data_loader import data_version
+
+# Columns the strata are built from
+STRATA_COLUMNS = ['Toll Date', 'Detection Group', 'Vehicle Class']
+# Summed columns, stored weighted
+WEIGHTED_COLUMNS = ['CRZ Entries', 'Excluded Roadway Entries']
+
+SAMPLE_FRACTION = float(os.getenv("CRZ_SAMPLE_FRACTION", "0.05"))
+SAMPLE_BLOCKS = int(os.getenv("CRZ_SAMPLE_BLOCKS", "16"))
+# Two rows per stratum keep every stratum's variance estimable
+MIN_PER_STRATUM = 2
+
+# id(df) -> (data_version, sample), dropped when the dataframe is garbage collected
+_samples = {}
+_samples_lock = threading.Lock()
+
+
+class StratifiedSample:
+    """A weighted sample of a dataset, ordered by block"""
+
+    def __init__(self, frame: pd.DataFrame, block_ends: np.ndarray, population_rows: int, strata: int):
+        self.frame = frame
+        self.block_ends = block_ends
+        self.blocks = len(block_ends)
+        self.population_rows = population_rows
+        self.strata = strata
+
+    def block_range(self, first: int, last: int) -> tuple:
+        """Row positions [start, stop) of blocks first..last-1"""
+        start = 0 if first == 0 else int(self.block_ends[first - 1])
+        return start, int(self.block_ends[last - 1])
+
+    def blocks_frame(self, first: int, last: int) -> pd.DataFrame:
+        """
+        Blocks first..last-1 as a sample of their own
+
+        The weighted columns are scaled by blocks / (last - first), so sums
+        estimate the full dataset's.
+        """
+        start, stop = self.block_range(first, last)
+        part = self.frame.iloc[start:stop]
+        scale = self.blocks / (last - first)
+        return part.assign(**{column: part[column] * scale for column in WEIGHTED_COLUMNS if column in part})
+
+
+def build_stratified_sample(df: pd.DataFrame, fraction: float = SAMPLE_FRACTION, blocks: int = SAMPLE_BLOCKS,
+                            seed: int = 0) -> StratifiedSample:
+    """
+    Draw a stratified sample of df
+
+    Args:
+        df: Processed CRZ dataset
+        fraction: Share of each stratum to sample
+        blocks: Number of blocks the sample is split into
+        seed: Random seed
+
+    Returns:
+        StratifiedSample whose frame has the columns of df, the entry columns
+        multiplied by each row's weight, a _weight column and a _block column
+    """
+    rng = np.random.default_rng(seed)
+    strata = df.groupby(STRATA_COLUMNS, sort=False, observed=True).ngroup().to_numpy()
+    population = np.bincount(strata)
+    sampled = np.minimum(population, np.maximum(MIN_PER_STRATUM, np.round(population * fraction))).astype(np.int64)
+
+    # Rows grouped by stratum in random order; the first n_h of each are sampled
+    order = np.lexsort((rng.random(len(df)), strata))
+    ordered_strata = strata[order]
+    starts = np.concatenate(([0], np.cumsum(population)[:-1]))
+    rank = np.arange(len(df)) - starts[ordered_strata]
+    keep = rank < sampled[ordered_strata]
+    rows, row_strata, rank = order[keep], ordered_strata[keep], rank[keep]
+
+    # Deal each stratum's rows round the blocks from a random starting block
+    offsets = rng.integers(0, blocks, size=len(population))
+    block = (rank + offsets[row_strata]) % blocks
+    by_block = np.argsort(block, kind='stable')
+    rows, row_strata, block = rows[by_block], row_strata[by_block], block[by_block]
+
+    weight = population[row_strata] / sampled[row_strata]
+    frame = df.iloc[rows].reset_index(drop=True)
+    for column in WEIGHTED_COLUMNS:
+        if column in frame:
+            frame[column] = frame[column].to_numpy() * weight
+    frame['_weight'] = weight
+    frame['_block'] = block
+    block_ends = np.searchsorted(block, np.arange(blocks), side='right')
+    return StratifiedSample(frame, block_ends, len(df), len(population))
+
+
+def get_sample(df: pd.DataFrame) -> StratifiedSample:
+    """The stratified sample of a dataset, drawn on first use and for each new dataset version"""
+    key = id(df)
+    version = data_version(df)
+    with _samples_lock:
+        cached = _samples.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+    sample = build_stratified_sample(df)
+    with _samples_lock:
+        if key not in _samples:
+            weakref.finalize(df, _samples.pop, key, None)
+        _samples[key] = (version, sample)
+    return sample
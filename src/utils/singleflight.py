@@ -0,0 +1,98 @@
+"""
+Single-flight coalescing of identical concurrent calls
+
+When a call with some key is already running, later callers with the same
+key wait for it and receive a deep copy of its result (or its exception)
+instead of doing the same work again. Nothing is kept once the call returns,
+so this only merges calls that overlap in time; it is not a cache.
+
+Usage:
+    TOOL_FLIGHTS = SingleFlight('tool')
+    result = TOOL_FLIGHTS.do(key, compute, arg1, arg2)
+"""
+
+import copy
+import threading
+
+from src.utils.deadline import DeadlineExceeded, remaining_time
+from src.utils.metrics import REGISTRY
+from src.utils.tracing import set_attribute
+
+SINGLEFLIGHT_CALLS = REGISTRY.counter('crz_singleflight_calls_total',
+                                      'Coalescable calls by group and role (leader ran it, follower shared it)',
+                                      ['group', 'role'])
+SINGLEFLIGHT_IN_FLIGHT = REGISTRY.gauge('crz_singleflight_in_flight', 'Distinct calls currently running',
+                                        ['group'])
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+        # One copy per follower, made by the leader before its caller can modify the result
+        self.copies = []
+
+
+class SingleFlight:
+    """A group of coalesced calls; keys only need to be unique within the group"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function, *args, **kwargs):
+        """
+        Run function(*args, **kwargs), or wait for the identical call already running
+
+        Followers mark the current trace span as coalesced, and wait at most until
+        the current deadline (src.utils.deadline) before raising DeadlineExceeded;
+        the leader's call carries on.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                SINGLEFLIGHT_IN_FLIGHT.inc(group=self.name)
+            else:
+                call.followers += 1
+        SINGLEFLIGHT_CALLS.inc(group=self.name, role='leader' if leader else 'follower')
+
+        if not leader:
+            set_attribute("coalesced", True)
+            if not call.done.wait(remaining_time()):
+                raise DeadlineExceeded(f"deadline passed waiting for an in-flight {self.name} call")
+            if call.error is not None:
+                raise call.error
+            with self._lock:
+                return call.copies.pop()
+
+        try:
+            call.result = function(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                # No followers can join after this, so the count is final
+                del self._calls[key]
+                SINGLEFLIGHT_IN_FLIGHT.dec(group=self.name)
+            if call.error is None:
+                call.copies = [copy.deepcopy(call.result) for _ in range(call.followers)]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+def coalescing_rate(group: str) -> float:
+    """Share of a group's calls that were served by another caller's computation"""
+    leaders = SINGLEFLIGHT_CALLS.value(group=group, role='leader')
+    followers = SINGLEFLIGHT_CALLS.value(group=group, role='follower')
+    total = leaders + followers
+    return followers / total if total else 0.0
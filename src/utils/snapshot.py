@@ -0,0 +1,100 @@
+"""Columnar Arrow snapshot of the processed CRZ dataset"""
+
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from src.utils.data_loader import data_version
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow is optional; callers check arrow_available()
+    pa = None
+
+ARROW_STREAM_CONTENT_TYPE = 'application/vnd.apache.arrow.stream'
+
+# Rows per record batch in IPC streams
+IPC_BATCH_SIZE = 64 * 1024
+
+# id(dataframe) -> (data_version, ColumnarSnapshot), dropped when the dataframe is garbage collected
+_snapshots = {}
+_snapshot_lock = threading.Lock()
+
+
+def arrow_available() -> bool:
+    return pa is not None
+
+
+class ColumnarSnapshot:
+    """
+    Immutable Arrow copy of a processed dataframe, sorted by 'Toll Date'
+
+    Sorting makes every date range a contiguous block of rows, so date and
+    column selections are zero-copy slices of the snapshot's buffers.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        if pa is None:
+            raise ImportError("pyarrow is required for columnar snapshots")
+        df = df.sort_values('Toll Date', kind='stable').reset_index(drop=True)
+        self.table = pa.Table.from_pandas(df, preserve_index=False)
+        self.dates = df['Toll Date'].to_numpy()
+        self.num_rows = self.table.num_rows
+
+    def select(self, start_date=None, end_date=None, columns=None):
+        """
+        Zero-copy view of the rows between two dates (inclusive) and some columns
+
+        Args:
+            start_date: First date to include, in 'YYYY-MM-DD' format
+            end_date: Last date to include, in 'YYYY-MM-DD' format
+            columns: Column names to keep (default: all)
+
+        Returns:
+            pyarrow.Table sharing memory with the snapshot
+        """
+        start = 0
+        stop = self.num_rows
+        if start_date:
+            start = int(np.searchsorted(self.dates, np.datetime64(pd.to_datetime(start_date)), side='left'))
+        if end_date:
+            stop = int(np.searchsorted(self.dates, np.datetime64(pd.to_datetime(end_date)), side='right'))
+        table = self.table.slice(start, max(stop - start, 0))
+        if columns:
+            missing = [column for column in columns if column not in table.column_names]
+            if missing:
+                raise KeyError(f"Unknown columns: {', '.join(missing)}")
+            table = table.select(columns)
+        return table
+
+
+def get_columnar_snapshot(df: pd.DataFrame) -> ColumnarSnapshot:
+    """Return the Arrow snapshot of a dataframe, building it on first use and for each new dataset version"""
+    key = id(df)
+    version = data_version(df)
+    with _snapshot_lock:
+        cached = _snapshots.get(key)
+        if cached is None or cached[0] != version:
+            if cached is None:
+                weakref.finalize(df, _snapshots.pop, key, None)
+            cached = (version, ColumnarSnapshot(df))
+            _snapshots[key] = cached
+    return cached[1]
+
+
+def records_to_table(records: list, metadata: dict | None = None):
+    """Build an Arrow table from a list of result rows, with optional string metadata"""
+    table = pa.Table.from_pylist(records)
+    if metadata:
+        table = table.replace_schema_metadata({key: str(value) for key, value in metadata.items()})
+    return table
+
+
+def table_to_ipc_stream(table) -> bytes:
+    """Serialize an Arrow table as an IPC stream"""
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table, max_chunksize=IPC_BATCH_SIZE)
+    return sink.getvalue().to_pybytes()
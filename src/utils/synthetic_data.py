@@ -0,0 +1,154 @@
+"""Synthetic MTA CRZ data with the schema described in infor.md, for benchmarks and offline runs"""
+
+import numpy as np
+import pandas as pd
+
+from src.utils.crz_constants import (DAY_NAMES, DETECTION_GROUPS, VEHICLE_CLASSES,
+                                     WEEKDAY_PEAK_HOURS, WEEKEND_PEAK_HOURS)
+
+COLUMNS = [
+    'Toll Date', 'Toll Hour', 'Toll 10 Minute Block', 'Minute of Hour', 'Hour of Day',
+    'Day of Week Int', 'Day of Week', 'Toll Week', 'Time Period', 'Vehicle Class',
+    'Detection Group', 'Detection Region', 'CRZ Entries', 'Excluded Roadway Entries',
+]
+
+BLOCKS_PER_DAY = 144  # 10-minute blocks
+
+GROUP_NAMES = list(DETECTION_GROUPS)
+REGION_NAMES = [DETECTION_GROUPS[group] for group in GROUP_NAMES]
+
+# One row per 10-minute block, detection group and vehicle class
+ROWS_PER_DAY = BLOCKS_PER_DAY * len(GROUP_NAMES) * len(VEHICLE_CLASSES)
+
+# Relative traffic of each detection group
+GROUP_WEIGHTS = np.array([0.9, 0.8, 1.0, 0.7, 1.1, 1.4, 1.5, 0.9, 0.6, 1.2, 0.7, 1.3])
+
+# Share of entries by vehicle class
+CLASS_SHARES = np.array([0.74, 0.06, 0.02, 0.015, 0.005, 0.16])
+
+# Share of a group's entries that stay on excluded roadways (FDR Drive, West Side Highway)
+EXCLUDED_SHARES = np.array([
+    0.6 if region in ('FDR Drive', 'West Side Highway') else 0.02 for region in REGION_NAMES
+])
+
+# Relative traffic by hour of day on weekdays and weekends
+WEEKDAY_HOURLY = np.array([0.25, 0.15, 0.1, 0.1, 0.15, 0.35, 0.75, 1.3, 1.6, 1.45, 1.2, 1.15,
+                           1.15, 1.2, 1.3, 1.45, 1.55, 1.5, 1.3, 1.05, 0.85, 0.7, 0.55, 0.4])
+WEEKEND_HOURLY = np.array([0.45, 0.35, 0.25, 0.2, 0.15, 0.2, 0.3, 0.45, 0.65, 0.85, 1.0, 1.1,
+                           1.15, 1.15, 1.15, 1.1, 1.05, 1.0, 0.95, 0.9, 0.85, 0.8, 0.7, 0.55])
+
+# Mean CRZ entries per 10-minute block for a group of weight 1, all classes together
+BASE_ENTRIES_PER_BLOCK = 300.0
+
+
+def generate_crz_chunk(start_row: int, stop_row: int, start_date='2025-01-05', seed: int = 0) -> pd.DataFrame:
+    """
+    Generate rows [start_row, stop_row) of a synthetic CRZ dataset
+
+    Rows are ordered by date, 10-minute block, detection group and vehicle class,
+    like the published dataset, so large datasets can be produced piece by piece.
+    Output is deterministic for a given seed and chunking.
+
+    Args:
+        start_row: First row number
+        stop_row: One past the last row number
+        start_date: Date of row 0
+        seed: Random seed
+
+    Returns:
+        pandas.DataFrame with the raw dataset columns (dates as datetimes)
+    """
+    rows = np.arange(start_row, stop_row, dtype=np.int64)
+    day, rest = np.divmod(rows, ROWS_PER_DAY)
+    block, rest = np.divmod(rest, len(GROUP_NAMES) * len(VEHICLE_CLASSES))
+    group, vehicle = np.divmod(rest, len(VEHICLE_CLASSES))
+
+    dates = (np.datetime64(pd.Timestamp(start_date).date(), 'D') + day).astype('datetime64[ns]')
+    block_start = dates + (block * 10).astype('timedelta64[m]')
+    hour = block // 6
+    minute = (block % 6) * 10
+
+    # pandas: Monday = 0; dataset: Sunday = 1 ... Saturday = 7
+    weekday = pd.DatetimeIndex(dates).dayofweek.to_numpy()
+    day_of_week_int = (weekday + 1) % 7 + 1
+    is_weekend = np.isin(day_of_week_int, [1, 7])
+
+    peak_start = np.where(is_weekend, WEEKEND_PEAK_HOURS[0], WEEKDAY_PEAK_HOURS[0])
+    peak_end = np.where(is_weekend, WEEKEND_PEAK_HOURS[1], WEEKDAY_PEAK_HOURS[1])
+    is_peak = (hour >= peak_start) & (hour < peak_end)
+
+    hourly = np.where(is_weekend, WEEKEND_HOURLY[hour], WEEKDAY_HOURLY[hour])
+    mean_total = BASE_ENTRIES_PER_BLOCK * GROUP_WEIGHTS[group] * CLASS_SHARES[vehicle] * hourly
+
+    # Seed per chunk so chunks are independent but reproducible
+    rng = np.random.default_rng([seed, start_row])
+    total = rng.poisson(mean_total)
+    excluded = rng.binomial(total, EXCLUDED_SHARES[group])
+
+    day_names = np.array([DAY_NAMES[i] for i in range(1, 8)], dtype=object)
+    return pd.DataFrame({
+        'Toll Date': dates,
+        'Toll Hour': dates + hour.astype('timedelta64[h]'),
+        'Toll 10 Minute Block': block_start,
+        'Minute of Hour': minute,
+        'Hour of Day': hour,
+        'Day of Week Int': day_of_week_int,
+        'Day of Week': day_names[day_of_week_int - 1],
+        'Toll Week': dates - (day_of_week_int - 1).astype('timedelta64[D]'),
+        'Time Period': np.where(is_peak, 'Peak', 'Overnight').astype(object),
+        'Vehicle Class': np.array(VEHICLE_CLASSES, dtype=object)[vehicle],
+        'Detection Group': np.array(GROUP_NAMES, dtype=object)[group],
+        'Detection Region': np.array(REGION_NAMES, dtype=object)[group],
+        'CRZ Entries': total - excluded,
+        'Excluded Roadway Entries': excluded,
+    }, columns=COLUMNS)
+
+
+def generate_crz_data(num_rows: int, start_date='2025-01-05', seed: int = 0) -> pd.DataFrame:
+    """
+    Generate a synthetic CRZ dataset in memory
+
+    Traffic follows weekday/weekend hourly profiles, a realistic vehicle class
+    mix and per-crossing volumes, with the Peak/Overnight toll schedule. One
+    day is 10,368 rows, so e.g. 100K rows cover about 10 days and 10M rows
+    about 2.6 years.
+
+    Args:
+        num_rows: Number of rows
+        start_date: First date (a Sunday matches the published data)
+        seed: Random seed
+
+    Returns:
+        pandas.DataFrame with the raw dataset columns, ready for process_data
+    """
+    return generate_crz_chunk(0, num_rows, start_date=start_date, seed=seed)
+
+
+def _format_repeated(values: np.ndarray, fmt: str) -> np.ndarray:
+    """strftime on a datetime array with few distinct values"""
+    uniques, codes = np.unique(values, return_inverse=True)
+    return pd.DatetimeIndex(uniques).strftime(fmt).to_numpy(dtype=object)[codes]
+
+
+def write_crz_csv(path: str, num_rows: int, start_date='2025-01-05', seed: int = 0,
+                  chunk_rows: int = 2_000_000):
+    """
+    Write a synthetic CRZ dataset as a CSV in the published format
+
+    Rows are generated and written in chunks, so datasets far larger than
+    memory (100M rows and more) can be produced.
+
+    Args:
+        path: Output CSV path
+        num_rows: Number of rows
+        start_date: First date
+        seed: Random seed
+        chunk_rows: Rows generated per chunk
+    """
+    for start in range(0, max(num_rows, 1), chunk_rows):
+        chunk = generate_crz_chunk(start, min(start + chunk_rows, num_rows), start_date=start_date, seed=seed)
+        for column in ('Toll Date', 'Toll Week'):
+            chunk[column] = _format_repeated(chunk[column].to_numpy(), '%m/%d/%Y')
+        for column in ('Toll Hour', 'Toll 10 Minute Block'):
+            chunk[column] = _format_repeated(chunk[column].to_numpy(), '%m/%d/%Y %I:%M:%S %p')
+        chunk.to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
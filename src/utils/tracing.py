@@ -0,0 +1,209 @@
+"""
+Lightweight tracing spans for the CRZ workflow
+
+Spans nest through a context variable, so code only opens spans and sets
+attributes; the trace is exported when its root span ends. Configure export
+with configure_tracing() or the environment:
+
+    CRZ_TRACE_FILE=traces.jsonl    append finished traces to this file
+    CRZ_TRACE_FORMAT=jsonl|otlp    one span per line, or OTLP/JSON (one
+                                   ExportTraceServiceRequest per line)
+"""
+
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+_current_span = contextvars.ContextVar('crz_current_span', default=None)
+
+_config = {
+    'file': os.getenv('CRZ_TRACE_FILE'),
+    'format': os.getenv('CRZ_TRACE_FORMAT', 'jsonl'),
+}
+_export_lock = threading.Lock()
+
+SERVICE_NAME = 'crz-workflow'
+
+
+class Span:
+    """A timed operation with attributes; child spans share the root's trace"""
+
+    def __init__(self, name: str, parent: 'Span | None' = None, attributes: dict | None = None):
+        self.name = name
+        self.parent = parent
+        self.trace = parent.trace if parent else []
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.attributes = dict(attributes or {})
+        self.status = 'ok'
+        self.error = None
+        self.start_ns = time.time_ns()
+        self._start_perf = time.perf_counter_ns()
+        self.end_ns = None
+        self.duration_ns = None
+        self.trace.append(self)
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.duration_ns or 0) / 1e6
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def add(self, key: str, amount=1):
+        """Increase a numeric attribute, e.g. rows scanned over several filters"""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def finish(self, error: BaseException | None = None):
+        self.duration_ns = time.perf_counter_ns() - self._start_perf
+        self.end_ns = self.start_ns + self.duration_ns
+        if error is not None:
+            self.status = 'error'
+            self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> dict:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent.span_id if self.parent else None,
+            'name': self.name,
+            'start_unix_ns': self.start_ns,
+            'end_unix_ns': self.end_ns,
+            'duration_ms': self.duration_ms,
+            'status': self.status,
+            'error': self.error,
+            'attributes': self.attributes,
+        }
+
+
+def configure_tracing(file: str | None = None, format: str = 'jsonl'):
+    """
+    Set where finished traces are written
+
+    Args:
+        file: Output path (appended to), or None to disable export
+        format: 'jsonl' (one span per line) or 'otlp' (OTLP/JSON, one request per line)
+    """
+    if format not in ('jsonl', 'otlp'):
+        raise ValueError(f"Unsupported trace format: {format}")
+    _config['file'] = file
+    _config['format'] = format
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+def set_attribute(key: str, value):
+    """Set an attribute on the current span, if any"""
+    span = _current_span.get()
+    if span is not None:
+        span.set_attribute(key, value)
+
+
+def add_to_span(key: str, amount=1):
+    """Increase a numeric attribute on the current span, if any"""
+    span = _current_span.get()
+    if span is not None:
+        span.add(key, amount)
+
+
+@contextmanager
+def trace_span(name: str, **attributes):
+    """
+    Time a block as a span, nested under the current span
+
+    Usage:
+        with trace_span("execute_crz_function", function=name) as span:
+            span.set_attribute("rows", len(df))
+    """
+    span = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.finish(error=e)
+        raise
+    else:
+        span.finish()
+    finally:
+        _current_span.reset(token)
+        if span.parent is None:
+            export_trace(span.trace)
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(spans: list) -> dict:
+    """Convert finished spans to an OTLP/JSON ExportTraceServiceRequest"""
+    otlp_spans = []
+    for span in spans:
+        item = {
+            'traceId': span.trace_id,
+            'spanId': span.span_id,
+            'name': span.name,
+            'kind': 1,  # SPAN_KIND_INTERNAL
+            'startTimeUnixNano': str(span.start_ns),
+            'endTimeUnixNano': str(span.end_ns or span.start_ns),
+            'attributes': [{'key': key, 'value': _otlp_value(value)} for key, value in span.attributes.items()],
+            'status': {'code': 2, 'message': span.error} if span.status == 'error' else {'code': 1},
+        }
+        if span.parent is not None:
+            item['parentSpanId'] = span.parent.span_id
+        otlp_spans.append(item)
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+            'scopeSpans': [{'scope': {'name': __name__}, 'spans': otlp_spans}],
+        }]
+    }
+
+
+def export_trace(spans: list):
+    """Append a finished trace to the configured file"""
+    path = _config['file']
+    if not path:
+        return
+    if _config['format'] == 'otlp':
+        lines = [json.dumps(to_otlp(spans), default=str)]
+    else:
+        lines = [json.dumps(span.to_dict(), default=str) for span in spans]
+    with _export_lock:
+        with open(path, 'a') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+def format_trace_summary(root: Span) -> str:
+    """Indented per-stage breakdown of a trace with each span's share of the total"""
+    children = {}
+    for span in root.trace:
+        if span.parent is not None:
+            children.setdefault(span.parent.span_id, []).append(span)
+
+    total = root.duration_ms or 1e-9
+    lines = [f"Trace {root.trace_id}: {root.name} {root.duration_ms:.1f} ms"]
+
+    def visit(span, depth):
+        details = ', '.join(f"{key}={value}" for key, value in span.attributes.items()
+                            if isinstance(value, (int, float)) and not isinstance(value, bool))
+        status = ' ERROR' if span.status == 'error' else ''
+        lines.append(f"{'  ' * depth}{span.name:<{40 - 2 * depth}} {span.duration_ms:10.1f} ms "
+                     f"{span.duration_ms / total * 100:5.1f}%{status}" + (f"  [{details}]" if details else ''))
+        for child in children.get(span.span_id, []):
+            visit(child, depth + 1)
+
+    for child in children.get(root.span_id, []):
+        visit(child, 1)
+    return '\n'.join(lines)
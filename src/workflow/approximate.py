@@ -0,0 +1,217 @@
+"""
+Approximate answers from the analysis functions, with confidence intervals
+
+Instead of scanning the full dataset, an analysis runs on the stratified
+sample (src.utils.sampling), whose weighted entry columns make every sum an
+unbiased estimate of the full one. The sample is processed block by block:
+each block alone gives one estimate of every number in the result, and the
+spread of those estimates gives their standard error. Processing stops once
+the headline total is within the caller's relative error tolerance, when the
+time budget would run out, or when every block is used; the result is then
+computed on all the blocks used so far.
+
+The result is the function's usual dictionary plus an "approximation" entry
+with the confidence level, the blocks used, the headline's relative error and
+an interval for each number, keyed by its path in the result (list items are
+named by their label fields, e.g. "time_series[2025-01-05].volume").
+
+Usage:
+    result = approximate_crz_function('analyze_time_trends', params, df, tolerance=0.02)
+    for estimate in progressive_crz_function('analyze_peak_periods', params, df):
+        show(estimate)
+"""
+
+import math
+import os
+import time
+from statistics import NormalDist
+from typing import Iterator
+
+import pandas as pd
+from pydantic import BaseModel
+
+from src.utils.metrics import REGISTRY
+from src.utils.sampling import StratifiedSample, get_sample
+from src.utils.tracing import trace_span
+from src.workflow.other_tools import call_crz_function, function_mapping, get_params_model, prepare_function_params
+
+# Blocks processed before the tolerance is checked, so the error estimate has some degrees of freedom
+MIN_BLOCKS = 4
+DEFAULT_CONFIDENCE = 0.95
+# Seconds an approximate answer stops within; CRZ_APPROX_TIME_BUDGET=none (or 0) for no limit
+_TIME_BUDGET = os.getenv("CRZ_APPROX_TIME_BUDGET", "1").strip().lower()
+DEFAULT_TIME_BUDGET_S = None if _TIME_BUDGET in ("", "0", "none", "off") else float(_TIME_BUDGET)
+
+# Result numbers the tolerance applies to, by function
+HEADLINE_PATHS = {
+    'analyze_excluded_roadway_usage': ['overall_usage.total_entries'],
+    'compare_traffic_segments': ['segment_a.total_volume', 'segment_b.total_volume'],
+}
+DEFAULT_HEADLINE_PATHS = ['total_volume']
+# Fields that label a list item rather than measure it, even when they are numbers
+LABEL_FIELDS = ('hour', 'day', 'date', 'week', 'month', 'time_block')
+# Numbers that are not sums and get no interval
+UNESTIMATED_FIELDS = ('peak_hour', 'entry_count')
+
+APPROX_BLOCKS = REGISTRY.histogram('crz_approx_blocks_used', 'Sample blocks used per approximate answer',
+                                   ['function'], buckets=(1, 2, 4, 8, 16, 32, 64))
+
+
+def t_quantile(confidence: float, degrees_of_freedom: int) -> float:
+    """Two-sided Student t quantile, from the normal quantile by a Cornish-Fisher expansion"""
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    n = degrees_of_freedom
+    return (z + (z**3 + z) / (4 * n) + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * n**2)
+            + (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * n**3))
+
+
+def _item_label(item: dict) -> str:
+    labels = [str(value) for name, value in item.items()
+              if isinstance(value, str) or (name in LABEL_FIELDS and not isinstance(value, float))]
+    return '/'.join(labels)
+
+
+def flatten_numbers(result, prefix: str = '') -> dict:
+    """Every estimated number of a result by its path; list items are keyed by their labels"""
+    numbers = {}
+    if isinstance(result, dict):
+        for name, value in result.items():
+            if name in UNESTIMATED_FIELDS:
+                continue
+            path = f"{prefix}.{name}" if prefix else str(name)
+            if isinstance(value, bool):
+                continue
+            if isinstance(value, (int, float)):
+                numbers[path] = float(value)
+            else:
+                numbers.update(flatten_numbers(value, path))
+    elif isinstance(result, list):
+        for index, item in enumerate(result):
+            label = _item_label(item) if isinstance(item, dict) else ''
+            numbers.update(flatten_numbers(item, f"{prefix}[{label or index}]"))
+    return numbers
+
+
+class BlockEstimates:
+    """Per-block estimates of a result's numbers, for standard errors"""
+
+    def __init__(self):
+        self.blocks = []
+
+    def add(self, result):
+        self.blocks.append(flatten_numbers(result))
+
+    def standard_errors(self) -> dict:
+        """Standard error of the mean of the block estimates, for every path seen (absent = 0)"""
+        k = len(self.blocks)
+        paths = set().union(*self.blocks)
+        errors = {}
+        for path in paths:
+            values = [block.get(path, 0.0) for block in self.blocks]
+            mean = sum(values) / k
+            variance = sum((value - mean) ** 2 for value in values) / (k - 1)
+            errors[path] = (mean, math.sqrt(variance / k))
+        return errors
+
+    def relative_error(self, paths: list, confidence: float) -> float:
+        """Largest half-width of the headline intervals relative to their estimate"""
+        if len(self.blocks) < 2:
+            return math.inf
+        t = t_quantile(confidence, len(self.blocks) - 1)
+        errors = self.standard_errors()
+        worst = 0.0
+        for path in paths:
+            if path not in errors:
+                continue
+            mean, standard_error = errors[path]
+            if mean == 0:
+                return math.inf if standard_error else worst
+            worst = max(worst, t * standard_error / abs(mean))
+        return worst
+
+
+def progressive_crz_function(function_name: str, params: BaseModel | dict, df: pd.DataFrame,
+                             tolerance: float | None = None, time_budget: float | None = DEFAULT_TIME_BUDGET_S,
+                             confidence: float = DEFAULT_CONFIDENCE, checkpoints: bool = True) -> Iterator[dict]:
+    """
+    Estimate an analysis from more and more sample blocks
+
+    Args:
+        function_name: One of the analyze_* functions
+        params: Its parameters (model or dictionary)
+        df: The full dataset; its stratified sample is drawn on first use
+        tolerance: Stop once the headline total's interval half-width is within this
+            fraction of the estimate (e.g. 0.02); None uses every block within the budget
+        time_budget: Seconds to stop within; None for no limit
+        confidence: Confidence level of the intervals
+        checkpoints: Also yield estimates after 2, 4, 8, ... blocks
+
+    Yields:
+        Results with an "approximation" entry; the last one is the final estimate
+    """
+    if function_name not in function_mapping or function_name in ('filter_crz_data', 'query_crz_sql'):
+        raise ValueError(f"No approximate version of {function_name}")
+    if isinstance(params, dict):
+        params = get_params_model(function_name)(**params)
+    params_dict = prepare_function_params(function_name, params)
+    headline = HEADLINE_PATHS.get(function_name, DEFAULT_HEADLINE_PATHS)
+    started = time.perf_counter()
+
+    with trace_span("approximate_crz_function", function=function_name) as span:
+        sample = get_sample(df)
+        estimates = BlockEstimates()
+        for k in range(1, sample.blocks + 1):
+            estimates.add(call_crz_function(function_name, params_dict, sample.blocks_frame(k - 1, k)))
+            elapsed = time.perf_counter() - started
+            error = estimates.relative_error(headline, confidence)
+            # The final pass over k blocks costs about k block passes
+            next_pass = elapsed / k * (k + 2)
+            done = (k == sample.blocks
+                    or (tolerance is not None and k >= MIN_BLOCKS and error <= tolerance)
+                    or (time_budget is not None and k >= 2 and next_pass > time_budget))
+            if done or (checkpoints and k >= 2 and k & (k - 1) == 0):
+                result = estimate(function_name, params_dict, sample, estimates, confidence)
+                result['approximation']['elapsed_s'] = round(time.perf_counter() - started, 4)
+                if done:
+                    span.set_attribute("blocks", k)
+                    span.set_attribute("relative_error", result['approximation']['relative_error'])
+                    APPROX_BLOCKS.observe(k, function=function_name)
+                yield result
+            if done:
+                return
+
+
+def approximate_crz_function(function_name: str, params: BaseModel | dict, df: pd.DataFrame,
+                             tolerance: float | None = None, time_budget: float | None = DEFAULT_TIME_BUDGET_S,
+                             confidence: float = DEFAULT_CONFIDENCE) -> dict:
+    """The final estimate of progressive_crz_function, without the intermediate ones"""
+    for result in progressive_crz_function(function_name, params, df, tolerance, time_budget, confidence,
+                                           checkpoints=False):
+        pass
+    return result
+
+
+def estimate(function_name: str, params_dict: dict, sample: StratifiedSample, estimates: BlockEstimates,
+             confidence: float) -> dict:
+    """The analysis on the blocks processed so far, with intervals from the block estimates"""
+    k = len(estimates.blocks)
+    result = call_crz_function(function_name, params_dict, sample.blocks_frame(0, k))
+    values = flatten_numbers(result)
+    intervals = {}
+    if k > 1:
+        t = t_quantile(confidence, k - 1)
+        for path, (mean, standard_error) in estimates.standard_errors().items():
+            center = values.get(path, mean)
+            intervals[path] = [center - t * standard_error, center + t * standard_error]
+    relative_error = estimates.relative_error(HEADLINE_PATHS.get(function_name, DEFAULT_HEADLINE_PATHS), confidence)
+    start, stop = sample.block_range(0, k)
+    result['approximation'] = {
+        'confidence': confidence,
+        'blocks': k,
+        'of_blocks': sample.blocks,
+        'sample_rows': stop - start,
+        'population_rows': sample.population_rows,
+        'relative_error': relative_error if math.isfinite(relative_error) else None,
+        'intervals': intervals,
+    }
+    return result
@@ -0,0 +1,503 @@
+"""
+Execution backends for the analysis functions in src.workflow.tools
+
+The analysis functions filter the dataset once and then only need a few
+operations on the selected rows: grouped sums, totals, the date range and
+distinct values. A backend provides those operations for a selection of
+rows; everything after the (small) aggregated frames stays in pandas, so
+every backend gives the same results.
+
+- pandas: filter_crz_data, then pandas groupbys (the default); the row masks
+  of the filters are cached (src.workflow.filter_masks)
+- duckdb: SQL over the Arrow snapshot (src.utils.snapshot), whose date order
+  turns date filters into a slice; the other filters are pushed into each
+  query, which DuckDB runs vectorized on all cores
+- polars: lazy Polars queries over the same snapshot
+
+A selection can be limited to the columns its caller reads, and built from
+another selection whose rows include it (see src.workflow.query_plan).
+
+The backend is chosen with the CRZ_BACKEND environment variable or
+set_backend(). DuckDB and Polars are optional; choosing one that is not
+installed raises an ImportError. src.benchmarks.backend_conformance checks
+that every backend reproduces the pandas results exactly.
+
+Usage:
+    selection = get_backend().select(df, day_type='weekday', entry_region='Brooklyn')
+    hourly = selection.sums(['Hour of Day'], ['CRZ Entries'])
+"""
+
+import os
+import threading
+import weakref
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+
+from src.utils.data_loader import data_version
+from src.utils.snapshot import get_columnar_snapshot
+from src.utils.tracing import add_to_span
+
+DEFAULT_BACKEND = os.getenv("CRZ_BACKEND", "pandas")
+
+# Columns each filter_crz_data argument reads
+FILTER_COLUMNS = {
+    'start_date': ['Toll Date'],
+    'end_date': ['Toll Date'],
+    'day_type': ['Day of Week Int', 'Day of Week'],
+    'hour_range': ['Hour of Day'],
+    'time_period': ['Time Period'],
+    'vehicle_class': ['Vehicle Class'],
+    'entry_point': ['Detection Group'],
+    'entry_region': ['Detection Region'],
+}
+
+# id(dataframe) -> (dataset version, row count, DateIndex), dropped when the dataframe is garbage collected
+_date_indexes = {}
+_date_index_lock = threading.Lock()
+
+
+def _check_columns(columns: list, available: list):
+    missing = [column for column in columns if column not in available]
+    if missing:
+        raise KeyError(f"Unknown columns: {', '.join(missing)}")
+
+
+def scan_columns(columns, filters: dict, available: list) -> list | None:
+    """Columns a selection must keep: the ones read later, those its filters read and Toll Date"""
+    if columns is None:
+        return None
+    wanted = set(columns) | {'Toll Date'}
+    for name, value in filters.items():
+        if value:
+            wanted.update(FILTER_COLUMNS.get(name, []))
+    return [column for column in available if column in wanted]
+
+
+class DateIndex:
+    """
+    Row positions of a dataframe by Toll Date
+
+    Date bounds are found by binary search: directly in a dataframe already in
+    date order (as loaded), through the rows' date order in any other.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        dates = df['Toll Date'].to_numpy()
+        self.sorted = bool(df['Toll Date'].is_monotonic_increasing)
+        self.order = None if self.sorted else np.argsort(dates, kind='stable')
+        self.dates = dates if self.sorted else dates[self.order]
+
+    def mask(self, start_date=None, end_date=None) -> np.ndarray:
+        """Boolean mask of the rows between two dates (inclusive)"""
+        start = 0
+        stop = len(self.dates)
+        if start_date:
+            start = int(np.searchsorted(self.dates, np.datetime64(pd.to_datetime(start_date)), side='left'))
+        if end_date:
+            stop = int(np.searchsorted(self.dates, np.datetime64(pd.to_datetime(end_date)), side='right'))
+        stop = max(start, stop)
+        mask = np.zeros(len(self.dates), dtype=bool)
+        if self.sorted:
+            mask[start:stop] = True
+        else:
+            mask[self.order[start:stop]] = True
+        return mask
+
+
+def get_date_index(df: pd.DataFrame) -> DateIndex:
+    """Return the date index of a dataframe, building it on first use and for each new dataset version"""
+    key = id(df)
+    version = data_version(df)
+    with _date_index_lock:
+        cached = _date_indexes.get(key)
+        if cached is None or cached[:2] != version:
+            if cached is None:
+                weakref.finalize(df, _date_indexes.pop, key, None)
+            cached = (*version, DateIndex(df))
+            _date_indexes[key] = cached
+    return cached[2]
+
+
+def _match_dtypes(result: pd.DataFrame, df: pd.DataFrame) -> pd.DataFrame:
+    """Give the columns of an aggregate the dtypes pandas would have given them"""
+    for column in result.columns:
+        if column in df.columns and result[column].dtype != df[column].dtype:
+            result[column] = result[column].astype(df[column].dtype)
+    return result
+
+
+class Selection(ABC):
+    """
+    Rows of a dataset selected by filter_crz_data arguments
+
+    Subclasses implement the abstract operations for one backend. Grouped sums are
+    sorted by their keys and rows with a missing key are left out, as in a
+    pandas groupby.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.columns = list(df.columns)
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    @property
+    def empty(self) -> bool:
+        return len(self) == 0
+
+    @abstractmethod
+    def sums(self, by: list, columns: list) -> pd.DataFrame:
+        """Sums of columns per combination of the by columns, as groupby(by)[columns].sum().reset_index()"""
+
+    @abstractmethod
+    def totals(self, columns: list) -> dict:
+        """Sum of each column over the selected rows, as numpy scalars"""
+
+    @abstractmethod
+    def date_range(self) -> tuple | None:
+        """(first, last) Toll Date as Timestamps, or None when no rows are selected"""
+
+    @abstractmethod
+    def distinct(self, columns: list) -> pd.DataFrame:
+        """Distinct combinations of the columns, in no particular order"""
+
+
+class PandasSelection(Selection):
+    def __init__(self, df: pd.DataFrame, filters: dict, columns: list | None = None,
+                 within: 'PandasSelection | None' = None):
+        super().__init__(df)
+        # Imported here: tools imports this module
+        from src.workflow.tools import filter_crz_data
+        source = within.frame if within is not None else df
+        keep = scan_columns(columns, filters, list(source.columns))
+        if keep is not None and len(keep) == len(source.columns):
+            keep = None
+        self.frame = filter_crz_data(source, columns=keep, **filters)
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def sums(self, by: list, columns: list) -> pd.DataFrame:
+        return self.frame.groupby(by)[columns].sum().reset_index()
+
+    def totals(self, columns: list) -> dict:
+        return {column: self.frame[column].sum() for column in columns}
+
+    def date_range(self) -> tuple | None:
+        if self.frame.empty:
+            return None
+        return self.frame['Toll Date'].min(), self.frame['Toll Date'].max()
+
+    def distinct(self, columns: list) -> pd.DataFrame:
+        return self.frame[columns].drop_duplicates()
+
+
+class ArrowSelection(Selection):
+    """
+    Selection over the Arrow snapshot of a dataset
+
+    The date filters become a zero-copy slice of the snapshot; the other
+    filters are applied by the engine in every query on the slice.
+    """
+
+    def __init__(self, df: pd.DataFrame, filters: dict, columns: list | None = None):
+        super().__init__(df)
+        self.df = df
+        self.filters = filters
+        self.table = get_columnar_snapshot(df).select(filters.get('start_date'), filters.get('end_date'),
+                                                      scan_columns(columns, filters, self.columns))
+        self._summary = None
+
+    @abstractmethod
+    def _run_summary(self) -> tuple:
+        """(rows, first date, last date) of the selection, computed once"""
+
+    @abstractmethod
+    def _totals_frame(self, columns: list) -> pd.DataFrame:
+        """One-row frame of the sum of each column"""
+
+    @abstractmethod
+    def _sums_frame(self, by: list, columns: list) -> pd.DataFrame:
+        """Sums of columns per combination of the by columns, sorted by them"""
+
+    @abstractmethod
+    def _distinct_frame(self, columns: list) -> pd.DataFrame:
+        """Distinct combinations of the columns"""
+
+    def _summary_values(self) -> tuple:
+        if self._summary is None:
+            self._summary = self._run_summary()
+            add_to_span('rows_scanned', len(self.df))
+            add_to_span('rows_matched', self._summary[0])
+        return self._summary
+
+    def __len__(self) -> int:
+        return self._summary_values()[0]
+
+    def date_range(self) -> tuple | None:
+        rows, first, last = self._summary_values()
+        if not rows:
+            return None
+        return pd.Timestamp(first), pd.Timestamp(last)
+
+    def totals(self, columns: list) -> dict:
+        _check_columns(columns, self.columns)
+        row = _match_dtypes(self._totals_frame(columns), self.df)
+        return {column: row[column].iloc[0] for column in columns}
+
+    def sums(self, by: list, columns: list) -> pd.DataFrame:
+        _check_columns(by + columns, self.columns)
+        return _match_dtypes(self._sums_frame(by, columns), self.df).reset_index(drop=True)
+
+    def distinct(self, columns: list) -> pd.DataFrame:
+        _check_columns(columns, self.columns)
+        return _match_dtypes(self._distinct_frame(columns), self.df)
+
+
+def _is_class_number(vehicle_class) -> bool:
+    return isinstance(vehicle_class, int) or vehicle_class.isdigit()
+
+
+def _quote(column: str) -> str:
+    return '"' + column.replace('"', '""') + '"'
+
+
+class DuckDBSelection(ArrowSelection):
+    """Selection queried with DuckDB SQL"""
+
+    def __init__(self, df: pd.DataFrame, filters: dict, columns: list | None, backend: 'DuckDBBackend'):
+        super().__init__(df, filters, columns)
+        self.backend = backend
+        self.where, self.params = self._where_clause(filters)
+
+    @staticmethod
+    def _where_clause(filters: dict) -> tuple:
+        """The filters other than dates as SQL conditions and their parameters, as in filter_crz_data"""
+        conditions, params = [], []
+        day_type = filters.get('day_type')
+        if day_type:
+            if day_type.lower() == 'weekday':
+                conditions.append('"Day of Week Int" BETWEEN 2 AND 6')
+            elif day_type.lower() == 'weekend':
+                conditions.append('"Day of Week Int" IN (1, 7)')
+            else:
+                conditions.append('"Day of Week" = ?')
+                params.append(day_type)
+        hour_range = filters.get('hour_range')
+        if hour_range and len(hour_range) == 2:
+            start_hour, end_hour = hour_range
+            operator = 'AND' if start_hour <= end_hour else 'OR'
+            conditions.append(f'("Hour of Day" >= ? {operator} "Hour of Day" <= ?)')
+            params.extend([int(start_hour), int(end_hour)])
+        vehicle_class = filters.get('vehicle_class')
+        if vehicle_class:
+            if _is_class_number(vehicle_class):
+                conditions.append('starts_with("Vehicle Class", ?)')
+                params.append(f"{int(vehicle_class)} -")
+            else:
+                conditions.append('"Vehicle Class" = ?')
+                params.append(vehicle_class)
+        for name, column in (('time_period', 'Time Period'), ('entry_point', 'Detection Group'),
+                             ('entry_region', 'Detection Region')):
+            if filters.get(name):
+                conditions.append(f'{_quote(column)} = ?')
+                params.append(filters[name])
+        return conditions, params
+
+    def _query(self, select: str, extra_conditions: list = (), tail: str = ''):
+        conditions = list(self.where) + list(extra_conditions)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        return self.backend.query(self.table, f"SELECT {select} FROM crz{where} {tail}", self.params)
+
+    def _run_summary(self) -> tuple:
+        summary = self._query('COUNT(*) AS "rows", MIN("Toll Date") AS "first", MAX("Toll Date") AS "last"')
+        row = summary.to_pylist()[0]
+        return row['rows'], row['first'], row['last']
+
+    def _totals_frame(self, columns: list) -> pd.DataFrame:
+        select = ', '.join(f'COALESCE(SUM({_quote(column)}), 0) AS {_quote(column)}' for column in columns)
+        return self._query(select).to_pandas()
+
+    def _sums_frame(self, by: list, columns: list) -> pd.DataFrame:
+        keys = ', '.join(_quote(column) for column in by)
+        select = keys + ''.join(f', SUM({_quote(column)}) AS {_quote(column)}' for column in columns)
+        not_null = [f'{_quote(column)} IS NOT NULL' for column in by]
+        return self._query(select, not_null, f'GROUP BY {keys} ORDER BY {keys}').to_pandas()
+
+    def _distinct_frame(self, columns: list) -> pd.DataFrame:
+        return self._query('DISTINCT ' + ', '.join(_quote(column) for column in columns)).to_pandas()
+
+
+class PolarsSelection(ArrowSelection):
+    """Selection queried with lazy Polars frames"""
+
+    def __init__(self, df: pd.DataFrame, filters: dict, columns: list | None, pl):
+        super().__init__(df, filters, columns)
+        self.pl = pl
+        self.frame = pl.from_arrow(self.table).lazy().filter(*self._predicates(filters))
+
+    def _predicates(self, filters: dict) -> list:
+        """The filters other than dates as Polars expressions, as in filter_crz_data"""
+        pl = self.pl
+        predicates = [pl.lit(True)]
+        day_type = filters.get('day_type')
+        if day_type:
+            if day_type.lower() == 'weekday':
+                predicates.append(pl.col('Day of Week Int').is_between(2, 6))
+            elif day_type.lower() == 'weekend':
+                predicates.append(pl.col('Day of Week Int').is_in([1, 7]))
+            else:
+                predicates.append(pl.col('Day of Week') == day_type)
+        hour_range = filters.get('hour_range')
+        if hour_range and len(hour_range) == 2:
+            start_hour, end_hour = hour_range
+            hour = pl.col('Hour of Day')
+            if start_hour <= end_hour:
+                predicates.append(hour.is_between(start_hour, end_hour))
+            else:
+                predicates.append((hour >= start_hour) | (hour <= end_hour))
+        vehicle_class = filters.get('vehicle_class')
+        if vehicle_class:
+            if _is_class_number(vehicle_class):
+                predicates.append(pl.col('Vehicle Class').str.starts_with(f"{int(vehicle_class)} -"))
+            else:
+                predicates.append(pl.col('Vehicle Class') == vehicle_class)
+        for name, column in (('time_period', 'Time Period'), ('entry_point', 'Detection Group'),
+                             ('entry_region', 'Detection Region')):
+            if filters.get(name):
+                predicates.append(pl.col(column) == filters[name])
+        return predicates
+
+    def _run_summary(self) -> tuple:
+        pl = self.pl
+        dates = pl.col('Toll Date')
+        return self.frame.select(pl.len(), dates.min().alias('first'), dates.max().alias('last')).collect().row(0)
+
+    def _totals_frame(self, columns: list) -> pd.DataFrame:
+        return self.frame.select([self.pl.col(column).sum() for column in columns]).collect().to_pandas()
+
+    def _sums_frame(self, by: list, columns: list) -> pd.DataFrame:
+        pl = self.pl
+        return (self.frame.drop_nulls(by).group_by(by).agg([pl.col(column).sum() for column in columns])
+                .sort(by).collect().to_pandas())
+
+    def _distinct_frame(self, columns: list) -> pd.DataFrame:
+        return self.frame.select(columns).unique().collect().to_pandas()
+
+
+class Backend(ABC):
+    """Creates selections of a dataset; subclasses implement _select"""
+
+    name = None
+
+    def select(self, df: pd.DataFrame, start_date=None, end_date=None, day_type=None, hour_range=None,
+               time_period=None, vehicle_class=None, entry_point=None, entry_region=None,
+               columns: list | None = None, within: Selection | None = None) -> Selection:
+        """
+        Rows of df selected by the filter_crz_data arguments
+
+        Args:
+            columns: Columns the caller will read (default: all); others may be dropped
+            within: A selection of df that includes every row these filters select;
+                backends that can start from its rows do
+        """
+        filters = {'start_date': start_date, 'end_date': end_date, 'day_type': day_type, 'hour_range': hour_range,
+                   'time_period': time_period, 'vehicle_class': vehicle_class, 'entry_point': entry_point,
+                   'entry_region': entry_region}
+        if self.name != 'pandas' and 'crz_filter_key' in df.attrs:
+            # Imported here: tools imports this module
+            from src.workflow.tools import canonical_filter_key
+            if df.attrs['crz_filter_key'] == canonical_filter_key(**filters):
+                # Rows already selected (or pre-aggregated, e.g. by ParallelCRZExecutor) may lack the
+                # filter columns; filter_crz_data recognizes them and leaves them as they are
+                return PandasSelection(df, filters, columns)
+        return self._select(df, filters, columns, within)
+
+    @abstractmethod
+    def _select(self, df: pd.DataFrame, filters: dict, columns: list | None, within: Selection | None) -> Selection:
+        """Selection of the rows of df matching filters, a dict of every filter_crz_data argument"""
+
+
+class PandasBackend(Backend):
+    name = 'pandas'
+
+    def _select(self, df, filters, columns, within):
+        return PandasSelection(df, filters, columns, within if isinstance(within, PandasSelection) else None)
+
+
+class DuckDBBackend(Backend):
+    name = 'duckdb'
+
+    def __init__(self):
+        import duckdb
+        self.duckdb = duckdb
+        # DuckDB connections are not shared between threads
+        self._local = threading.local()
+
+    def query(self, table, sql: str, params: list):
+        """Run a query over an Arrow table, visible to it as crz; returns the result as an Arrow table"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self.duckdb.connect()
+        connection.register('crz', table)
+        try:
+            return connection.execute(sql, params).fetch_arrow_table()
+        finally:
+            connection.unregister('crz')
+
+    def _select(self, df, filters, columns, within):
+        # Every query scans the snapshot with all its filters pushed down
+        return DuckDBSelection(df, filters, columns, self)
+
+
+class PolarsBackend(Backend):
+    name = 'polars'
+
+    def __init__(self):
+        import polars
+        self.pl = polars
+
+    def _select(self, df, filters, columns, within):
+        return PolarsSelection(df, filters, columns, self.pl)
+
+
+BACKENDS = {
+    'pandas': PandasBackend,
+    'duckdb': DuckDBBackend,
+    'polars': PolarsBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(name: str) -> Backend:
+    """A new backend by name; ImportError if its engine is not installed"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend: {name} (available: {', '.join(BACKENDS)})")
+    try:
+        return BACKENDS[name]()
+    except ImportError as e:
+        raise ImportError(f"The {name} backend needs the {name} package: {e}") from e
+
+
+def get_backend() -> Backend:
+    """The backend the analysis functions run on (CRZ_BACKEND, pandas by default)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(DEFAULT_BACKEND)
+    return _backend
+
+
+def set_backend(name: str) -> Backend:
+    """Switch the analysis functions to another backend"""
+    global _backend
+    backend = create_backend(name)
+    with _backend_lock:
+        _backend = backend
+    return backend
@@ -0,0 +1,277 @@
+"""
+Answer a file of questions in one batch, for nightly reports
+
+run_workflow answers one question at a time. Here the dataset is loaded once,
+the questions are planned (router, or the reception, function selection and
+data retrieval agents) on a thread pool so the LLM calls of many questions are
+in flight together, and the rate limiter keeps them within each provider's
+limits. Planned questions are collected into groups and their tool calls run
+through execute_crz_batch, which computes identical calls once and scans the
+data once per shared filter set; the final answers are then requested while
+later questions are still being planned. Repeated questions are answered once.
+
+Questions are read from a text file (one per line) or a JSONL file with
+"question" and optional "id" fields. Answers are written as JSON lines, in the
+order they finish, with per-question timings.
+
+Usage:
+    python -m src.workflow.batch_qa questions.txt --output answers.jsonl
+    python -m src.workflow.batch_qa questions.jsonl --concurrency 64 --tool-batch 32
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, List
+
+from pydantic import BaseModel
+
+from src.llm.api_call import LLM_LATENCY
+from src.llm.models import AVAILABLE_MODELS
+from src.llm.rate_limiter import get_limiter
+from src.utils.data_loader import DEFAULT_DATA_PATH, get_processed_data
+from src.workflow.agents import data_retrieval_agent, final_answer_agent, function_selection_agent, reception_agent
+from src.workflow.other_tools import execute_crz_batch, execute_crz_function
+from src.workflow.router import record_decision, route_question
+from src.workflow.workflow import question_key
+
+# Questions planned or answered at once; the rate limiter decides how many LLM requests actually run
+DEFAULT_CONCURRENCY = int(os.getenv("CRZ_BATCH_CONCURRENCY", "64"))
+# Planned questions whose tool calls are run together
+DEFAULT_TOOL_BATCH = 32
+
+
+class BatchQuestion:
+    """One question's progress through the batch"""
+
+    def __init__(self, id, question: str):
+        self.id = id
+        self.question = question
+        self.routed = False
+        self.function_name = None
+        self.params = None
+        self.result = None
+        self.answer = None
+        self.error = None
+        self.duplicate_of = None
+        self.timings = {}
+
+    def record(self, started: float) -> dict:
+        """JSON-ready output line; times are seconds, started/finished relative to the batch start"""
+        params = self.params.model_dump(exclude_none=True) if isinstance(self.params, BaseModel) else self.params
+        answer = self.answer.model_dump() if isinstance(self.answer, BaseModel) else self.answer
+        timings = {name: round(value, 4) for name, value in self.timings.items()}
+        for name in ('started', 'finished'):
+            if name in timings:
+                timings[name] = round(self.timings[name] - started, 4)
+        if 'started' in timings and 'finished' in timings:
+            timings['total'] = round(self.timings['finished'] - self.timings['started'], 4)
+        record = {'id': self.id, 'question': self.question, 'routed': self.routed,
+                  'function': self.function_name, 'params': params, 'answer': answer, 'timings': timings}
+        if self.error is not None:
+            record['error'] = self.error
+        if self.duplicate_of is not None:
+            record['duplicate_of'] = self.duplicate_of
+        return record
+
+
+def read_questions(path: str) -> List[BatchQuestion]:
+    """Questions from a text file (one per line) or a JSONL file of {"id", "question"} objects"""
+    questions = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                item = json.loads(line)
+                questions.append(BatchQuestion(item.get('id', line_number), item['question']))
+            else:
+                questions.append(BatchQuestion(line_number, line))
+    return questions
+
+
+def plan_question(item: BatchQuestion, reference_date, use_router: bool):
+    """Choose the function and parameters for a question, as run_workflow does"""
+    item.timings['started'] = time.perf_counter()
+    if use_router:
+        decision = route_question(item.question, reference_date=reference_date)
+        item.routed = record_decision(decision)
+        if item.routed:
+            item.function_name, item.params = decision.function_name, decision.params
+    if not item.routed:
+        reception_response = reception_agent(item.question)
+        function_selection_response = function_selection_agent(item.question, reception_response.data_description)
+        item.function_name = function_selection_response.function_name
+        item.params = data_retrieval_agent(item.question, item.function_name)
+    item.timings['plan'] = time.perf_counter() - item.timings['started']
+
+
+def run_tools(items: List[BatchQuestion], df):
+    """
+    Run the tool calls of planned questions together
+
+    If the batch fails (an unknown function, parameters a function rejects),
+    the calls are retried one by one so only the failing questions get an error.
+    """
+    started = time.perf_counter()
+    try:
+        results = execute_crz_batch([(item.function_name, item.params) for item in items], df)
+        for item, result in zip(items, results):
+            item.result = result
+    except Exception:
+        for item in items:
+            try:
+                item.result = execute_crz_function(item.function_name, item.params, df)
+            except Exception as e:
+                item.error = f"{type(e).__name__}: {e}"
+    elapsed = time.perf_counter() - started
+    for item in items:
+        item.timings['tool'] = elapsed
+        item.timings['tool_batch_size'] = len(items)
+
+
+def answer_question(item: BatchQuestion) -> BatchQuestion:
+    started = time.perf_counter()
+    try:
+        item.answer = final_answer_agent(item.question, item.result)
+    except Exception as e:
+        item.error = f"{type(e).__name__}: {e}"
+    item.timings['answer'] = time.perf_counter() - started
+    return finish(item)
+
+
+def finish(item: BatchQuestion) -> BatchQuestion:
+    item.timings['finished'] = time.perf_counter()
+    return item
+
+
+def answer_batch(questions: List[BatchQuestion], data_path: str = DEFAULT_DATA_PATH,
+                 concurrency: int = DEFAULT_CONCURRENCY, tool_batch: int = DEFAULT_TOOL_BATCH,
+                 use_router: bool = True) -> Iterator[BatchQuestion]:
+    """
+    Answer questions concurrently, yielding each one as it finishes
+
+    A question whose planning or tool call fails is yielded with its error set
+    and no answer; the rest of the batch carries on.
+    """
+    started = time.perf_counter()
+    df, _ = get_processed_data(data_path)
+    load_time = time.perf_counter() - started
+    reference_date = df['Toll Date'].max()
+
+    # The first occurrence of a question is answered; repeats get its answer
+    leaders, repeats = {}, {}
+    for item in questions:
+        key = question_key(item.question, data_path, use_router)
+        if key in leaders:
+            item.duplicate_of = leaders[key].id
+            repeats.setdefault(id(leaders[key]), []).append(item)
+        else:
+            leaders[key] = item
+
+    def with_repeats(item: BatchQuestion) -> Iterator[BatchQuestion]:
+        yield item
+        for repeat in repeats.get(id(item), []):
+            for name in ('routed', 'function_name', 'params', 'result', 'answer', 'error'):
+                setattr(repeat, name, getattr(item, name))
+            repeat.timings = dict(item.timings)
+            yield repeat
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='batch-qa') as pool:
+        planning = {pool.submit(plan_question, item, reference_date, use_router): item
+                    for item in leaders.values()}
+        answering = []
+        planned = []
+        for count, future in enumerate(as_completed(planning), 1):
+            item = planning[future]
+            item.timings['load_data'] = load_time
+            try:
+                future.result()
+                planned.append(item)
+            except Exception as e:
+                item.error = f"{type(e).__name__}: {e}"
+                yield from with_repeats(finish(item))
+            # Flush a group of tool calls once it is full, or when planning is over
+            if planned and (len(planned) >= tool_batch or count == len(planning)):
+                run_tools(planned, df)
+                for item in planned:
+                    if item.error is None:
+                        answering.append(pool.submit(answer_question, item))
+                    else:
+                        yield from with_repeats(finish(item))
+                planned = []
+            for done in [future for future in answering if future.done()]:
+                answering.remove(done)
+                yield from with_repeats(done.result())
+        for future in as_completed(answering):
+            yield from with_repeats(future.result())
+
+
+def llm_requests_by_provider() -> dict:
+    """LLM requests sent so far, by provider"""
+    counts = {}
+    for model in AVAILABLE_MODELS:
+        provider = model.provider.value
+        count = LLM_LATENCY.snapshot(provider=provider, model=model.model_name)['count']
+        if count:
+            counts[provider] = counts.get(provider, 0) + count
+    return counts
+
+
+def throughput_bound(requests: dict) -> float:
+    """Shortest time the providers' request rate limits allow for these requests, in seconds"""
+    bound = 0.0
+    for provider, count in requests.items():
+        limiter = get_limiter(provider)
+        if limiter is not None and limiter.requests.rate:
+            bound = max(bound, count / limiter.requests.rate)
+    return bound
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a file of CRZ questions in one batch")
+    parser.add_argument('questions', help="Text file with one question per line, or JSONL with a question field")
+    parser.add_argument('--output', '-o', help="JSONL file for the answers (default: stdout)")
+    parser.add_argument('--data', default=DEFAULT_DATA_PATH, help="Dataset CSV")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="Questions planned or answered at once")
+    parser.add_argument('--tool-batch', type=int, default=DEFAULT_TOOL_BATCH,
+                        help="Planned questions whose tool calls run together")
+    parser.add_argument('--no-router', action='store_true', help="Send every question through the LLM agents")
+    args = parser.parse_args()
+
+    questions = read_questions(args.questions)
+    before = llm_requests_by_provider()
+    started = time.perf_counter()
+    output = open(args.output, 'w') if args.output else sys.stdout
+    errors = 0
+    load_time = 0.0
+    try:
+        for item in answer_batch(questions, args.data, args.concurrency, args.tool_batch, not args.no_router):
+            errors += item.error is not None
+            load_time = item.timings.get('load_data', load_time)
+            output.write(json.dumps(item.record(started), default=str) + '\n')
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    wall = time.perf_counter() - started
+
+    after = llm_requests_by_provider()
+    requests = {provider: count - before.get(provider, 0) for provider, count in after.items()
+                if count > before.get(provider, 0)}
+    bound = throughput_bound(requests)
+    summary = (f"{len(questions)} questions in {wall:.1f}s ({len(questions) / wall:.2f}/s), {errors} errors; "
+               f"LLM requests: {', '.join(f'{p} {n}' for p, n in requests.items()) or 'none'}")
+    if bound:
+        summary += (f"; rate-limit bound {bound:.1f}s, {bound / (wall - load_time):.0%} of the "
+                    f"{wall - load_time:.1f}s after loading the data")
+    print(summary, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+Cache of the row masks selected by filter_crz_data
+
+Tools asked about the same slice of the data ("weekday peak, Brooklyn,
+trucks") compare the same columns against the same values over the full
+dataset. The cache keeps the resulting boolean masks as bitmaps
+(np.packbits, one bit per row), so later calls and other tools reuse them:
+
+- one mask per predicate, keyed by its canonical (parameter, value) pair,
+  e.g. ('entry_region', 'Brooklyn')
+- one mask per combination, keyed by the whole canonical_filter_key and built
+  by ANDing the predicate masks, so "weekday, Brooklyn" after "weekday,
+  trucks" only computes the Brooklyn comparison
+- date bounds come from the dataset's date index (backends.DateIndex) instead
+  of a comparison over every row
+
+Masks belong to one version of one dataframe: they are keyed by its identity
+and its dataset version (df.attrs['crz_version'], set by process_data and
+bumped by data_loader.bump_data_version after an in-place edit), falling back
+to the row count for frames without a version. A reloaded or re-versioned
+dataset starts empty, and masks are dropped with their dataframe. Entries are
+evicted least recently used first beyond CRZ_FILTER_MASK_CACHE_MB (default
+64). Lookups are counted in crz_cache_lookups_total (cache filter_mask for
+combinations, filter_predicate for single predicates).
+
+Usage:
+    mask = get_filter_mask(df, canonical_filter_key(day_type='weekday', entry_region='Brooklyn'))
+    rows = df[mask]
+"""
+
+import collections
+import os
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from src.utils.data_loader import data_version
+from src.utils.metrics import CACHE_LOOKUPS, REGISTRY
+from src.workflow.backends import get_date_index
+
+FILTER_MASK_CACHE_BYTES = int(float(os.getenv("CRZ_FILTER_MASK_CACHE_MB", "64")) * 2**20)
+
+
+def predicate_mask(df: pd.DataFrame, name: str, value) -> np.ndarray:
+    """Boolean mask of the rows one canonical filter_crz_data predicate keeps"""
+    if name in ('start_date', 'end_date'):
+        bounds = {name: value}
+        return get_date_index(df).mask(bounds.get('start_date'), bounds.get('end_date'))
+    if name == 'day_type':
+        if value.lower() == 'weekday':
+            # Monday(2) to Friday(6)
+            mask = df['Day of Week Int'].between(2, 6)
+        elif value.lower() == 'weekend':
+            # Saturday(7) and Sunday(1)
+            mask = df['Day of Week Int'].isin([1, 7])
+        else:
+            mask = df['Day of Week'] == value
+    elif name == 'hour_range':
+        start_hour, end_hour = value
+        if start_hour <= end_hour:
+            mask = df['Hour of Day'].between(start_hour, end_hour)
+        else:
+            # Overnight ranges (e.g., 22-6)
+            mask = (df['Hour of Day'] >= start_hour) | (df['Hour of Day'] <= end_hour)
+    elif name == 'vehicle_class' and value.isdigit():
+        mask = df['Vehicle Class'].str.startswith(f"{int(value)} -")
+    else:
+        column = {'time_period': 'Time Period', 'vehicle_class': 'Vehicle Class',
+                  'entry_point': 'Detection Group', 'entry_region': 'Detection Region'}[name]
+        mask = df[column] == value
+    return mask.to_numpy(dtype=bool, na_value=False)
+
+
+class FilterMaskCache:
+    """Packed row masks per (dataframe, filter key), in LRU order within a byte budget"""
+
+    def __init__(self, max_bytes: int = FILTER_MASK_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        # (id(dataframe), filter key) -> packed mask, least recently used first
+        self._masks = collections.OrderedDict()
+        self._bytes = 0
+        # id(dataframe) -> version token of its cached masks, for dataframes with a finalizer registered
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def mask(self, df: pd.DataFrame, filter_key: tuple) -> np.ndarray | None:
+        """
+        Boolean mask of the rows of df selected by a canonical_filter_key
+
+        Returns:
+            Array with one bool per row, or None when the key has no filters
+        """
+        if not filter_key:
+            return None
+        packed = self._get(df, filter_key, 'filter_mask')
+        if packed is not None:
+            return self._unpack(packed, len(df))
+        combined = None
+        for predicate in filter_key:
+            single = (predicate,)
+            packed = self._get(df, single, 'filter_predicate') if len(filter_key) > 1 else None
+            if packed is not None:
+                mask = self._unpack(packed, len(df))
+            else:
+                mask = predicate_mask(df, *predicate)
+                if len(filter_key) > 1:
+                    self._put(df, single, np.packbits(mask))
+            combined = mask if combined is None else combined & mask
+        self._put(df, filter_key, np.packbits(combined))
+        return combined
+
+    @staticmethod
+    def _unpack(packed: np.ndarray, rows: int) -> np.ndarray:
+        return np.unpackbits(packed, count=rows).view(bool)
+
+    def _get(self, df: pd.DataFrame, filter_key: tuple, cache: str) -> np.ndarray | None:
+        key = (id(df), filter_key)
+        with self._lock:
+            packed = self._masks.get(key)
+            if packed is not None and self._frames.get(id(df)) == data_version(df):
+                self._masks.move_to_end(key)
+                CACHE_LOOKUPS.inc(cache=cache, result='hit')
+                return packed
+        CACHE_LOOKUPS.inc(cache=cache, result='miss')
+        return None
+
+    def _put(self, df: pd.DataFrame, filter_key: tuple, packed: np.ndarray):
+        if packed.nbytes > self.max_bytes:
+            return
+        frame = id(df)
+        version = data_version(df)
+        with self._lock:
+            if self._frames.get(frame) != version:
+                registered = frame in self._frames
+                self._drop_frame(frame)
+                self._frames[frame] = version
+                if not registered:
+                    weakref.finalize(df, self._forget_frame, frame)
+            previous = self._masks.pop((frame, filter_key), None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._masks[(frame, filter_key)] = packed
+            self._bytes += packed.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._masks.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def _drop_frame(self, frame: int):
+        for key in [key for key in self._masks if key[0] == frame]:
+            self._bytes -= self._masks.pop(key).nbytes
+        self._frames.pop(frame, None)
+
+    def _forget_frame(self, frame: int):
+        with self._lock:
+            self._drop_frame(frame)
+
+    def cached_bytes(self) -> int:
+        return self._bytes
+
+    def clear(self):
+        with self._lock:
+            self._masks.clear()
+            self._bytes = 0
+
+
+FILTER_MASKS = FilterMaskCache()
+
+REGISTRY.gauge('crz_filter_mask_cache_bytes', 'Memory held by cached filter masks',
+               function=FILTER_MASKS.cached_bytes)
+
+
+def get_filter_mask(df: pd.DataFrame, filter_key: tuple) -> np.ndarray | None:
+    """Rows of df selected by a canonical_filter_key, from the shared cache"""
+    return FILTER_MASKS.mask(df, filter_key)
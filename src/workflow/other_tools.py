@@ -1,10 +1,25 @@
-from typing import Type
+import copy
+import inspect
+import time
+from typing import List, Tuple, Type, Union
 from src.models.schemas import FunctionParams
-from src.workflow.tools import filter_crz_data, analyze_entry_point_volume, analyze_peak_periods, analyze_vehicle_distribution, analyze_time_trends, analyze_excluded_roadway_usage, compare_traffic_segments
+from src.utils.data_loader import data_version
+from src.utils.metrics import REGISTRY
+from src.utils.profiling import profile_request
+from src.utils.singleflight import SingleFlight
+from src.utils.tracing import trace_span
+from src.workflow.backends import get_backend
+from src.workflow.sql_tool import query_crz_sql
+from src.workflow.tools import FILTER_PARAMS, canonical_filter_key, filter_crz_data, analyze_entry_point_volume, analyze_peak_periods, analyze_vehicle_distribution, analyze_time_trends, analyze_excluded_roadway_usage, compare_traffic_segments
 
 import pandas as pd
 from pydantic import BaseModel
 
+TOOL_LATENCY = REGISTRY.histogram('crz_tool_latency_seconds', 'execute_crz_function latency by tool', ['function'])
+TOOL_ERRORS = REGISTRY.counter('crz_tool_errors_total', 'execute_crz_function calls that raised, by tool', ['function'])
+# Identical execute_crz_function calls in flight at the same time
+TOOL_FLIGHTS = SingleFlight('tool')
+
 def get_params_model(function_name: str) -> Type[BaseModel]:
     """
     Returns the appropriate Pydantic model based on the function name
@@ -27,7 +42,8 @@ def get_params_model(function_name: str) -> Type[BaseModel]:
         "analyze_excluded_roadway_usage": FunctionParams.AnalyzeExcludedRoadwayUsageParams,
         "analyze_vehicle_patterns": FunctionParams.AnalyzeVehiclePatternsParams,
         "compare_traffic_segments": FunctionParams.CompareTrafficSegmentsParams,
-        "generate_visualization": FunctionParams.GenerateVisualizationParams
+        "generate_visualization": FunctionParams.GenerateVisualizationParams,
+        "query_crz_sql": FunctionParams.QueryCRZSQLParams
     }
     
     if function_name not in model_mapping:
@@ -145,6 +161,13 @@ functions_info = {
       "optional_parameters": ["metric"],
       "returns": "Dictionary with comparison results between segments"
     },
+    {
+      "function_name": "query_crz_sql",
+      "description": "Run one read-only SQL SELECT (DuckDB dialect) over the table crz for breakdowns the other functions do not offer; columns include \"Toll Date\", \"Hour of Day\", \"Day of Week\", \"Time Period\", \"Vehicle Class\", \"Detection Group\", \"Detection Region\", \"CRZ Entries\", \"Excluded Roadway Entries\"",
+      "required_parameters": ["query"],
+      "optional_parameters": ["max_rows"],
+      "returns": "Dictionary with the result columns and rows"
+    },
     {
       "function_name": "generate_visualization",
       "description": "Generate a visualization based on the data",
@@ -158,17 +181,29 @@ functions_info = {
   ]
 }
 
-def execute_crz_function(function_name: str, params: BaseModel, df: pd.DataFrame):
+# Map function names to their implementations
+function_mapping = {
+    "filter_crz_data": filter_crz_data,
+    "analyze_entry_point_volume": analyze_entry_point_volume,
+    "analyze_peak_periods": analyze_peak_periods, 
+    "analyze_vehicle_distribution": analyze_vehicle_distribution,
+    "analyze_time_trends": analyze_time_trends,
+    "analyze_excluded_roadway_usage": analyze_excluded_roadway_usage,
+    #"analyze_vehicle_patterns": analyze_vehicle_patterns,
+    "compare_traffic_segments": compare_traffic_segments,
+    "query_crz_sql": query_crz_sql,
+}
+
+def prepare_function_params(function_name: str, params: BaseModel) -> dict:
     """
-    Execute the appropriate CRZ analysis function based on the function name and parameters
+    Convert a Pydantic parameter model into keyword arguments for a CRZ function
     
     Args:
         function_name: Name of the function to call
         params: Pydantic model instance containing the function parameters
-        df: DataFrame containing the CRZ data
         
     Returns:
-        Result of the function call
+        Dictionary of keyword arguments with hour ranges converted to tuples
     """
     # Convert Pydantic model to dictionary
     params_dict = params.model_dump(exclude_none=True)
@@ -177,25 +212,6 @@ def execute_crz_function(function_name: str, params: BaseModel, df: pd.DataFrame
     if 'hour_range' in params_dict and isinstance(params_dict['hour_range'], list):
         params_dict['hour_range'] = tuple(params_dict['hour_range'])
     
-    # Map function names to their implementations
-    function_mapping = {
-        "filter_crz_data": filter_crz_data,
-        "analyze_entry_point_volume": analyze_entry_point_volume,
-        "analyze_peak_periods": analyze_peak_periods, 
-        "analyze_vehicle_distribution": analyze_vehicle_distribution,
-        "analyze_time_trends": analyze_time_trends,
-        "analyze_excluded_roadway_usage": analyze_excluded_roadway_usage,
-        #"analyze_vehicle_patterns": analyze_vehicle_patterns,
-        "compare_traffic_segments": compare_traffic_segments,
-    }
-    
-    # Verify function exists
-    if function_name not in function_mapping:
-        raise ValueError(f"Unknown function: {function_name}")
-    
-    # Get the function
-    func = function_mapping[function_name]
-    
     # Special handling for compare_traffic_segments which has nested parameters
     if function_name == "compare_traffic_segments":
         # Need to process nested segment_a and segment_b dictionaries
@@ -209,6 +225,27 @@ def execute_crz_function(function_name: str, params: BaseModel, df: pd.DataFrame
                 if key == 'hour_range' and isinstance(value, list):
                     params_dict['segment_b'][key] = tuple(value)
     
+    return params_dict
+
+def call_crz_function(function_name: str, params_dict: dict, df: pd.DataFrame):
+    """
+    Call a CRZ function with already prepared keyword arguments
+    
+    Args:
+        function_name: Name of the function to call
+        params_dict: Keyword arguments from prepare_function_params
+        df: DataFrame containing the CRZ data
+        
+    Returns:
+        Result of the function call
+    """
+    # Verify function exists
+    if function_name not in function_mapping:
+        raise ValueError(f"Unknown function: {function_name}")
+    
+    # Get the function
+    func = function_mapping[function_name]
+    
     # Call the function with the dataframe and parameters
     try:
         # Always pass the dataframe as the first argument
@@ -219,4 +256,143 @@ def execute_crz_function(function_name: str, params: BaseModel, df: pd.DataFrame
         # Log the error and re-raise with more helpful message
         print(f"Error calling {function_name}: {e}")
         print(f"Parameters provided: {params_dict}")
-        raise ValueError(f"Error calling {function_name} with the provided parameters: {e}")
\ No newline at end of file
+        raise ValueError(f"Error calling {function_name} with the provided parameters: {e}")
+
+def execute_crz_function(function_name: str, params: BaseModel, df: pd.DataFrame, profile: bool = False):
+    """
+    Execute the appropriate CRZ analysis function based on the function name and parameters
+    
+    Args:
+        function_name: Name of the function to call
+        params: Pydantic model instance containing the function parameters
+        df: DataFrame containing the CRZ data
+        profile: Save a cProfile/tracemalloc profile of this call (see src.utils.profiling)
+        
+    Identical calls on the same dataframe that overlap in time run once; the
+    others wait and receive a copy of the result.
+        
+    Returns:
+        Result of the function call
+    """
+    # Verify function exists
+    if function_name not in function_mapping:
+        raise ValueError(f"Unknown function: {function_name}")
+    
+    params_dict = prepare_function_params(function_name, params)
+    start = time.perf_counter()
+    try:
+        with trace_span("execute_crz_function", function=function_name, rows_in=len(df)) as span, \
+                profile_request(function_name, params_dict, force=profile) as profile_id:
+            if profile_id:
+                # A profile needs its own run
+                span.set_attribute("profile_id", profile_id)
+                result = call_crz_function(function_name, params_dict, df)
+            else:
+                result = TOOL_FLIGHTS.do(tool_call_key(function_name, params_dict, df),
+                                         call_crz_function, function_name, params_dict, df)
+            span.set_attribute("result_chars", len(str(result)))
+    except Exception:
+        TOOL_ERRORS.inc(function=function_name)
+        raise
+    finally:
+        TOOL_LATENCY.observe(time.perf_counter() - start, function=function_name)
+    return result
+
+def tool_call_key(function_name: str, params_dict: dict, df: pd.DataFrame) -> tuple:
+    """
+    Key under which identical concurrent calls are coalesced
+    
+    Filters are canonicalised like the filter cache keys, so equivalent spellings
+    match. The dataframe is identified by id(), which cannot be reused while a
+    call on it is still running, and by its data_version.
+    """
+    filters = {name: value for name, value in params_dict.items() if name in FILTER_PARAMS}
+    others = {name: value for name, value in params_dict.items() if name not in FILTER_PARAMS}
+    return (function_name, canonical_filter_key(**filters), _freeze(others), id(df), data_version(df))
+
+def get_shared_filters(function_name: str, params_dict: dict) -> dict | None:
+    """
+    Return the filter_crz_data arguments a CRZ function applies to its input
+    
+    Args:
+        function_name: Name of the function to call
+        params_dict: Keyword arguments from prepare_function_params
+        
+    Returns:
+        Dictionary of filter arguments, or None when the function needs the full
+        dataframe (comparisons filter it more than once, SQL queries select their own rows)
+    """
+    if function_name in ("compare_traffic_segments", "query_crz_sql"):
+        return None
+    if function_name == "analyze_vehicle_distribution" and params_dict.get('compare_with'):
+        return None
+    
+    accepted = inspect.signature(function_mapping[function_name]).parameters
+    return {
+        name: params_dict[name]
+        for name in FILTER_PARAMS
+        if name in params_dict and name in accepted
+    }
+
+def _freeze(value):
+    """Turn nested parameter values into a hashable form"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+def execute_crz_batch(requests: List[Tuple[str, Union[BaseModel, dict]]], df: pd.DataFrame) -> list:
+    """
+    Execute many CRZ analysis calls against the same dataframe in one pass
+    
+    Identical requests are computed once. The remaining requests are grouped by
+    the filters they apply, the filtered subset is computed once per group, and
+    every analysis in the group runs its breakdowns on that subset instead of
+    rescanning the full dataframe.
+    
+    Args:
+        requests: List of (function_name, params) pairs; params is a Pydantic model
+            instance or a dictionary of parameters for the function
+        df: DataFrame containing the CRZ data
+        
+    Returns:
+        List of results in the same order as the requests
+    """
+    # Validate and normalise every request before touching the data
+    prepared = []
+    for function_name, params in requests:
+        if function_name not in function_mapping:
+            raise ValueError(f"Unknown function: {function_name}")
+        if isinstance(params, dict):
+            params = get_params_model(function_name)(**params)
+        prepared.append((function_name, prepare_function_params(function_name, params)))
+    
+    # Collapse identical requests
+    unique_calls = {}
+    for index, (function_name, params_dict) in enumerate(prepared):
+        unique_calls.setdefault((function_name, _freeze(params_dict)), []).append(index)
+    
+    # Group the unique requests by the filters they share
+    filter_groups = {}
+    for call_key, indices in unique_calls.items():
+        function_name, params_dict = prepared[indices[0]]
+        filters = get_shared_filters(function_name, params_dict)
+        group_key = None if filters is None else canonical_filter_key(**filters)
+        filter_groups.setdefault(group_key, []).append((call_key, filters))
+    
+    # Other backends filter the snapshot of the full dataframe in every query
+    prefilter = get_backend().name == 'pandas'
+    results = [None] * len(prepared)
+    for group_key, calls in filter_groups.items():
+        # One scan of the full dataframe per filter group
+        subset = df if group_key is None or not prefilter else filter_crz_data(df, **calls[0][1])
+        for call_key, _ in calls:
+            indices = unique_calls[call_key]
+            function_name, params_dict = prepared[indices[0]]
+            result = call_crz_function(function_name, params_dict, subset)
+            results[indices[0]] = result
+            for index in indices[1:]:
+                results[index] = copy.deepcopy(result)
+    
+    return results
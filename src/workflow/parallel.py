@@ -0,0 +1,291 @@
+"""Parallel execution of CRZ analyses over columns held in shared memory"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+from src.workflow.other_tools import (call_crz_function, function_mapping, get_params_model,
+                                      get_shared_filters, prepare_function_params)
+from src.workflow.tools import canonical_filter_key, filter_crz_data
+
+# Metrics summed by every shard so partial results can be merged by addition
+SHARD_METRICS = ['CRZ Entries', 'Excluded Roadway Entries']
+
+# Worker state, set once per process by _attach_shared_frame
+_worker_frame = None
+_worker_segments = []
+
+
+def share_dataframe(df: pd.DataFrame):
+    """
+    Copy the columns of a dataframe into shared memory blocks
+
+    Numeric and datetime columns are stored as raw arrays. Other columns are
+    factorized into integer codes in shared memory plus a (small) array of unique
+    values that is sent to each worker once; string columns are factorized in
+    sorted order, so workers can read them as categoricals over the shared codes.
+
+    Args:
+        df: DataFrame to share
+
+    Returns:
+        Tuple of (spec, segments): spec is a picklable description workers use to
+        rebuild the frame, segments are the SharedMemory blocks owned by the caller
+    """
+    spec = {'index': None, 'columns': []}
+    segments = []
+    for name in df.columns:
+        column = df[name]
+        categorical = False
+        if isinstance(column.dtype, np.dtype) and column.dtype.kind in 'biufM':
+            values = column.to_numpy()
+            uniques = None
+        elif pd.api.types.is_string_dtype(column.dtype):
+            # Sorted categories group and sort like the strings; missing values get code -1
+            codes, uniques = pd.factorize(column, sort=True)
+            values = codes.astype(_codes_dtype(len(uniques)))
+            categorical = True
+        else:
+            codes, uniques = pd.factorize(column, use_na_sentinel=False)
+            values = codes.astype(np.int32)
+        values = np.ascontiguousarray(values)
+        segment = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=values.dtype, buffer=segment.buf)[:] = values
+        segments.append(segment)
+        spec['columns'].append({
+            'name': name,
+            'segment': segment.name,
+            'dtype': values.dtype.str,
+            'length': len(values),
+            'uniques': uniques,
+            'categorical': categorical,
+        })
+    return spec, segments
+
+
+def _codes_dtype(categories: int) -> np.dtype:
+    """Integer type pandas uses for the codes of a categorical, so from_codes keeps them as they are"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if categories < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def attach_dataframe(spec: dict):
+    """
+    Rebuild a dataframe from blocks created by share_dataframe
+
+    Numeric and datetime columns are zero-copy views on the shared blocks, and
+    string columns categoricals whose codes are views on them, so every worker
+    reads the same copy.
+
+    Args:
+        spec: Description returned by share_dataframe
+
+    Returns:
+        Tuple of (DataFrame, segments); the segments must stay referenced while
+        the frame is in use
+    """
+    data = {}
+    segments = []
+    for column in spec['columns']:
+        segment = shared_memory.SharedMemory(name=column['segment'])
+        segments.append(segment)
+        values = np.ndarray((column['length'],), dtype=np.dtype(column['dtype']), buffer=segment.buf)
+        if column['categorical']:
+            values = pd.Categorical.from_codes(values, categories=column['uniques'], validate=False)
+        elif column['uniques'] is not None:
+            values = column['uniques'].take(values)
+        data[column['name']] = values
+    return pd.DataFrame(data, copy=False), segments
+
+
+def _attach_shared_frame(spec: dict):
+    """Worker initializer: map the shared columns once per process"""
+    global _worker_frame, _worker_segments
+    _worker_frame, _worker_segments = attach_dataframe(spec)
+
+
+def _run_call(function_name: str, params_dict: dict):
+    """Worker task: run one CRZ function on the shared frame"""
+    return call_crz_function(function_name, params_dict, _worker_frame)
+
+
+def _run_shard(start: int, stop: int, filters: dict, dimensions: List[str], metrics: List[str]):
+    """Worker task: filter one date-range shard and sum the metrics per dimension"""
+    shard = _worker_frame.iloc[start:stop]
+    filtered_df = filter_crz_data(shard, **filters)
+    sums = filtered_df.groupby(dimensions, sort=False, observed=True)[metrics].sum().reset_index()
+    # The sums are small: hand them back with the dimensions' original value types
+    for name in dimensions:
+        if isinstance(sums[name].dtype, pd.CategoricalDtype):
+            sums[name] = sums[name].astype(sums[name].dtype.categories.dtype)
+    return sums
+
+
+def get_shard_dimensions(function_name: str, params_dict: dict, columns) -> List[str] | None:
+    """
+    Return the columns a CRZ function groups by, or None if it cannot be sharded
+
+    Summing the metrics per combination of these columns (plus 'Toll Date', which
+    every filter summary uses) yields a pre-aggregated frame on which the function
+    produces exactly the same result as on the raw rows.
+
+    Args:
+        function_name: Name of the function to call
+        params_dict: Keyword arguments from prepare_function_params
+        columns: Columns available in the shared frame
+
+    Returns:
+        List of dimension columns, or None
+    """
+    if get_shared_filters(function_name, params_dict) is None:
+        return None
+
+    if function_name == "analyze_entry_point_volume":
+        dimensions = ['Detection Group', 'Detection Region']
+    elif function_name == "analyze_peak_periods":
+        dimensions = {
+            'hour': ['Hour of Day'],
+            'day_of_week': ['Day of Week'],
+            'date': [],
+            '10_minute': ['Hour of Day', 'Minute of Hour'],
+        }.get(params_dict.get('granularity', 'hour'))
+    elif function_name == "analyze_vehicle_distribution":
+        dimensions = ['Vehicle Class']
+    elif function_name == "analyze_time_trends":
+        dimensions = {
+            'hour': ['Hour of Day'],
+            'day': [],
+            'day_of_week': ['Day of Week'],
+            'week': ['Toll Week'],
+            'month': ['Month'] if 'Month' in columns else [],
+        }.get(params_dict.get('time_unit', 'day'))
+    elif function_name == "analyze_excluded_roadway_usage":
+        dimensions = ['Detection Group', 'Vehicle Class', 'Hour of Day']
+    else:
+        dimensions = None
+
+    if dimensions is None:
+        return None
+    return ['Toll Date'] + dimensions
+
+
+class ParallelCRZExecutor:
+    """
+    Process pool that runs CRZ analyses on a dataframe placed in shared memory
+
+    The dataframe is sorted by 'Toll Date' and copied into shared memory once.
+    Workers map the columns when they start, so tasks only carry the function
+    name and parameters; the dataframe itself is never pickled per task.
+
+    Usage:
+        with ParallelCRZExecutor(df, max_workers=8) as executor:
+            results = executor.map([("analyze_time_trends", {"time_unit": "week"}), ...])
+            trends = executor.execute("analyze_time_trends", {"time_unit": "day"})
+    """
+
+    def __init__(self, df: pd.DataFrame, max_workers: int | None = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.columns = list(df.columns)
+        # Sorting makes every date range a contiguous block of rows
+        df = df.sort_values('Toll Date', kind='stable').reset_index(drop=True)
+        self.num_rows = len(df)
+        self._dates = df['Toll Date'].to_numpy()
+        self._spec, self._segments = share_dataframe(df)
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                         initializer=_attach_shared_frame,
+                                         initargs=(self._spec,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Shut down the workers and release the shared memory"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        for segment in self._segments:
+            segment.close()
+            segment.unlink()
+        self._segments = []
+
+    def map(self, requests: List[Tuple[str, Union[BaseModel, dict]]]) -> list:
+        """
+        Run independent CRZ function calls across the worker pool
+
+        Args:
+            requests: List of (function_name, params) pairs; params is a Pydantic
+                model instance or a dictionary of parameters for the function
+
+        Returns:
+            List of results in the same order as the requests
+        """
+        futures = [
+            self._pool.submit(_run_call, function_name, self._prepare(function_name, params))
+            for function_name, params in requests
+        ]
+        return [future.result() for future in futures]
+
+    def execute(self, function_name: str, params: Union[BaseModel, dict], shards: int | None = None):
+        """
+        Run a single CRZ analysis split into date-range shards across the workers
+
+        Each worker filters its shard and sums the metrics per dimension the
+        analysis groups by; the parent adds the partial sums together and runs the
+        analysis on the merged (much smaller) frame. Functions that cannot be
+        split this way run whole on one worker.
+
+        Args:
+            function_name: Name of the function to call
+            params: Pydantic model instance or dictionary of parameters
+            shards: Number of shards (default: number of workers)
+
+        Returns:
+            Result of the function call
+        """
+        params_dict = self._prepare(function_name, params)
+        dimensions = get_shard_dimensions(function_name, params_dict, self.columns)
+        if dimensions is None:
+            return self._pool.submit(_run_call, function_name, params_dict).result()
+
+        filters = get_shared_filters(function_name, params_dict)
+        metrics = list(dict.fromkeys(SHARD_METRICS + [params_dict.get('metric', 'CRZ Entries')]))
+        futures = [
+            self._pool.submit(_run_shard, start, stop, filters, dimensions, metrics)
+            for start, stop in self._shard_bounds(shards or self.max_workers)
+        ]
+        partials = [future.result() for future in futures]
+
+        merged = pd.concat(partials, ignore_index=True)
+        merged = merged.groupby(dimensions, sort=False)[metrics].sum().reset_index()
+        # Filters were applied by the workers
+        merged.attrs['crz_filter_key'] = canonical_filter_key(**filters)
+        return call_crz_function(function_name, params_dict, merged)
+
+    def _prepare(self, function_name: str, params: Union[BaseModel, dict]) -> dict:
+        if function_name not in function_mapping:
+            raise ValueError(f"Unknown function: {function_name}")
+        if isinstance(params, dict):
+            params = get_params_model(function_name)(**params)
+        return prepare_function_params(function_name, params)
+
+    def _shard_bounds(self, shards: int) -> List[Tuple[int, int]]:
+        """Split the rows into contiguous shards that never cut a date in two"""
+        cuts = np.linspace(0, self.num_rows, shards + 1).astype(int)
+        if self.num_rows:
+            # Move every interior cut to the first row of its date
+            cuts[1:-1] = np.searchsorted(self._dates, self._dates[np.minimum(cuts[1:-1], self.num_rows - 1)], side='left')
+        bounds = []
+        for start, stop in zip(cuts[:-1], cuts[1:]):
+            if stop > start:
+                bounds.append((int(start), int(stop)))
+        return bounds or [(0, 0)]
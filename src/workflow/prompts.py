@@ -0,0 +1,151 @@
+"""
+Prompt text for the agents, built once at import
+
+Every prompt starts with text that is identical for all calls of its stage:
+the system message, the tool catalog for the stages that choose or call a
+function, and the stage's instructions. The per-call values (the question,
+the retrieved data) come last, so provider-side prompt caching can reuse the
+prefix. The tool catalog is generated from the FunctionParams models, so it
+lists exactly the parameters each function accepts.
+
+PROMPT_MESSAGES holds (role, template) pairs for ChatPromptTemplate.from_messages;
+render_prompt produces the same text without LangChain.
+"""
+
+import string
+
+from src.models.schemas import functions_info
+from src.utils.crz_constants import DAY_NAMES, DETECTION_GROUPS, DETECTION_REGIONS, TIME_PERIODS, VEHICLE_CLASSES
+from src.workflow.other_tools import get_params_model
+from src.workflow.tools import FILTER_PARAMS
+
+SYSTEM_PROMPT = "You are data analyst specializing in NYC Congestion Relief Zone data."
+
+# Allowed values shown next to a parameter in the catalog
+PARAMETER_VALUES = {
+    'granularity': ['hour', 'day_of_week', 'date', '10_minute'],
+    'time_unit': ['hour', 'day', 'day_of_week', 'week', 'month'],
+    'dimension': ['time', 'location', 'vehicle'],
+    'metric': ['CRZ Entries', 'Excluded Roadway Entries'],
+}
+# Parameters that take a set of filters rather than a single value
+FILTER_SET_PARAMETERS = ('segment_a', 'segment_b', 'compare_with')
+
+FILTER_REFERENCE = (
+    "Filters (all optional): start_date, end_date (YYYY-MM-DD); "
+    f"day_type (weekday, weekend or {', '.join(DAY_NAMES.values())}); "
+    "hour_range ([start_hour, end_hour], 0-23); "
+    f"time_period ({', '.join(TIME_PERIODS)}); "
+    f"vehicle_class ({'; '.join(VEHICLE_CLASSES)}; give the number or TLC Taxi/FHV); "
+    f"entry_point ({', '.join(DETECTION_GROUPS)}); "
+    f"entry_region ({', '.join(DETECTION_REGIONS)})"
+)
+
+
+def parameter_signature(name: str, field) -> str:
+    """One catalog parameter: name, * if required, allowed values and default"""
+    text = name + ('*' if field.is_required() else '')
+    if name in PARAMETER_VALUES:
+        text += '=' + '|'.join(PARAMETER_VALUES[name])
+    elif name in FILTER_SET_PARAMETERS:
+        text += '=filters'
+    if not field.is_required() and field.default not in (None, False):
+        text += f' [{field.default}]'
+    return text
+
+
+def function_signature(function_name: str) -> str:
+    """Compact signature of an analysis function from its parameter model"""
+    fields = get_params_model(function_name).model_fields
+    has_filters = all(name in fields for name in FILTER_PARAMS)
+    parameters = [parameter_signature(name, field) for name, field in fields.items()
+                  if not (has_filters and name in FILTER_PARAMS and not field.is_required())]
+    if has_filters:
+        parameters.append('+filters')
+    return f"{function_name}({', '.join(parameters)})"
+
+
+def build_tool_catalog() -> str:
+    """Functions the agents can call, one line each"""
+    lines = ["Functions (* = required, [x] = default, +filters = accepts the filters below):"]
+    for function in functions_info['functions']:
+        lines.append(f"- {function_signature(function['function_name'])}: {function['description']}")
+    lines.append(FILTER_REFERENCE)
+    return '\n'.join(lines)
+
+
+TOOL_CATALOG = build_tool_catalog()
+FUNCTION_SIGNATURES = {function['function_name']: function_signature(function['function_name'])
+                       for function in functions_info['functions']}
+
+RECEPTION_INSTRUCTIONS = """You need to first determine if you need to retrieve data from the dataset to answer the user's query.
+If you need to retrieve data, describe the data needed to be retrieved, and provide response as retrieving data from the dataset.
+If you don't need to retrieve data, provide a response to the user's query.
+response: The response to the user's query, in a concise and informative manner
+retrieve_data: do we need to retrieve data from the dataset to answer the user's query
+data_description: a description of the data needed to be retrieved from the dataset to answer the user's query"""
+
+FUNCTION_SELECTION_INSTRUCTIONS = """You are given a task to retrieve data from NYC Congestion Relief Zone data.
+Determine if one of the functions above can retrieve the data needed to answer the user's query.
+If yes, provide the name of the function to call to retrieve the data.
+If no, provide a response to the user's query, informing the user that the data is not available in the dataset.
+response: The response to the user's query, in a concise and informative manner
+data_available: do we have the data needed to answer the user's query
+function_name: the name of the function to call to retrieve the data"""
+
+DATA_RETRIEVAL_INSTRUCTIONS = """You are given a task to retrieve data from NYC Congestion Relief Zone data.
+Provide the parameters to pass to the function below to retrieve the data the user's query needs.
+Only set the parameters the query asks for; leave the others out.
+response: The response to the user's query, in a concise and informative manner
+function_params: the parameters to pass to the function to retrieve the data"""
+
+FINAL_ANSWER_INSTRUCTIONS = """You are given a task to answer a query about NYC Congestion Relief Zone data using the data retrieved for it.
+response: The answer to the user's query, in a concise and informative manner"""
+
+
+def _literal(text: str) -> str:
+    """Escape braces so text passes through template formatting unchanged"""
+    return text.replace('{', '{{').replace('}', '}}')
+
+
+# Stage -> (role, template) messages; the values are filled in at the end
+PROMPT_MESSAGES = {
+    'reception': [
+        ('system', _literal(SYSTEM_PROMPT)),
+        ('human', _literal(RECEPTION_INSTRUCTIONS) + "\nUser query: {query}"),
+    ],
+    'function_selection': [
+        ('system', _literal(f"{SYSTEM_PROMPT}\n\n{TOOL_CATALOG}")),
+        ('human', _literal(FUNCTION_SELECTION_INSTRUCTIONS)
+         + "\nData needed: {data_description}\nUser query: {user_query}"),
+    ],
+    'data_retrieval': [
+        ('system', _literal(f"{SYSTEM_PROMPT}\n\n{FILTER_REFERENCE}")),
+        ('human', _literal(DATA_RETRIEVAL_INSTRUCTIONS) + "\nFunction: {function_signature}\nUser query: {user_query}"),
+    ],
+    'final_answer': [
+        ('system', _literal(SYSTEM_PROMPT)),
+        ('human', _literal(FINAL_ANSWER_INSTRUCTIONS) + "\nRetrieved data: {retrieved_data}\nUser query: {user_query}"),
+    ],
+}
+
+# How ChatPromptTemplate.format writes each role
+ROLE_PREFIXES = {'system': 'System', 'human': 'Human'}
+
+
+def render_prompt(stage: str, **values) -> str:
+    """The prompt string ChatPromptTemplate.from_messages(PROMPT_MESSAGES[stage]).format(**values) returns"""
+    return '\n'.join(f"{ROLE_PREFIXES[role]}: {template.format(**values)}"
+                     for role, template in PROMPT_MESSAGES[stage])
+
+
+def static_prefix(stage: str) -> str:
+    """The part of a stage's prompt that is the same for every call"""
+    rendered = render_prompt(stage, **{name: '\0' for name in prompt_variables(stage)})
+    return rendered[:rendered.index('\0')]
+
+
+def prompt_variables(stage: str) -> list:
+    """Names of the values a stage's prompt takes, in order"""
+    return [name for _, template in PROMPT_MESSAGES[stage]
+            for _, name, _, _ in string.Formatter().parse(template) if name]
@@ -0,0 +1,282 @@
+"""
+Lazy query plans for the analysis functions
+
+An analysis describes what it needs before anything runs: the row
+selections (scans) it filters, and per scan the grouped sums, totals, date
+range, distinct values and top-N rankings it reads. Reading any result
+executes the whole plan at once, after an optimizer has:
+
+- merged identical scans (same canonical filters), so e.g. two comparison
+  segments with the same filters are filtered once
+- started each scan from an earlier scan whose rows include it (see
+  tools.is_refinement), e.g. "weekday 7-10h" from "weekday"
+- merged the aggregates of a scan that group by the same columns into one
+  groupby, and all its totals into one pass
+- pruned every scan to the columns its aggregates, its filters and the scans
+  started from it read
+- left the filters themselves to the backend's index layer: the cached row
+  masks of the pandas backend (src.workflow.filter_masks), or the
+  date-ordered Arrow snapshot of the DuckDB and Polars backends
+
+Usage:
+    plan = QueryPlan(df)
+    weekdays = plan.scan(day_type='weekday')
+    hourly = weekdays.sums(['Hour of Day'], ['CRZ Entries'])
+    top = hourly.top('CRZ Entries', 5)
+    top.value  # executes the plan
+"""
+
+import pandas as pd
+
+from src.utils.metrics import REGISTRY
+from src.utils.tracing import trace_span
+from src.workflow.backends import get_backend
+
+PLAN_SCANS = REGISTRY.counter('crz_plan_scans_total', 'Scans requested by query plans, by how they ran',
+                              ['result'])
+
+
+class PlanNode:
+    """A result of a plan, computed when the plan executes"""
+
+    def __init__(self, plan: 'QueryPlan'):
+        self.plan = plan
+        self._value = None
+
+    @property
+    def value(self):
+        if not self.plan.executed:
+            self.plan.execute()
+        return self._value
+
+
+class Sums(PlanNode):
+    """Sums of columns per combination of the by columns, sorted by the by columns"""
+
+    def __init__(self, scan: 'Scan', by: list, columns: list):
+        super().__init__(scan.plan)
+        self.scan = scan
+        self.by = list(by)
+        self.columns = list(columns)
+
+    def top(self, column: str, n: int) -> 'TopN':
+        return TopN(self, column, n)
+
+    def series(self) -> pd.Series:
+        """The sums of a single column indexed by a single by column"""
+        return self.value.set_index(self.by[0])[self.columns[0]]
+
+
+class TopN(PlanNode):
+    """The n groups of a Sums node with the largest value of a column"""
+
+    def __init__(self, source: Sums, column: str, n: int):
+        super().__init__(source.plan)
+        self.source = source
+        self.column = column
+        self.n = n
+
+    @property
+    def value(self):
+        return self.source.value.sort_values(self.column, ascending=False).head(self.n)
+
+
+class Totals(PlanNode):
+    """Sum of each column over the scan's rows"""
+
+    def __init__(self, scan: 'Scan', columns: list):
+        super().__init__(scan.plan)
+        self.scan = scan
+        self.columns = list(columns)
+
+
+class DateRange(PlanNode):
+    """(first, last) Toll Date of the scan's rows, or None"""
+
+    def __init__(self, scan: 'Scan'):
+        super().__init__(scan.plan)
+        self.scan = scan
+
+
+class Distinct(PlanNode):
+    """Distinct combinations of columns in the scan's rows"""
+
+    def __init__(self, scan: 'Scan', columns: list):
+        super().__init__(scan.plan)
+        self.scan = scan
+        self.columns = list(columns)
+
+
+class Scan:
+    """Rows selected by filter_crz_data arguments, and the results read from them"""
+
+    def __init__(self, plan: 'QueryPlan', filters: dict):
+        self.plan = plan
+        self.filters = filters
+        self.nodes = []
+
+    def _add(self, node: PlanNode) -> PlanNode:
+        if self.plan.executed:
+            raise RuntimeError("The plan has already been executed")
+        self.nodes.append(node)
+        return node
+
+    def sums(self, by: list, columns: list) -> Sums:
+        return self._add(Sums(self, by, columns))
+
+    def totals(self, columns: list) -> Totals:
+        return self._add(Totals(self, columns))
+
+    def date_range(self) -> DateRange:
+        return self._add(DateRange(self))
+
+    def distinct(self, columns: list) -> Distinct:
+        return self._add(Distinct(self, columns))
+
+    def read_columns(self) -> list:
+        columns = []
+        for node in self.nodes:
+            if isinstance(node, Sums):
+                columns += node.by + node.columns
+            elif isinstance(node, (Totals, Distinct)):
+                columns += node.columns
+            elif isinstance(node, DateRange):
+                columns.append('Toll Date')
+        return columns
+
+
+class QueryPlan:
+    """Scans and aggregates over one dataset, executed together"""
+
+    def __init__(self, df: pd.DataFrame, backend=None):
+        self.df = df
+        self.backend = backend or get_backend()
+        self.scans = []
+        self.executed = False
+        self.steps = []
+
+    def scan(self, start_date=None, end_date=None, day_type=None, hour_range=None, time_period=None,
+             vehicle_class=None, entry_point=None, entry_region=None) -> Scan:
+        """Rows selected by the filter_crz_data arguments"""
+        scan = Scan(self, {'start_date': start_date, 'end_date': end_date, 'day_type': day_type,
+                           'hour_range': hour_range, 'time_period': time_period, 'vehicle_class': vehicle_class,
+                           'entry_point': entry_point, 'entry_region': entry_region})
+        self.scans.append(scan)
+        return scan
+
+    def optimize(self) -> list:
+        """
+        Physical scans to run, in order
+
+        Returns:
+            List of dicts with the filters, the canonical key, the scans merged
+            into it, the columns to keep and the index of the scan to start from
+        """
+        # Imported here: tools imports this module
+        from src.workflow.backends import FILTER_COLUMNS
+        from src.workflow.tools import canonical_filter_key, is_refinement
+
+        physical = {}
+        for scan in self.scans:
+            key = canonical_filter_key(**scan.filters)
+            if key not in physical:
+                physical[key] = {'key': key, 'filters': scan.filters, 'scans': [], 'columns': set(), 'within': None}
+            physical[key]['scans'].append(scan)
+            physical[key]['columns'].update(scan.read_columns())
+
+        # Broader scans first, so narrower ones can start from them
+        steps = sorted(physical.values(), key=lambda step: len(step['key']))
+        for index, step in enumerate(steps):
+            parents = [earlier for earlier in range(index) if is_refinement(step['key'], steps[earlier]['key'])]
+            if parents:
+                step['within'] = max(parents, key=lambda earlier: len(steps[earlier]['key']))
+
+        # A scan keeps what the scans started from it read and filter on
+        for step in reversed(steps):
+            if step['within'] is not None:
+                parent = steps[step['within']]
+                parent['columns'] |= step['columns']
+                for name, value in step['filters'].items():
+                    if value:
+                        parent['columns'].update(FILTER_COLUMNS[name])
+        return steps
+
+    def execute(self):
+        """Run every scan and aggregate of the plan"""
+        if self.executed:
+            return
+        self.steps = steps = self.optimize()
+        with trace_span("query_plan", scans=len(self.scans), physical_scans=len(steps)) as span:
+            selections = []
+            aggregates = 0
+            for step in steps:
+                within = selections[step['within']] if step['within'] is not None else None
+                selection = self.backend.select(self.df, columns=sorted(step['columns']), within=within,
+                                                **step['filters'])
+                selections.append(selection)
+                aggregates += self._run_nodes(selection, [node for scan in step['scans'] for node in scan.nodes])
+                PLAN_SCANS.inc(result='narrowed' if within is not None else 'full')
+                PLAN_SCANS.inc(len(step['scans']) - 1, result='merged')
+            span.set_attribute("aggregates", aggregates)
+        self.executed = True
+
+    @staticmethod
+    def _run_nodes(selection, nodes: list) -> int:
+        """Compute the nodes of one scan, merging groupbys by key and totals; returns the passes made"""
+        passes = 0
+        by_keys = {}
+        for node in nodes:
+            if isinstance(node, Sums):
+                columns = by_keys.setdefault(tuple(node.by), [])
+                columns += [column for column in node.columns if column not in columns]
+        grouped = {}
+        for by, columns in by_keys.items():
+            grouped[by] = selection.sums(list(by), columns)
+            passes += 1
+        totals_columns = []
+        for node in nodes:
+            if isinstance(node, Totals):
+                totals_columns += [column for column in node.columns if column not in totals_columns]
+        totals = selection.totals(totals_columns) if totals_columns else {}
+        passes += bool(totals_columns)
+        date_range = None
+        distinct = {}
+        for node in nodes:
+            if isinstance(node, Sums):
+                # A frame of its own, so callers can add columns to it
+                node._value = grouped[tuple(node.by)][node.by + node.columns]
+            elif isinstance(node, Totals):
+                node._value = {column: totals[column] for column in node.columns}
+            elif isinstance(node, DateRange):
+                if date_range is None:
+                    date_range = (selection.date_range(),)
+                node._value = date_range[0]
+            elif isinstance(node, Distinct):
+                key = tuple(node.columns)
+                if key not in distinct:
+                    distinct[key] = selection.distinct(node.columns)
+                    passes += 1
+                node._value = distinct[key]
+        return passes
+
+    def explain(self) -> str:
+        """The optimized plan, one line per physical scan"""
+        steps = self.steps if self.executed else self.optimize()
+        lines = []
+        for index, step in enumerate(steps):
+            filters = ', '.join(f"{name}={value}" for name, value in step['key']) or 'all rows'
+            source = f"scan {step['within']}" if step['within'] is not None else 'dataset'
+            reads = []
+            for scan in step['scans']:
+                for node in scan.nodes:
+                    if isinstance(node, Sums):
+                        reads.append(f"sum({', '.join(node.columns)}) by {', '.join(node.by)}")
+                    elif isinstance(node, Totals):
+                        reads.append(f"total({', '.join(node.columns)})")
+                    elif isinstance(node, DateRange):
+                        reads.append("date range")
+                    elif isinstance(node, Distinct):
+                        reads.append(f"distinct({', '.join(node.columns)})")
+            lines.append(f"{index}: [{filters}] from {source}, {len(step['scans'])} scan(s) merged, "
+                         f"columns {sorted(step['columns'])}: {'; '.join(dict.fromkeys(reads))}")
+        return '\n'.join(lines)
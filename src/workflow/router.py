@@ -0,0 +1,535 @@
+"""
+Rule-based router mapping stereotyped questions straight to a CRZ function call
+
+Questions such as "busiest entry points last week" or "daily trend at the
+Holland Tunnel" are matched against keyword templates for each analysis
+function, and their filters are read from the dataset vocabulary (crossings,
+regions, vehicle classes, day names, hour ranges and relative dates). A
+confident match skips the reception, function selection and data retrieval
+agents; anything else goes to the LLM as before.
+"""
+
+import inspect
+import os
+import re
+from typing import List, NamedTuple
+
+import pandas as pd
+from pydantic import BaseModel
+
+from src.utils.crz_constants import DAY_NAMES, DETECTION_GROUPS
+from src.utils.metrics import REGISTRY
+from src.workflow.other_tools import function_mapping, get_params_model
+from src.workflow.tools import FILTER_PARAMS
+
+# Minimum confidence for answering without the LLM agents
+ROUTER_CONFIDENCE_THRESHOLD = float(os.getenv("CRZ_ROUTER_THRESHOLD", "0.7"))
+
+ROUTER_DECISIONS = REGISTRY.counter('crz_router_decisions_total', 'Router decisions by outcome and function',
+                                    ['outcome', 'function'])
+
+# (phrase, field, value); the longest phrase wins where phrases overlap
+VOCABULARY = (
+    [(group.lower(), 'entry_point', group) for group in DETECTION_GROUPS]
+    + [
+        ('williamsburg', 'entry_point', 'Williamsburg Bridge'),
+        ('hugh carey tunnel', 'entry_point', 'Hugh L. Carey Tunnel'),
+        ('hugh carey', 'entry_point', 'Hugh L. Carey Tunnel'),
+        ('brooklyn-battery tunnel', 'entry_point', 'Hugh L. Carey Tunnel'),
+        ('battery tunnel', 'entry_point', 'Hugh L. Carey Tunnel'),
+        ('holland', 'entry_point', 'Holland Tunnel'),
+        ('lincoln', 'entry_point', 'Lincoln Tunnel'),
+        ('queensboro', 'entry_point', 'Queensboro Bridge'),
+        ('ed koch bridge', 'entry_point', 'Queensboro Bridge'),
+        ('59th street bridge', 'entry_point', 'Queensboro Bridge'),
+        ('midtown tunnel', 'entry_point', 'Queens Midtown Tunnel'),
+        ('queens-midtown tunnel', 'entry_point', 'Queens Midtown Tunnel'),
+        ('east 60th street', 'entry_point', 'East 60th St'),
+        ('west 60th street', 'entry_point', 'West 60th St'),
+        ('fdr drive', 'entry_point', 'FDR Drive at 60th St'),
+        ('fdr', 'entry_point', 'FDR Drive at 60th St'),
+        ('west side highway', 'entry_point', 'West Side Highway at 60th St'),
+        ('brooklyn', 'entry_region', 'Brooklyn'),
+        ('new jersey', 'entry_region', 'New Jersey'),
+        ('jersey', 'entry_region', 'New Jersey'),
+        ('nj', 'entry_region', 'New Jersey'),
+        ('queens', 'entry_region', 'Queens'),
+        ('cars', 'vehicle_class', '1'),
+        ('car', 'vehicle_class', '1'),
+        ('passenger vehicles', 'vehicle_class', '1'),
+        ('passenger cars', 'vehicle_class', '1'),
+        ('pickups', 'vehicle_class', '1'),
+        ('pickup trucks', 'vehicle_class', '1'),
+        ('vans', 'vehicle_class', '1'),
+        ('single-unit trucks', 'vehicle_class', '2'),
+        ('single unit trucks', 'vehicle_class', '2'),
+        ('box trucks', 'vehicle_class', '2'),
+        ('multi-unit trucks', 'vehicle_class', '3'),
+        ('multi unit trucks', 'vehicle_class', '3'),
+        ('tractor trailers', 'vehicle_class', '3'),
+        ('tractor-trailers', 'vehicle_class', '3'),
+        ('semis', 'vehicle_class', '3'),
+        ('18-wheelers', 'vehicle_class', '3'),
+        ('trucks', 'vehicle_class', '2'),
+        ('truck', 'vehicle_class', '2'),
+        ('buses', 'vehicle_class', '4'),
+        ('bus', 'vehicle_class', '4'),
+        ('motorcycles', 'vehicle_class', '5'),
+        ('motorcycle', 'vehicle_class', '5'),
+        ('motorbikes', 'vehicle_class', '5'),
+        ('taxis', 'vehicle_class', 'TLC Taxi/FHV'),
+        ('taxi', 'vehicle_class', 'TLC Taxi/FHV'),
+        ('cabs', 'vehicle_class', 'TLC Taxi/FHV'),
+        ('fhvs', 'vehicle_class', 'TLC Taxi/FHV'),
+        ('fhv', 'vehicle_class', 'TLC Taxi/FHV'),
+        ('for-hire vehicles', 'vehicle_class', 'TLC Taxi/FHV'),
+        ('ubers', 'vehicle_class', 'TLC Taxi/FHV'),
+        ('uber', 'vehicle_class', 'TLC Taxi/FHV'),
+        ('lyft', 'vehicle_class', 'TLC Taxi/FHV'),
+        ('rideshare', 'vehicle_class', 'TLC Taxi/FHV'),
+        ('weekends', 'day_type', 'weekend'),
+        ('weekend', 'day_type', 'weekend'),
+        ('weekdays', 'day_type', 'weekday'),
+        ('weekday', 'day_type', 'weekday'),
+        ('workdays', 'day_type', 'weekday'),
+        ('business days', 'day_type', 'weekday'),
+    ]
+    + [(name.lower() + suffix, 'day_type', name) for name in DAY_NAMES.values() for suffix in ('', 's')]
+)
+
+# Generic truck mentions cover classes 2 and 3; the single-unit class is assumed
+AMBIGUOUS_PHRASES = {'trucks', 'truck'}
+
+NAMED_HOUR_RANGES = [
+    (r'\bmorning (rush( hours?)?|commute)\b', [7, 10]),
+    (r'\b(evening|afternoon) (rush( hours?)?|commute)\b', [16, 19]),
+]
+
+# Filters written as phrases: (pattern, field, value)
+PHRASE_FILTERS = [
+    (r'\bovernight\b', 'time_period', 'Overnight'),
+    (r'\b(during|in) (the )?peak( hours| periods?| toll(ing)? hours)?\b', 'time_period', 'Peak'),
+    (r'\bpeak (toll|pricing)\b', 'time_period', 'Peak'),
+]
+
+MONTHS = ['january', 'february', 'march', 'april', 'may', 'june', 'july', 'august',
+          'september', 'october', 'november', 'december']
+_MONTH_NAMES = '|'.join(MONTHS)
+_DAY_NAMES = '|'.join(name.lower() for name in DAY_NAMES.values())
+
+# "March 5", "March 5th, 2025", "5 March", "the 5th of March 2025"
+DAY_OF_MONTH_PATTERN = (
+    r'\b(?P<month>' + _MONTH_NAMES + r')\s+(?P<day>\d{1,2})(?:st|nd|rd|th)?\b(?:,?\s+(?P<year>\d{4})\b)?'
+    r'|\b(?P<day2>\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?(?P<month2>' + _MONTH_NAMES + r')\b(?:,?\s+(?P<year2>\d{4})\b)?'
+)
+
+# Date expressions the router does not resolve; left anywhere in a question, its scope would be wrong
+UNPARSED_DATE_PATTERN = (
+    r'\b(?:19|20)\d{2}\b|\b\d{1,2}/\d{1,2}(?:/\d{2,4})?\b|\b\d{1,2}(?:st|nd|rd|th)\b'
+    r'|\b(?:' + _MONTH_NAMES + r')\s+\d{1,2}\b'
+    r'|\b(?:last|past|previous|next|this)\s+(?:' + _DAY_NAMES + r'|weekend|year|\d+\s+\w+)\b'
+    r'|\b(?:next (?:week|month)|tomorrow|ago|holidays?)\b'
+    # A month name left after parsing, e.g. the second one of "in January and February"
+    r'|\b(?:' + '|'.join(month for month in MONTHS if month != 'may') + r')\b|\b(?:in|during) may\b'
+)
+
+# Times of day the router does not resolve to an hour_range ("before 6am", "at night")
+UNPARSED_HOUR_PATTERN = (
+    r"\b\d{1,2}(?::\d{2})?\s*(?:am|pm)\b|\b\d{1,2}:\d{2}\b|\bo'clock\b"
+    r'|\b(?:noon|midnight|night(?:time)?|nights|mornings?|afternoons?|evenings?|rush hours?|lunch ?time)\b'
+)
+
+# (function, confidence, pattern); each function scores its best matching pattern
+INTENT_PATTERNS = [
+    ('analyze_excluded_roadway_usage', 0.95, r'\bexcluded( roadways?)?\b'),
+    ('analyze_vehicle_distribution', 0.9,
+     r'\bvehicle (mix|types?|class(es)?|distribution|breakdown|categories)\b'),
+    ('analyze_vehicle_distribution', 0.9, r'\b(mix|breakdown|distribution|share) of vehicles\b'),
+    ('analyze_vehicle_distribution', 0.9, r'\bby (vehicle )?(type|class)\b'),
+    ('analyze_vehicle_distribution', 0.9, r'\bwhat (kinds|types|sorts) of vehicles\b'),
+    ('analyze_peak_periods', 0.9, r'(?<!during )(?<!in )(?<!during the )\bpeak (hours?|times?|periods?|days?|dates?|(10|ten)[- ]minute|blocks?)\b'),
+    ('analyze_peak_periods', 0.9,
+     r'\b(busiest|most congested|heaviest|highest[- ]traffic) (hours?|times?|days?|periods?|dates?|10[- ]minute)'),
+    ('analyze_peak_periods', 0.9, r'\bwhen (is|are|was|were|does|do)\b.*\b(busiest|peak|most traffic|heaviest)\b'),
+    ('analyze_peak_periods', 0.9,
+     r'\b(what|which) (time|hours?|days?|dates?)\b.*\b(busiest|peak|most (traffic|congested|vehicles))\b'),
+    ('analyze_entry_point_volume', 0.9,
+     r'\b(busiest|top|most used|most popular|least used|quietest|highest[- ]volume|most congested) '
+     r'(\d+ )?(entry points?|crossings?|bridges?|tunnels?|entrances?|detection groups?)\b'),
+    ('analyze_entry_point_volume', 0.9, r'\bwhich (entry points?|crossings?|bridges?|tunnels?|entrances?)\b'),
+    ('analyze_entry_point_volume', 0.9, r'\b(by|per|each) (entry point|crossing|entrance)\b'),
+    ('analyze_entry_point_volume', 0.7, r'\bentry points?\b'),
+    ('analyze_time_trends', 0.9, r'\btrends?\b|\bover time\b'),
+    ('analyze_time_trends', 0.9, r'\b(changed|change|grown|growth|increased?|decreased?|declined?)\b'),
+    ('analyze_time_trends', 0.85, r'\b(daily|weekly|monthly|hourly) (traffic|entries|volumes?|counts?|totals?)\b'),
+    ('analyze_time_trends', 0.8, r'\b(total|how many|number of|count of|volume of)\b'),
+]
+COMPARE_PATTERN = r'\b(compare|comparison|compared|versus|vs\.?|difference between|differ)\b'
+SHARE_PATTERN = r'\b(share|percentage|percent|proportion|fraction|what portion)\b'
+
+# Negated filters ("excluding trucks", "except on weekends", "did not use the Holland Tunnel"); the
+# vocabulary would read them as the opposite filter, which the tools cannot express
+NEGATION_PATTERN = (r"\b(excluding|except|not counting|without|other than|apart from|aside from|besides|"
+                    r"not|never|no longer)\b|n't\b")
+
+# Questions the tools cannot answer (causes, forecasts, prices); left to the LLM
+OUT_OF_SCOPE_PATTERN = (r'\b(why|should|predict|forecast|will|revenue|price|prices|cost|costs|fare|fares|'
+                        r'weather|accidents?|pollution|air quality|explain|policy)\b')
+
+TIME_UNITS = [
+    (r'\b(hourly|by hour|per hour|each hour)\b', 'hour'),
+    (r'\b(day of (the )?week|by weekday)\b', 'day_of_week'),
+    (r'\b(daily|per day|by day|each day|day by day)\b', 'day'),
+    (r'\b(weekly|per week|by week|each week|week over week)\b', 'week'),
+    (r'\b(monthly|per month|by month|each month|month over month)\b', 'month'),
+]
+
+GRANULARITIES = [
+    (r'\b(10|ten)[- ]minute\b', '10_minute'),
+    (r'\bday of (the )?week\b|\bwhich day of\b', 'day_of_week'),
+    (r'\b(which|what|busiest|peak) (days?|dates?)\b', 'date'),
+    (r'\b(hours?|time of day|what time)\b', 'hour'),
+]
+
+# Filters a function analyzes rather than filters by, so mentioning them is expected
+SUBJECT_FIELDS = {
+    'analyze_vehicle_distribution': {'vehicle_class'},
+    'analyze_entry_point_volume': {'entry_point'},
+    'analyze_excluded_roadway_usage': {'entry_point'},
+}
+
+# Penalties applied to the best intent's score
+TIE_PENALTY = 0.25
+AMBIGUOUS_ENTITY_PENALTY = 0.1
+UNSUPPORTED_FILTER_PENALTY = 0.3
+# Enough to fall below the default threshold from any intent
+UNPARSED_FILTER_PENALTY = 0.5
+NEGATION_PENALTY = 0.5
+OUT_OF_SCOPE_PENALTY = 0.4
+
+
+class RouteDecision(NamedTuple):
+    """Outcome of route_question; function_name and params are None when nothing matched"""
+    function_name: str | None
+    params: BaseModel | None
+    confidence: float
+    reasons: List[str]
+
+
+def _find_entities(text: str) -> tuple:
+    """
+    Vocabulary matches in a lowercased question, longest phrases first
+
+    Returns:
+        (dict of field -> list of distinct values in question order, ambiguous phrases found)
+    """
+    taken = []
+    matches = []
+    ambiguous = []
+    for phrase, field, value in sorted(VOCABULARY, key=lambda item: len(item[0]), reverse=True):
+        for match in re.finditer(r'(?<![\w-])' + re.escape(phrase) + r'(?![\w-])', text):
+            span = match.span()
+            if any(span[0] < end and start < span[1] for start, end in taken):
+                continue
+            taken.append(span)
+            matches.append((span[0], field, value))
+            if phrase in AMBIGUOUS_PHRASES:
+                ambiguous.append(phrase)
+    entities = {}
+    for _, field, value in sorted(matches):
+        values = entities.setdefault(field, [])
+        if value not in values:
+            values.append(value)
+    return entities, ambiguous
+
+
+def _hour(value: str, meridiem: str | None) -> int:
+    hour = int(value) % 12 if meridiem else int(value)
+    return hour + 12 if meridiem == 'pm' else hour
+
+
+def _find_hour_range(text: str) -> tuple:
+    """
+    hour_range from "between 7am and 10am" style ranges and named periods
+
+    Returns:
+        (hour range or None, times of day in the question that were not parsed)
+    """
+    hours = None
+    match = re.search(r'\b(?:between|from)\s+(\d{1,2})\s*(am|pm)?\s*(?:and|to|-)\s*(\d{1,2})\s*(am|pm)?\b', text)
+    if match:
+        start_meridiem = match.group(2) or match.group(4)
+        start, end = _hour(match.group(1), start_meridiem), _hour(match.group(3), match.group(4))
+        if 0 <= start <= 23 and 0 <= end <= 23:
+            hours = [start, end]
+    if hours is None:
+        for pattern, named_hours in NAMED_HOUR_RANGES:
+            if match := re.search(pattern, text):
+                hours = named_hours
+                break
+    rest = text[:match.start()] + ' ' * (match.end() - match.start()) + text[match.end():] if hours else text
+    return hours, [match.group(0) for match in re.finditer(UNPARSED_HOUR_PATTERN, rest)]
+
+
+def _resolve_date(year, month: int, day: int, reference_date: pd.Timestamp | None) -> pd.Timestamp | None:
+    """A calendar date; without a year, the latest one on or before reference_date"""
+    if year is None:
+        if reference_date is None:
+            return None
+        year = reference_date.year if (month, day) <= (reference_date.month, reference_date.day) \
+            else reference_date.year - 1
+    year = int(year)
+    year = year + 2000 if year < 100 else year
+    try:
+        return pd.Timestamp(year=year, month=month, day=day)
+    except ValueError:
+        return None
+
+
+def _explicit_dates(text: str, reference_date: pd.Timestamp | None) -> list:
+    """(start, end, date) of every explicit calendar date in the question, in question order"""
+    found = []
+    for match in re.finditer(r'\b(\d{4})-(\d{2})-(\d{2})\b', text):
+        found.append((match, _resolve_date(match.group(1), int(match.group(2)), int(match.group(3)), None)))
+    for match in re.finditer(DAY_OF_MONTH_PATTERN, text):
+        month = MONTHS.index(match.group('month') or match.group('month2')) + 1
+        day = int(match.group('day') or match.group('day2'))
+        found.append((match, _resolve_date(match.group('year') or match.group('year2'), month, day, reference_date)))
+    for match in re.finditer(r'\b(\d{1,2})/(\d{1,2})(?:/(\d{4}|\d{2}))?\b', text):
+        # US order: month/day
+        found.append((match, _resolve_date(match.group(3), int(match.group(1)), int(match.group(2)),
+                                           reference_date)))
+    return sorted(((match.start(), match.end(), date) for match, date in found if date is not None),
+                  key=lambda item: item[0])
+
+
+def _parse_dates(text: str, reference_date: pd.Timestamp | None) -> tuple:
+    """(start_date/end_date filters, text with the parsed date expressions blanked out)"""
+    def consumed(*spans):
+        rest = text
+        for span_start, span_end in spans:
+            rest = rest[:span_start] + ' ' * (span_end - span_start) + rest[span_end:]
+        return rest
+
+    def days(start, end):
+        return {'start_date': start.strftime('%Y-%m-%d'), 'end_date': end.strftime('%Y-%m-%d')}
+
+    explicit = _explicit_dates(text, reference_date)
+    if len(explicit) >= 2:
+        (first_start, first_end, first), (second_start, second_end, second) = explicit[:2]
+        return days(first, second), consumed((first_start, first_end), (second_start, second_end))
+    if len(explicit) == 1:
+        span_start, span_end, date = explicit[0]
+        before = text[:span_start]
+        if re.search(r'\b(since|after|from|starting)\s+(on\s+|the\s+)?$', before):
+            return {'start_date': date.strftime('%Y-%m-%d')}, consumed((span_start, span_end))
+        if re.search(r'\b(before|until|through)\s+(the\s+)?$', before):
+            return {'end_date': date.strftime('%Y-%m-%d')}, consumed((span_start, span_end))
+        return days(date, date), consumed((span_start, span_end))
+
+    month_pattern = '|'.join(MONTHS)
+    if match := re.search(r'\b(' + month_pattern + r')\s+(\d{4})\b', text):
+        start = pd.Timestamp(year=int(match.group(2)), month=MONTHS.index(match.group(1)) + 1, day=1)
+        return days(start, start + pd.offsets.MonthEnd(0)), consumed(match.span())
+    if match := re.search(r'\b((?:19|20)\d{2})\b', text):
+        year = int(match.group(1))
+        return days(pd.Timestamp(year=year, month=1, day=1), pd.Timestamp(year=year, month=12, day=31)), \
+            consumed(match.span())
+    if reference_date is None:
+        return {}, text
+
+    end = reference_date.normalize()
+    start = None
+    if match := re.search(r'\b(yesterday|today|latest day|most recent day)\b', text):
+        start = end
+    elif (match := re.search(r'\b(?:last|past|previous)\s+(\d+)\s+(day|week|month)s?\b', text)) \
+            and int(match.group(1)) > 0:
+        count, unit = int(match.group(1)), match.group(2)
+        start = end - (pd.DateOffset(months=count) if unit == 'month' else
+                       pd.Timedelta(days=count * (7 if unit == 'week' else 1))) + pd.Timedelta(days=1)
+    elif match := re.search(r'\b(last|past|previous) week\b', text):
+        start = end - pd.Timedelta(days=6)
+    elif match := re.search(r'\blast month\b|\bprevious month\b', text):
+        first_of_month = end.replace(day=1)
+        end = first_of_month - pd.Timedelta(days=1)
+        start = end.replace(day=1)
+    elif match := re.search(r'\bpast month\b', text):
+        start = end - pd.Timedelta(days=29)
+    elif match := re.search(r'\bthis week\b', text):
+        # Weeks start on Sunday, like Toll Week
+        start = end - pd.Timedelta(days=(end.dayofweek + 1) % 7)
+    elif match := re.search(r'\bthis month\b', text):
+        start = end.replace(day=1)
+    elif match := re.search(r'\b(this year|year to date)\b', text):
+        start = end.replace(month=1, day=1)
+    else:
+        month_pattern = '|'.join(month for month in MONTHS if month != 'may')
+        match = re.search(r'\b(' + month_pattern + r')\b|\b(?:in|during) (may)\b', text)
+        if match:
+            month = MONTHS.index(match.group(1) or match.group(2)) + 1
+            year = end.year if month <= end.month else end.year - 1
+            start = pd.Timestamp(year=year, month=month, day=1)
+            end = start + pd.offsets.MonthEnd(0)
+    if start is None:
+        return {}, text
+    return days(start, end), consumed(match.span())
+
+
+def _find_dates(text: str, reference_date: pd.Timestamp | None) -> tuple:
+    """
+    start_date/end_date from explicit dates, years, relative periods and month names
+
+    Returns:
+        (dict of date filters, date expressions in the question that were not parsed)
+    """
+    dates, rest = _parse_dates(text, reference_date)
+    return dates, [match.group(0) for match in re.finditer(UNPARSED_DATE_PATTERN, rest)]
+
+
+def extract_filters(question: str, reference_date=None) -> tuple:
+    """
+    Filters and other parameters named in a question
+
+    Args:
+        question: User question
+        reference_date: Latest date in the dataset; relative dates count back from it
+
+    Returns:
+        (dict of field -> list of values, list of ambiguous phrases, list of date
+        and time expressions that were not parsed)
+    """
+    text = ' '.join(question.lower().split())
+    reference_date = pd.Timestamp(reference_date) if reference_date is not None else None
+    entities, ambiguous = _find_entities(text)
+    for pattern, field, value in PHRASE_FILTERS:
+        if re.search(pattern, text):
+            values = entities.setdefault(field, [])
+            if value not in values:
+                values.append(value)
+    hour_range, unparsed_hours = _find_hour_range(text)
+    if hour_range:
+        entities['hour_range'] = [hour_range]
+    dates, unparsed_dates = _find_dates(text, reference_date)
+    for field, value in dates.items():
+        entities[field] = [value]
+    if match := re.search(r'\btop\s+(\d+)\b', text):
+        entities['top_n'] = [int(match.group(1))]
+    for pattern, time_unit in TIME_UNITS:
+        if re.search(pattern, text):
+            entities['time_unit'] = [time_unit]
+            break
+    for pattern, granularity in GRANULARITIES:
+        if re.search(pattern, text):
+            entities['granularity'] = [granularity]
+            break
+    if re.search(r'\bexcluded roadway entries\b', text):
+        entities['metric'] = ['Excluded Roadway Entries']
+    if re.search(r'\b(including|include|with) excluded roadways?\b', text):
+        entities['include_excluded_roadways'] = [True]
+    return entities, ambiguous, unparsed_dates + unparsed_hours
+
+
+def _intent_scores(text: str, entities: dict) -> dict:
+    scores = {}
+    for function_name, confidence, pattern in INTENT_PATTERNS:
+        if re.search(pattern, text):
+            scores[function_name] = max(scores.get(function_name, 0), confidence)
+    if re.search(SHARE_PATTERN, text):
+        # "share of trucks" is about vehicles; "share from Brooklyn" is about locations
+        if 'vehicle_class' in entities:
+            scores['analyze_vehicle_distribution'] = max(scores.get('analyze_vehicle_distribution', 0), 0.9)
+        elif 'entry_point' in entities or 'entry_region' in entities:
+            scores['analyze_entry_point_volume'] = max(scores.get('analyze_entry_point_volume', 0), 0.85)
+    return scores
+
+
+def _compare_segments(entities: dict) -> tuple | None:
+    """(dimension, segment_a, segment_b) when a field has two values to compare"""
+    for field, dimension in (('day_type', 'time'), ('entry_point', 'location'), ('entry_region', 'location'),
+                             ('vehicle_class', 'vehicle')):
+        values = entities.get(field, [])
+        if len(values) == 2:
+            shared = {key: items[0] for key, items in entities.items()
+                      if key != field and key in FILTER_PARAMS and len(items) == 1}
+            return dimension, {**shared, field: values[0]}, {**shared, field: values[1]}
+    return None
+
+
+def route_question(question: str, reference_date=None) -> RouteDecision:
+    """
+    Map a question to a CRZ function call without the LLM
+
+    Args:
+        question: User question
+        reference_date: Latest date in the dataset, for "last week", "this month" and so on
+
+    Returns:
+        RouteDecision; compare confidence with ROUTER_CONFIDENCE_THRESHOLD before using it
+    """
+    text = ' '.join(question.lower().split())
+    entities, ambiguous, unparsed = extract_filters(question, reference_date)
+    reasons = []
+
+    scores = _intent_scores(text, entities)
+    if re.search(COMPARE_PATTERN, text):
+        segments = _compare_segments(entities)
+        scores['compare_traffic_segments'] = 0.95 if segments else 0.4
+    if not scores:
+        return RouteDecision(None, None, 0.0, ["no intent keywords"])
+
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    function_name, confidence = ranked[0]
+    reasons.append(f"intent {function_name} ({confidence:.2f})")
+    if len(ranked) > 1 and ranked[1][1] >= confidence - 0.05:
+        confidence -= TIE_PENALTY
+        reasons.append(f"close second intent {ranked[1][0]}")
+
+    if function_name == 'compare_traffic_segments':
+        if segments is None:
+            return RouteDecision(function_name, None, confidence, reasons + ["no two segments to compare"])
+        dimension, segment_a, segment_b = segments
+        params = {'dimension': dimension, 'segment_a': segment_a, 'segment_b': segment_b}
+        if 'metric' in entities:
+            params['metric'] = entities['metric'][0]
+    else:
+        accepted = inspect.signature(function_mapping[function_name]).parameters
+        subject_fields = SUBJECT_FIELDS.get(function_name, set())
+        params = {}
+        for field, values in entities.items():
+            if field in subject_fields:
+                continue
+            if field not in accepted:
+                if field in FILTER_PARAMS:
+                    confidence -= UNSUPPORTED_FILTER_PENALTY
+                    reasons.append(f"{function_name} cannot filter by {field}")
+                continue
+            if len(values) > 1:
+                confidence -= UNSUPPORTED_FILTER_PENALTY
+                reasons.append(f"several values for {field}")
+            params[field] = values[0]
+
+    if unparsed:
+        confidence -= UNPARSED_FILTER_PENALTY
+        reasons.append(f"unparsed dates or times: {', '.join(unparsed)}")
+    if match := re.search(NEGATION_PATTERN, text):
+        confidence -= NEGATION_PENALTY
+        reasons.append(f"negated filter: {match.group(0)}")
+    if ambiguous:
+        confidence -= AMBIGUOUS_ENTITY_PENALTY
+        reasons.append(f"ambiguous: {', '.join(ambiguous)}")
+    if re.search(OUT_OF_SCOPE_PATTERN, text):
+        confidence -= OUT_OF_SCOPE_PENALTY
+        reasons.append("asks for more than the data shows")
+
+    try:
+        model = get_params_model(function_name)(**params)
+    except ValueError as e:
+        return RouteDecision(function_name, None, 0.0, reasons + [f"invalid parameters: {e}"])
+    return RouteDecision(function_name, model, round(max(confidence, 0.0), 3), reasons)
+
+
+def record_decision(decision: RouteDecision, threshold: float = ROUTER_CONFIDENCE_THRESHOLD) -> bool:
+    """Count a decision in the router metrics and return whether it should be used"""
+    routed = decision.params is not None and decision.confidence >= threshold
+    ROUTER_DECISIONS.inc(outcome='routed' if routed else 'fallback', function=decision.function_name or 'none')
+    return routed
@@ -0,0 +1,147 @@
+"""
+Conversation sessions that reuse the rows selected by earlier questions
+
+Follow-up questions usually narrow the previous one ("now only trucks", "and
+just weekends"). A ConversationSession keeps the filtered subsets of its
+recent tool calls; when a new call's filters are a refinement of a cached
+subset's (see tools.is_refinement), the call filters that subset instead of
+the full dataset, so a follow-up costs time proportional to the rows it starts
+from. Subsets are kept in LRU order within a byte budget.
+
+The session also keeps the last few questions, which run_workflow adds to
+the agents' prompts so a follow-up is read in context.
+
+Usage:
+    session = ConversationSession()
+    run_workflow("Daily trend at the Holland Tunnel in March", session=session)
+    run_workflow("Now only trucks", session=session)
+"""
+
+import collections
+import os
+import threading
+
+import pandas as pd
+from pydantic import BaseModel
+
+from src.utils.data_loader import DEFAULT_DATA_PATH, get_processed_data
+from src.utils.metrics import CACHE_LOOKUPS
+from src.utils.tracing import set_attribute, trace_span
+from src.workflow.other_tools import execute_crz_function, get_params_model, get_shared_filters, prepare_function_params
+from src.workflow.tools import canonical_filter_key, filter_crz_data, is_refinement
+
+# Memory a session may use for cached subsets
+SESSION_CACHE_BYTES = int(float(os.getenv("CRZ_SESSION_CACHE_MB", "256")) * 2**20)
+# Subsets kept per session, whatever their size
+SESSION_MAX_SUBSETS = 8
+# Earlier questions given to the agents with a follow-up
+SESSION_HISTORY = 3
+
+
+def subset_bytes(df: pd.DataFrame) -> int:
+    """
+    Memory a filtered subset adds to its parent
+
+    Shallow: the string objects in object columns are shared with the full
+    dataset, only the references to them are copied.
+    """
+    return int(df.memory_usage(index=True, deep=False).sum())
+
+
+class ConversationSession:
+    """Filter state and recent questions of one conversation"""
+
+    def __init__(self, data_path: str = DEFAULT_DATA_PATH, max_bytes: int = SESSION_CACHE_BYTES,
+                 max_subsets: int = SESSION_MAX_SUBSETS, history: int = SESSION_HISTORY):
+        self.data_path = data_path
+        self.max_bytes = max_bytes
+        self.max_subsets = max_subsets
+        self.questions = collections.deque(maxlen=history)
+        self.last_filters = None
+        # filter key -> subset, least recently used first
+        self._subsets = collections.OrderedDict()
+        self._bytes = 0
+        self._df = None
+        self._lock = threading.Lock()
+
+    def dataframe(self) -> pd.DataFrame:
+        """The session's dataset; cached subsets are dropped when the file is reloaded"""
+        df, _ = get_processed_data(self.data_path)
+        with self._lock:
+            if df is not self._df:
+                self._df = df
+                self._subsets.clear()
+                self._bytes = 0
+        return df
+
+    def contextualize(self, user_query: str) -> str:
+        """The question as the agents should see it, after the session's earlier questions"""
+        if not self.questions:
+            return user_query
+        earlier = "\n".join(f"- {question}" for question in self.questions)
+        context = f"{user_query}\n(Follow-up in a conversation; earlier questions, oldest first:\n{earlier}"
+        if self.last_filters:
+            context += "\nFilters of the last answer: " + ", ".join(
+                f"{name}={value}" for name, value in canonical_filter_key(**self.last_filters))
+        return context + ")"
+
+    def remember(self, user_query: str):
+        self.questions.append(user_query)
+
+    def execute(self, function_name: str, params: BaseModel | dict):
+        """
+        execute_crz_function, starting from the smallest cached subset the filters refine
+
+        Calls that need the full dataset (comparisons) or set no filters run on
+        the full dataset as usual.
+        """
+        df = self.dataframe()
+        if isinstance(params, dict):
+            params = get_params_model(function_name)(**params)
+        filters = get_shared_filters(function_name, prepare_function_params(function_name, params))
+        if not filters or not canonical_filter_key(**filters):
+            return execute_crz_function(function_name, params, df)
+        subset = self.subset(filters, df)
+        self.last_filters = filters
+        return execute_crz_function(function_name, params, subset)
+
+    def subset(self, filters: dict, df: pd.DataFrame) -> pd.DataFrame:
+        """Rows selected by filters, from the cache or from the narrowest cached subset they refine"""
+        key = canonical_filter_key(**filters)
+        with self._lock:
+            if key in self._subsets:
+                self._subsets.move_to_end(key)
+                CACHE_LOOKUPS.inc(cache='session_subset', result='hit')
+                set_attribute("session_subset", "hit")
+                return self._subsets[key]
+            bases = [subset for cached_key, subset in self._subsets.items() if is_refinement(key, cached_key)]
+        base = min(bases, key=len) if bases else df
+        result = 'refined' if bases else 'miss'
+        CACHE_LOOKUPS.inc(cache='session_subset', result=result)
+        with trace_span("session_subset", result=result, rows_in=len(base)):
+            subset = filter_crz_data(base, **filters)
+        self._store(key, subset)
+        return subset
+
+    def _store(self, key: tuple, subset: pd.DataFrame):
+        size = subset_bytes(subset)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._subsets:
+                return
+            self._subsets[key] = subset
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._subsets) > self.max_subsets:
+                _, evicted = self._subsets.popitem(last=False)
+                self._bytes -= subset_bytes(evicted)
+
+    def cached_bytes(self) -> int:
+        return self._bytes
+
+    def clear(self):
+        with self._lock:
+            self._subsets.clear()
+            self._bytes = 0
+        self.questions.clear()
+        self.last_filters = None
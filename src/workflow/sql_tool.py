@@ -0,0 +1,271 @@
+"""
+Read-only SQL over the processed CRZ dataset
+
+Breakdowns the analyze_* functions do not offer can be asked as one SQL
+SELECT over the table crz, which DuckDB reads in place from the dataset's
+Arrow snapshot (src.utils.snapshot). Queries are:
+
+- read-only: exactly one SELECT statement, on a connection with file,
+  extension and network access disabled and its configuration locked
+- time-limited: interrupted after CRZ_SQL_TIMEOUT seconds (default 10) or
+  at the caller's deadline, whichever comes first
+- size-limited: at most max_rows rows (capped at CRZ_SQL_MAX_ROWS) and
+  CRZ_SQL_MAX_MB megabytes of result; the result says when it was cut
+
+describe_sql_schema lists the columns, their SQL types and the values of the
+categorical ones. DuckDB is an optional dependency; without it queries raise
+an ImportError.
+
+Usage:
+    query_crz_sql(df, 'SELECT "Detection Group", SUM("CRZ Entries") AS entries FROM crz GROUP BY 1')
+"""
+
+import os
+import threading
+import time
+import weakref
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pandas as pd
+
+from src.utils.data_loader import data_version
+from src.utils.deadline import DeadlineExceeded, remaining_time
+from src.utils.metrics import REGISTRY
+from src.utils.snapshot import get_columnar_snapshot
+from src.utils.tracing import trace_span
+
+SQL_TABLE = 'crz'
+SQL_DEFAULT_ROWS = 100
+SQL_MAX_ROWS = int(os.getenv("CRZ_SQL_MAX_ROWS", "10000"))
+SQL_MAX_BYTES = int(float(os.getenv("CRZ_SQL_MAX_MB", "8")) * 2**20)
+SQL_TIMEOUT_S = float(os.getenv("CRZ_SQL_TIMEOUT", "10"))
+SQL_MEMORY_LIMIT = os.getenv("CRZ_SQL_MEMORY_LIMIT", "1GB")
+# String columns with at most this many values have them listed in the schema
+SCHEMA_MAX_VALUES = 25
+
+SQL_QUERIES = REGISTRY.counter('crz_sql_queries_total', 'SQL queries by outcome', ['result'])
+
+_local = threading.local()
+# id(dataframe) -> (data_version, schema), dropped when the dataframe is garbage collected
+_schemas = {}
+_schemas_lock = threading.Lock()
+
+
+class SQLQueryError(ValueError):
+    """A query that is not allowed or does not run"""
+
+
+def _duckdb():
+    try:
+        import duckdb
+    except ImportError as e:
+        raise ImportError(f"SQL queries need the duckdb package: {e}") from e
+    return duckdb
+
+
+def _connection():
+    """This thread's DuckDB connection, with external access disabled and settings locked"""
+    connection = getattr(_local, 'connection', None)
+    if connection is None:
+        connection = _duckdb().connect(config={
+            'enable_external_access': False,
+            'autoload_known_extensions': False,
+            'memory_limit': SQL_MEMORY_LIMIT,
+            'lock_configuration': True,
+        })
+        _local.connection = connection
+    return connection
+
+
+def read_only_statement(query: str) -> str:
+    """
+    The text of a query's single SELECT statement
+
+    Raises:
+        SQLQueryError: if the query does not parse, has several statements or
+            is anything but a SELECT
+    """
+    duckdb = _duckdb()
+    try:
+        statements = duckdb.extract_statements(query)
+    except duckdb.Error as e:
+        raise SQLQueryError(f"Invalid SQL: {e}")
+    if len(statements) != 1:
+        raise SQLQueryError(f"Expected one SQL statement, got {len(statements)}")
+    if statements[0].type != duckdb.StatementType.SELECT:
+        raise SQLQueryError(f"Only SELECT queries are allowed, not {statements[0].type.name}")
+    return statements[0].query
+
+
+def _run(table, sql: str, params: list, timeout: float | None):
+    """Run sql over an Arrow table registered as crz, interrupting it after timeout seconds"""
+    duckdb = _duckdb()
+    connection = _connection()
+    timer = threading.Timer(timeout, connection.interrupt) if timeout is not None else None
+    connection.register(SQL_TABLE, table)
+    try:
+        if timer:
+            timer.start()
+        return connection.execute(sql, params).fetch_arrow_table()
+    except duckdb.InterruptException:
+        raise DeadlineExceeded(f"SQL query did not finish within {timeout:.1f}s")
+    except duckdb.Error as e:
+        raise SQLQueryError(str(e))
+    finally:
+        if timer:
+            timer.cancel()
+        connection.unregister(SQL_TABLE)
+
+
+def _plain_types(table):
+    """Cast DuckDB's wide integer and decimal results to int64 or float64"""
+    import pyarrow as pa
+    for index, field in enumerate(table.schema):
+        if pa.types.is_decimal(field.type):
+            try:
+                column = table.column(index).cast(pa.int64() if field.type.scale == 0 else pa.float64())
+            except pa.ArrowInvalid:
+                column = table.column(index).cast(pa.float64())
+            table = table.set_column(index, field.name, column)
+    return table
+
+
+def _fit_bytes(table, max_bytes: int) -> int:
+    """Most leading rows of a table whose Arrow size is within max_bytes"""
+    low, high = 0, table.num_rows
+    while low < high:
+        middle = (low + high + 1) // 2
+        if table.slice(0, middle).nbytes <= max_bytes:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _plain_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (timedelta, Decimal)):
+        return str(value)
+    return value
+
+
+def run_sql(df: pd.DataFrame, query: str, max_rows: int = SQL_DEFAULT_ROWS, max_bytes: int = SQL_MAX_BYTES,
+            timeout: float | None = SQL_TIMEOUT_S) -> tuple:
+    """
+    Run a read-only query over a dataset
+
+    Args:
+        df: Processed CRZ dataset, queried as the table crz
+        query: One SELECT statement
+        max_rows: Rows to return at most (capped at SQL_MAX_ROWS)
+        max_bytes: Arrow size of the result at most
+        timeout: Seconds before the query is interrupted; the current deadline
+            applies too
+
+    Returns:
+        (pyarrow.Table, truncated_by) where truncated_by is None, 'max_rows'
+        or 'max_bytes'
+
+    Raises:
+        SQLQueryError: the query is not a single SELECT or fails
+        DeadlineExceeded: the query ran out of time
+    """
+    max_rows = max(0, min(int(max_rows), SQL_MAX_ROWS))
+    try:
+        statement = read_only_statement(query)
+    except SQLQueryError:
+        SQL_QUERIES.inc(result='rejected')
+        raise
+    left = remaining_time()
+    if left is not None:
+        timeout = left if timeout is None else min(timeout, left)
+        if timeout <= 0:
+            SQL_QUERIES.inc(result='timeout')
+            raise DeadlineExceeded("No time left for the SQL query")
+
+    result = 'ok'
+    with trace_span("sql_query", max_rows=max_rows) as span:
+        try:
+            # One row more than allowed shows whether the result was cut
+            table = _run(get_columnar_snapshot(df).table,
+                         f"SELECT * FROM (\n{statement}\n) AS result LIMIT ?", [max_rows + 1], timeout)
+        except SQLQueryError:
+            result = 'error'
+            raise
+        except DeadlineExceeded:
+            result = 'timeout'
+            raise
+        finally:
+            SQL_QUERIES.inc(result=result)
+        truncated_by = None
+        if table.num_rows > max_rows:
+            table, truncated_by = table.slice(0, max_rows), 'max_rows'
+        table = _plain_types(table)
+        if table.nbytes > max_bytes:
+            table, truncated_by = table.slice(0, _fit_bytes(table, max_bytes)), 'max_bytes'
+        span.set_attribute("rows_out", table.num_rows)
+        if truncated_by:
+            span.set_attribute("truncated_by", truncated_by)
+    return table, truncated_by
+
+
+def query_crz_sql(df: pd.DataFrame, query: str, max_rows: int = SQL_DEFAULT_ROWS) -> dict:
+    """
+    Answer a read-only SQL query over the CRZ dataset (table crz)
+
+    Returns:
+        dict with the result columns, the rows as records, the row count,
+        whether and why the rows were cut, and the query time
+    """
+    started = time.perf_counter()
+    table, truncated_by = run_sql(df, query, max_rows=max_rows)
+    rows = [{name: _plain_value(value) for name, value in row.items()} for row in table.to_pylist()]
+    return {
+        'columns': table.column_names,
+        'rows': rows,
+        'row_count': len(rows),
+        'truncated': truncated_by is not None,
+        'truncated_by': truncated_by,
+        'elapsed_s': round(time.perf_counter() - started, 4),
+    }
+
+
+def describe_sql_schema(df: pd.DataFrame) -> dict:
+    """
+    The table crz as SQL sees it: row count, date range, and each column's
+    type, with the values of string columns that have few of them
+    """
+    key = id(df)
+    version = data_version(df)
+    with _schemas_lock:
+        cached = _schemas.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+    table = get_columnar_snapshot(df).table
+    described = _run(table, f"DESCRIBE {SQL_TABLE}", [], SQL_TIMEOUT_S).to_pylist()
+    columns = []
+    for column in described:
+        entry = {'name': column['column_name'], 'type': column['column_type']}
+        if column['column_type'] == 'VARCHAR':
+            name = column['column_name'].replace('"', '""')
+            values = _run(table, f'SELECT DISTINCT "{name}" AS value FROM {SQL_TABLE} ORDER BY 1 LIMIT ?',
+                          [SCHEMA_MAX_VALUES + 1], SQL_TIMEOUT_S).column('value').to_pylist()
+            if len(values) <= SCHEMA_MAX_VALUES:
+                entry['values'] = values
+        columns.append(entry)
+    dates = _run(table, f'SELECT MIN("Toll Date") AS first, MAX("Toll Date") AS last FROM {SQL_TABLE}', [],
+                 SQL_TIMEOUT_S).to_pylist()[0] if 'Toll Date' in table.column_names else {}
+    schema = {
+        'table': SQL_TABLE,
+        'rows': table.num_rows,
+        'date_range': {name: _plain_value(value) for name, value in dates.items()},
+        'columns': columns,
+        'limits': {'max_rows': SQL_MAX_ROWS, 'max_bytes': SQL_MAX_BYTES, 'timeout_s': SQL_TIMEOUT_S},
+    }
+    with _schemas_lock:
+        if key not in _schemas:
+            weakref.finalize(df, _schemas.pop, key, None)
+        _schemas[key] = (version, schema)
+    return schema
@@ -1,6 +1,115 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from src.utils.crz_constants import DAY_NAMES, DETECTION_GROUPS
+from src.utils.tracing import add_to_span
+from src.workflow.filter_masks import get_filter_mask
+from src.workflow.query_plan import QueryPlan
+
+# Arguments of filter_crz_data that select rows
+FILTER_PARAMS = ('start_date', 'end_date', 'day_type', 'hour_range', 'time_period',
+                 'vehicle_class', 'entry_point', 'entry_region')
+
+def canonical_filter_key(**filters):
+    """
+    Build a hashable key for a set of filter_crz_data arguments
+    
+    Filters that filter_crz_data would ignore (None, empty values) are dropped and
+    equivalent spellings (list vs tuple hour ranges, int vs str vehicle classes,
+    differently formatted dates) map to the same key, so two calls selecting the
+    same rows share one key.
+    
+    Returns:
+    --------
+    tuple
+        Sorted tuple of (parameter, value) pairs
+    """
+    key = []
+    for name in FILTER_PARAMS:
+        value = filters.get(name)
+        if not value:
+            continue
+        if name in ('start_date', 'end_date'):
+            value = pd.to_datetime(value).isoformat()
+        elif name == 'hour_range':
+            if len(value) != 2:
+                continue
+            value = (int(value[0]), int(value[1]))
+        elif name == 'vehicle_class':
+            value = str(value)
+        key.append((name, value))
+    return tuple(key)
+
+def _filter_days(day_type):
+    """Day names a day_type filter keeps"""
+    if day_type.lower() == 'weekday':
+        return {DAY_NAMES[day] for day in range(2, 7)}
+    if day_type.lower() == 'weekend':
+        return {DAY_NAMES[1], DAY_NAMES[7]}
+    return {day_type}
+
+def _filter_hours(hour_range):
+    """Hours a hour_range filter keeps, including overnight ranges such as (22, 6)"""
+    start_hour, end_hour = hour_range
+    if start_hour <= end_hour:
+        return set(range(start_hour, end_hour + 1))
+    return set(range(start_hour, 24)) | set(range(0, end_hour + 1))
+
+def _within_vehicle_class(narrow, broad):
+    """Whether the vehicle classes one vehicle_class filter keeps are among another's"""
+    if narrow == broad:
+        return True
+    # A class number keeps every class named "<number> - ...", so a name is within its number;
+    # a number is not within one of those names, as other classes may share the number
+    return broad.isdigit() and not narrow.isdigit() and narrow.startswith(f"{int(broad)} -")
+
+def is_refinement(narrow_key, broad_key):
+    """
+    Check whether the rows selected by one filter key are a subset of another's
+
+    Both arguments are canonical_filter_key results. Every filter of broad_key
+    must be matched by one in narrow_key that keeps the same or fewer rows: a
+    later start date or earlier end date, hours or days within the broad ones,
+    or an entry point inside the broad entry region. Filters on other columns
+    are only compared for equality, so some refinements are missed, never the
+    other way round.
+
+    Returns:
+    --------
+    bool
+        True when filtering the rows of broad_key by narrow_key gives the same
+        result as filtering the full dataset by narrow_key
+    """
+    narrow = dict(narrow_key)
+    for name, value in broad_key:
+        if name == 'entry_region' and name not in narrow and 'entry_point' in narrow:
+            if DETECTION_GROUPS.get(narrow['entry_point']) != value:
+                return False
+            continue
+        if name not in narrow:
+            return False
+        if name == 'start_date':
+            matches = narrow[name] >= value
+        elif name == 'end_date':
+            matches = narrow[name] <= value
+        elif name == 'hour_range':
+            matches = _filter_hours(narrow[name]) <= _filter_hours(value)
+        elif name == 'day_type':
+            matches = _filter_days(narrow[name]) <= _filter_days(value)
+        elif name == 'vehicle_class':
+            matches = _within_vehicle_class(narrow[name], value)
+        else:
+            matches = narrow[name] == value
+        if not matches:
+            return False
+    return True
+
+def _date_range_summary(date_range):
+    """The filter_summary date_range of a plan's DateRange node"""
+    dates = date_range.value
+    if dates is None:
+        return "No data"
+    return f"{dates[0].strftime('%Y-%m-%d')} to {dates[1].strftime('%Y-%m-%d')}"
 
 def filter_crz_data(df, 
                    start_date=None, 
@@ -10,10 +119,14 @@ def filter_crz_data(df,
                    time_period=None,  # 'Peak' or 'Overnight'
                    vehicle_class=None,  # int or string for vehicle class
                    entry_point=None,  # specific entry point
-                   entry_region=None):  # specific region
+                   entry_region=None,  # specific region
+                   columns=None):  # columns to keep
     """
     Filter the CRZ dataset by multiple parameters
     
+    The row mask of each filter, and of their combination, is cached for df
+    (see src.workflow.filter_masks), so repeated filters cost a lookup.
+    
     Parameters:
     -----------
     df : pandas.DataFrame
@@ -34,63 +147,30 @@ def filter_crz_data(df,
         Specific entry point (Detection Group)
     entry_region : str, optional
         Specific region (Detection Region)
+    columns : list, optional
+        Columns to keep (all by default)
         
     Returns:
     --------
     pandas.DataFrame
         Filtered dataframe
     """
-    filtered_df = df.copy()
-    
-    # Date filtering
-    if start_date:
-        filtered_df = filtered_df[filtered_df['Toll Date'] >= pd.to_datetime(start_date)]
-    if end_date:
-        filtered_df = filtered_df[filtered_df['Toll Date'] <= pd.to_datetime(end_date)]
-    
-    # Day type filtering
-    if day_type:
-        if day_type.lower() == 'weekday':
-            # Monday(2) to Friday(6)
-            filtered_df = filtered_df[filtered_df['Day of Week Int'].between(2, 6)]
-        elif day_type.lower() == 'weekend':
-            # Saturday(7) and Sunday(1)
-            filtered_df = filtered_df[filtered_df['Day of Week Int'].isin([1, 7])]
-        else:
-            # Specific day
-            filtered_df = filtered_df[filtered_df['Day of Week'] == day_type]
-    
-    # Hour range filtering
-    if hour_range and len(hour_range) == 2:
-        start_hour, end_hour = hour_range
-        if start_hour <= end_hour:
-            filtered_df = filtered_df[filtered_df['Hour of Day'].between(start_hour, end_hour)]
-        else:
-            # Handle overnight ranges (e.g., 22-6)
-            filtered_df = filtered_df[(filtered_df['Hour of Day'] >= start_hour) | 
-                                     (filtered_df['Hour of Day'] <= end_hour)]
-    
-    # Time period filtering
-    if time_period:
-        filtered_df = filtered_df[filtered_df['Time Period'] == time_period]
-    
-    # Vehicle class filtering
-    if vehicle_class:
-        # Handle both numeric and text representations
-        if isinstance(vehicle_class, int) or vehicle_class.isdigit():
-            class_num = int(vehicle_class)
-            filtered_df = filtered_df[filtered_df['Vehicle Class'].str.startswith(f"{class_num} -")]
-        else:
-            filtered_df = filtered_df[filtered_df['Vehicle Class'] == vehicle_class]
-    
-    # Entry point filtering
-    if entry_point:
-        filtered_df = filtered_df[filtered_df['Detection Group'] == entry_point]
-    
-    # Region filtering
-    if entry_region:
-        filtered_df = filtered_df[filtered_df['Detection Region'] == entry_region]
-    
+    filter_key = canonical_filter_key(start_date=start_date, end_date=end_date,
+                                      day_type=day_type, hour_range=hour_range,
+                                      time_period=time_period, vehicle_class=vehicle_class,
+                                      entry_point=entry_point, entry_region=entry_region)
+    source = df if columns is None else df[list(columns)]
+    
+    # Rows already selected with the same filters (e.g. by execute_crz_batch)
+    if df.attrs.get('crz_filter_key') == filter_key:
+        return source.copy()
+    
+    mask = get_filter_mask(df, filter_key)
+    filtered_df = source.copy() if mask is None else source[mask]
+    
+    add_to_span('rows_scanned', len(df))
+    add_to_span('rows_matched', len(filtered_df))
+    filtered_df.attrs['crz_filter_key'] = filter_key
     return filtered_df
 
 def analyze_entry_point_volume(df, 
@@ -124,28 +204,26 @@ def analyze_entry_point_volume(df,
         - filter_summary: Summary of applied filters
     """
     # Apply filters
-    filtered_df = filter_crz_data(df, 
-                                 start_date=start_date, 
-                                 end_date=end_date,
-                                 day_type=day_type, 
-                                 hour_range=hour_range,
-                                 time_period=time_period,
-                                 vehicle_class=vehicle_class)
+    plan = QueryPlan(df)
+    scan = plan.scan(start_date=start_date, 
+                     end_date=end_date,
+                     day_type=day_type, 
+                     hour_range=hour_range,
+                     time_period=time_period,
+                     vehicle_class=vehicle_class)
+    entry_columns = ['CRZ Entries', 'Excluded Roadway Entries'] if include_excluded_roadways else ['CRZ Entries']
+    entry_sums = scan.sums(['Detection Group'], entry_columns)
+    regions = scan.distinct(['Detection Group', 'Detection Region'])
+    date_range = scan.date_range()
     
     # Group by entry point
+    entry_volumes = entry_sums.value.set_index('Detection Group')
     if include_excluded_roadways:
         # Sum both CRZ and Excluded Roadway entries
-        entry_volumes = filtered_df.groupby('Detection Group').agg({
-            'CRZ Entries': 'sum',
-            'Excluded Roadway Entries': 'sum'
-        })
         entry_volumes['Total Entries'] = entry_volumes['CRZ Entries'] + entry_volumes['Excluded Roadway Entries']
         volume_col = 'Total Entries'
     else:
         # Only count CRZ entries
-        entry_volumes = filtered_df.groupby('Detection Group').agg({
-            'CRZ Entries': 'sum'
-        })
         volume_col = 'CRZ Entries'
     
     # Sort and get top N
@@ -156,7 +234,7 @@ def analyze_entry_point_volume(df,
     top_entries['Percentage'] = (top_entries[volume_col] / total_volume * 100).round(1)
     
     # Create region mapping for context
-    region_mapping = filtered_df.drop_duplicates('Detection Group').set_index('Detection Group')['Detection Region']
+    region_mapping = regions.value.drop_duplicates('Detection Group').set_index('Detection Group')['Detection Region']
     
     # Prepare results
     results = {
@@ -171,12 +249,12 @@ def analyze_entry_point_volume(df,
         ],
         'total_volume': int(total_volume),
         'filter_summary': {
-            'date_range': f"{filtered_df['Toll Date'].min().strftime('%Y-%m-%d')} to {filtered_df['Toll Date'].max().strftime('%Y-%m-%d')}" if not filtered_df.empty else "No data",
+            'date_range': _date_range_summary(date_range),
             'day_type': day_type if day_type else "All days",
             'hour_range': f"{hour_range[0]}:00 to {hour_range[1]}:00" if hour_range else "All hours",
             'time_period': time_period if time_period else "All periods",
             'vehicle_class': vehicle_class if vehicle_class else "All vehicles",
-            'entry_count': len(filtered_df['Detection Group'].unique())
+            'entry_count': len(region_mapping)
         }
     }
     
@@ -214,24 +292,29 @@ def analyze_peak_periods(df,
         - filter_summary: Summary of applied filters
     """
     # Apply filters
-    filtered_df = filter_crz_data(df, 
-                                 start_date=start_date, 
-                                 end_date=end_date,
-                                 day_type=day_type,
-                                 vehicle_class=vehicle_class,
-                                 entry_point=entry_point,
-                                 entry_region=entry_region)
+    plan = QueryPlan(df)
+    scan = plan.scan(start_date=start_date, 
+                     end_date=end_date,
+                     day_type=day_type,
+                     vehicle_class=vehicle_class,
+                     entry_point=entry_point,
+                     entry_region=entry_region)
+    group_columns = {'hour': ['Hour of Day'], 'day_of_week': ['Day of Week'], 'date': ['Toll Date'],
+                     '10_minute': ['Hour of Day', 'Minute of Hour']}
+    if granularity not in group_columns:
+        raise ValueError(f"Unsupported granularity: {granularity}")
+    sums = scan.sums(group_columns[granularity], ['CRZ Entries'])
+    date_range = scan.date_range()
+    grouped = sums.value
     
     # Group by chosen time granularity
     if granularity == 'hour':
-        grouped = filtered_df.groupby('Hour of Day')['CRZ Entries'].sum().reset_index()
         label_formatter = lambda x: f"{int(x):02d}:00"
     
     elif granularity == 'day_of_week':
         # Order by actual day sequence (Monday to Sunday)
         day_order = {'Monday': 0, 'Tuesday': 1, 'Wednesday': 2, 'Thursday': 3, 
                     'Friday': 4, 'Saturday': 5, 'Sunday': 6}
-        grouped = filtered_df.groupby('Day of Week')['CRZ Entries'].sum().reset_index()
         # Add ordering column and sort
         grouped['day_order'] = grouped['Day of Week'].map(day_order)
         grouped = grouped.sort_values('day_order')
@@ -239,18 +322,14 @@ def analyze_peak_periods(df,
         label_formatter = lambda x: x
     
     elif granularity == 'date':
-        grouped = filtered_df.groupby('Toll Date')['CRZ Entries'].sum().reset_index()
         label_formatter = lambda x: x.strftime('%Y-%m-%d')
     
     elif granularity == '10_minute':
-        # Create a combined hour-minute column
-        filtered_df['time_block'] = filtered_df['Hour of Day'].astype(str) + ':' + filtered_df['Minute of Hour'].astype(str)
-        grouped = filtered_df.groupby('time_block')['CRZ Entries'].sum().reset_index()
+        # Create a combined hour-minute label, ordered as text like the other groupings
+        grouped['time_block'] = grouped['Hour of Day'].astype(str) + ':' + grouped['Minute of Hour'].astype(str)
+        grouped = grouped.sort_values('time_block')[['time_block', 'CRZ Entries']].reset_index(drop=True)
         label_formatter = lambda x: x
     
-    else:
-        raise ValueError(f"Unsupported granularity: {granularity}")
-    
     # Sort by volume and get top peaks
     grouped = grouped.sort_values('CRZ Entries', ascending=False)
     top_periods = grouped.head(top_n)
@@ -288,7 +367,7 @@ def analyze_peak_periods(df,
         'total_volume': int(grouped['CRZ Entries'].sum()),
         'filter_summary': {
             'granularity': granularity,
-            'date_range': f"{filtered_df['Toll Date'].min().strftime('%Y-%m-%d')} to {filtered_df['Toll Date'].max().strftime('%Y-%m-%d')}" if not filtered_df.empty else "No data",
+            'date_range': _date_range_summary(date_range),
             'day_type': day_type if day_type else "All days",
             'vehicle_class': vehicle_class if vehicle_class else "All vehicles",
             'entry_point': entry_point if entry_point else "All entry points",
@@ -327,18 +406,22 @@ def analyze_vehicle_distribution(df,
         - comparison: Optional comparison with another time period
         - filter_summary: Summary of applied filters
     """
-    # Apply filters for main period
-    filtered_df = filter_crz_data(df, 
-                                 start_date=start_date, 
-                                 end_date=end_date,
-                                 day_type=day_type, 
-                                 hour_range=hour_range,
-                                 time_period=time_period,
-                                 entry_point=entry_point,
-                                 entry_region=entry_region)
+    # Apply filters for main period, and for the comparison period if requested
+    plan = QueryPlan(df)
+    scan = plan.scan(start_date=start_date, 
+                     end_date=end_date,
+                     day_type=day_type, 
+                     hour_range=hour_range,
+                     time_period=time_period,
+                     entry_point=entry_point,
+                     entry_region=entry_region)
+    vehicle_sums = scan.sums(['Vehicle Class'], ['CRZ Entries'])
+    date_range = scan.date_range()
+    if compare_with:
+        comp_sums = plan.scan(**compare_with).sums(['Vehicle Class'], ['CRZ Entries'])
     
     # Group by vehicle class
-    vehicle_counts = filtered_df.groupby('Vehicle Class')['CRZ Entries'].sum().reset_index()
+    vehicle_counts = vehicle_sums.value
     
     # Calculate percentages
     total_volume = vehicle_counts['CRZ Entries'].sum()
@@ -350,11 +433,8 @@ def analyze_vehicle_distribution(df,
     # Prepare comparison if requested
     comparison_data = None
     if compare_with:
-        # Apply filters for comparison period
-        comp_df = filter_crz_data(df, **compare_with)
-        
         # Group by vehicle class
-        comp_counts = comp_df.groupby('Vehicle Class')['CRZ Entries'].sum().reset_index()
+        comp_counts = comp_sums.value
         
         # Calculate percentages
         comp_total = comp_counts['CRZ Entries'].sum()
@@ -386,7 +466,7 @@ def analyze_vehicle_distribution(df,
         ],
         'total_volume': int(total_volume),
         'filter_summary': {
-            'date_range': f"{filtered_df['Toll Date'].min().strftime('%Y-%m-%d')} to {filtered_df['Toll Date'].max().strftime('%Y-%m-%d')}" if not filtered_df.empty else "No data",
+            'date_range': _date_range_summary(date_range),
             'day_type': day_type if day_type else "All days",
             'hour_range': f"{hour_range[0]}:00 to {hour_range[1]}:00" if hour_range else "All hours",
             'time_period': time_period if time_period else "All periods",
@@ -431,23 +511,29 @@ def analyze_time_trends(df,
         - filter_summary: Summary of applied filters
     """
     # Apply filters
-    filtered_df = filter_crz_data(df, 
-                                 start_date=start_date, 
-                                 end_date=end_date,
-                                 day_type=day_type,
-                                 vehicle_class=vehicle_class,
-                                 entry_point=entry_point,
-                                 entry_region=entry_region)
+    plan = QueryPlan(df)
+    scan = plan.scan(start_date=start_date, 
+                     end_date=end_date,
+                     day_type=day_type,
+                     vehicle_class=vehicle_class,
+                     entry_point=entry_point,
+                     entry_region=entry_region)
+    # Months come from the Month column, or from the daily sums if it doesn't exist
+    group_columns = {'hour': 'Hour of Day', 'day': 'Toll Date', 'day_of_week': 'Day of Week', 'week': 'Toll Week',
+                     'month': 'Month' if 'Month' in df.columns else 'Toll Date'}
+    if time_unit not in group_columns:
+        raise ValueError(f"Unsupported time unit: {time_unit}")
+    sums = scan.sums([group_columns[time_unit]], [metric])
+    date_range = scan.date_range()
+    grouped = sums.value
     
     # Group by time unit
     if time_unit == 'hour':
-        grouped = filtered_df.groupby('Hour of Day')[metric].sum().reset_index()
         x_label = 'hour'
         x_column = 'Hour of Day'
         formatter = lambda x: f"{int(x):02d}:00"
         
     elif time_unit == 'day':
-        grouped = filtered_df.groupby('Toll Date')[metric].sum().reset_index()
         x_label = 'date'
         x_column = 'Toll Date'
         formatter = lambda x: x.strftime('%Y-%m-%d')
@@ -456,7 +542,6 @@ def analyze_time_trends(df,
         # Map days to numbers for proper ordering
         day_order = {'Sunday': 0, 'Monday': 1, 'Tuesday': 2, 'Wednesday': 3, 
                     'Thursday': 4, 'Friday': 5, 'Saturday': 6}
-        grouped = filtered_df.groupby('Day of Week')[metric].sum().reset_index()
         grouped['day_order'] = grouped['Day of Week'].map(day_order)
         grouped = grouped.sort_values('day_order')
         grouped = grouped.drop('day_order', axis=1)
@@ -465,22 +550,18 @@ def analyze_time_trends(df,
         formatter = lambda x: x
         
     elif time_unit == 'week':
-        grouped = filtered_df.groupby('Toll Week')[metric].sum().reset_index()
         x_label = 'week'
         x_column = 'Toll Week'
         formatter = lambda x: x.strftime('%Y-%m-%d')
         
     elif time_unit == 'month':
         # Create a month column if it doesn't exist
-        if 'Month' not in filtered_df.columns and 'Toll Date' in filtered_df.columns:
-            filtered_df['Month'] = filtered_df['Toll Date'].dt.to_period('M')
-        grouped = filtered_df.groupby('Month')[metric].sum().reset_index()
+        if 'Month' not in grouped.columns:
+            grouped['Month'] = grouped['Toll Date'].dt.to_period('M')
+            grouped = grouped.groupby('Month')[metric].sum().reset_index()
         x_label = 'month'
         x_column = 'Month'
         formatter = lambda x: str(x)
-        
-    else:
-        raise ValueError(f"Unsupported time unit: {time_unit}")
     
     # Calculate trend statistics
     if len(grouped) > 1 and time_unit in ['day', 'week', 'month']:
@@ -532,7 +613,7 @@ def analyze_time_trends(df,
         'time_unit': time_unit,
         'total_volume': int(grouped[metric].sum()),
         'filter_summary': {
-            'date_range': f"{filtered_df['Toll Date'].min().strftime('%Y-%m-%d')} to {filtered_df['Toll Date'].max().strftime('%Y-%m-%d')}" if not filtered_df.empty else "No data",
+            'date_range': _date_range_summary(date_range),
             'day_type': day_type if day_type else "All days",
             'vehicle_class': vehicle_class if vehicle_class else "All vehicles",
             'entry_point': entry_point if entry_point else "All entry points",
@@ -570,25 +651,29 @@ def analyze_excluded_roadway_usage(df,
         - filter_summary: Summary of applied filters
     """
     # Apply filters
-    filtered_df = filter_crz_data(df, 
-                                 start_date=start_date, 
-                                 end_date=end_date,
-                                 day_type=day_type, 
-                                 hour_range=hour_range,
-                                 time_period=time_period,
-                                 vehicle_class=vehicle_class,
-                                 entry_region=entry_region)
+    plan = QueryPlan(df)
+    scan = plan.scan(start_date=start_date, 
+                     end_date=end_date,
+                     day_type=day_type, 
+                     hour_range=hour_range,
+                     time_period=time_period,
+                     vehicle_class=vehicle_class,
+                     entry_region=entry_region)
+    usage_columns = ['CRZ Entries', 'Excluded Roadway Entries']
+    overall = scan.totals(usage_columns)
+    entry_sums = scan.sums(['Detection Group'], usage_columns)
+    vehicle_sums = scan.sums(['Vehicle Class'], usage_columns)
+    hourly_sums = scan.sums(['Hour of Day'], usage_columns)
+    date_range = scan.date_range()
     
     # Calculate overall usage
-    total_crz = filtered_df['CRZ Entries'].sum()
-    total_excluded = filtered_df['Excluded Roadway Entries'].sum()
+    totals = overall.value
+    total_crz = totals['CRZ Entries']
+    total_excluded = totals['Excluded Roadway Entries']
     total_entries = total_crz + total_excluded
     
     # Usage by entry point
-    entry_usage = filtered_df.groupby('Detection Group').agg({
-        'CRZ Entries': 'sum',
-        'Excluded Roadway Entries': 'sum'
-    }).reset_index()
+    entry_usage = entry_sums.value
     
     # Calculate total and excluded percentage for each entry point
     entry_usage['Total'] = entry_usage['CRZ Entries'] + entry_usage['Excluded Roadway Entries']
@@ -599,10 +684,7 @@ def analyze_excluded_roadway_usage(df,
     entry_usage = entry_usage.sort_values('Excluded Percentage', ascending=False)
     
     # Usage by vehicle class
-    vehicle_usage = filtered_df.groupby('Vehicle Class').agg({
-        'CRZ Entries': 'sum',
-        'Excluded Roadway Entries': 'sum'
-    }).reset_index()
+    vehicle_usage = vehicle_sums.value
     
     # Calculate total and excluded percentage for each vehicle class
     vehicle_usage['Total'] = vehicle_usage['CRZ Entries'] + vehicle_usage['Excluded Roadway Entries']
@@ -611,10 +693,7 @@ def analyze_excluded_roadway_usage(df,
     
     # Usage by time
     # Group by hour of day
-    hourly_usage = filtered_df.groupby('Hour of Day').agg({
-        'CRZ Entries': 'sum',
-        'Excluded Roadway Entries': 'sum'
-    }).reset_index()
+    hourly_usage = hourly_sums.value
     
     hourly_usage['Total'] = hourly_usage['CRZ Entries'] + hourly_usage['Excluded Roadway Entries']
     hourly_usage['Excluded Percentage'] = (hourly_usage['Excluded Roadway Entries'] / 
@@ -658,7 +737,7 @@ def analyze_excluded_roadway_usage(df,
             for _, row in hourly_usage.iterrows()
         ],
         'filter_summary': {
-            'date_range': f"{filtered_df['Toll Date'].min().strftime('%Y-%m-%d')} to {filtered_df['Toll Date'].max().strftime('%Y-%m-%d')}" if not filtered_df.empty else "No data",
+            'date_range': _date_range_summary(date_range),
             'day_type': day_type if day_type else "All days",
             'hour_range': f"{hour_range[0]}:00 to {hour_range[1]}:00" if hour_range else "All hours",
             'time_period': time_period if time_period else "All periods",
@@ -703,30 +782,41 @@ def compare_traffic_segments(df,
     if not segment_a or not segment_b:
         raise ValueError("Both segment_a and segment_b must be provided")
     
-    # Apply filters for segment A
-    df_a = filter_crz_data(df, **segment_a)
+    # Patterns each dimension compares across
+    pattern_columns = {'time': ['Vehicle Class', 'Detection Group'],
+                       'vehicle': ['Hour of Day', 'Day of Week', 'Detection Group'],
+                       'location': ['Hour of Day', 'Vehicle Class']}
+    if dimension not in pattern_columns:
+        raise ValueError(f"Unsupported comparison dimension: {dimension}")
     
-    # Apply filters for segment B
-    df_b = filter_crz_data(df, **segment_b)
+    # Apply filters for both segments
+    plan = QueryPlan(df)
+    scan_a = plan.scan(**segment_a)
+    scan_b = plan.scan(**segment_b)
+    sums_a = {column: scan_a.sums([column], [metric]) for column in pattern_columns[dimension]}
+    sums_b = {column: scan_b.sums([column], [metric]) for column in pattern_columns[dimension]}
+    if dimension == 'location':
+        excluded_total_a = scan_a.totals(['Excluded Roadway Entries'])
+        excluded_total_b = scan_b.totals(['Excluded Roadway Entries'])
     
     # Analysis varies by dimension
     if dimension == 'time':
         # For time comparison, we look at patterns across other dimensions
         
         # Vehicle class distribution
-        vehicle_a = df_a.groupby('Vehicle Class')[metric].sum()
+        vehicle_a = sums_a['Vehicle Class'].series()
         total_a = vehicle_a.sum()
         vehicle_a_pct = (vehicle_a / total_a * 100).round(1) if total_a > 0 else vehicle_a * 0
         
-        vehicle_b = df_b.groupby('Vehicle Class')[metric].sum()
+        vehicle_b = sums_b['Vehicle Class'].series()
         total_b = vehicle_b.sum()
         vehicle_b_pct = (vehicle_b / total_b * 100).round(1) if total_b > 0 else vehicle_b * 0
         
         # Entry point distribution
-        entry_a = df_a.groupby('Detection Group')[metric].sum()
+        entry_a = sums_a['Detection Group'].series()
         entry_a_pct = (entry_a / total_a * 100).round(1) if total_a > 0 else entry_a * 0
         
-        entry_b = df_b.groupby('Detection Group')[metric].sum()
+        entry_b = sums_b['Detection Group'].series()
         entry_b_pct = (entry_b / total_b * 100).round(1) if total_b > 0 else entry_b * 0
         
         # Calculate differences in percentages for vehicle classes
@@ -782,26 +872,26 @@ def compare_traffic_segments(df,
         # For vehicle comparison, we look at time and location patterns
         
         # Time patterns - hour of day
-        hour_a = df_a.groupby('Hour of Day')[metric].sum()
+        hour_a = sums_a['Hour of Day'].series()
         total_a = hour_a.sum()
         hour_a_pct = (hour_a / total_a * 100).round(1) if total_a > 0 else hour_a * 0
         
-        hour_b = df_b.groupby('Hour of Day')[metric].sum()
+        hour_b = sums_b['Hour of Day'].series()
         total_b = hour_b.sum()
         hour_b_pct = (hour_b / total_b * 100).round(1) if total_b > 0 else hour_b * 0
         
         # Day of week patterns
-        day_a = df_a.groupby('Day of Week')[metric].sum()
+        day_a = sums_a['Day of Week'].series()
         day_a_pct = (day_a / total_a * 100).round(1) if total_a > 0 else day_a * 0
         
-        day_b = df_b.groupby('Day of Week')[metric].sum()
+        day_b = sums_b['Day of Week'].series()
         day_b_pct = (day_b / total_b * 100).round(1) if total_b > 0 else day_b * 0
         
         # Entry point patterns
-        entry_a = df_a.groupby('Detection Group')[metric].sum()
+        entry_a = sums_a['Detection Group'].series()
         entry_a_pct = (entry_a / total_a * 100).round(1) if total_a > 0 else entry_a * 0
         
-        entry_b = df_b.groupby('Detection Group')[metric].sum()
+        entry_b = sums_b['Detection Group'].series()
         entry_b_pct = (entry_b / total_b * 100).round(1) if total_b > 0 else entry_b * 0
         
         # Calculate differences
@@ -852,19 +942,19 @@ def compare_traffic_segments(df,
         # For location comparison, we look at time and vehicle patterns
         
         # Time patterns - hour of day
-        hour_a = df_a.groupby('Hour of Day')[metric].sum()
+        hour_a = sums_a['Hour of Day'].series()
         total_a = hour_a.sum()
         hour_a_pct = (hour_a / total_a * 100).round(1) if total_a > 0 else hour_a * 0
         
-        hour_b = df_b.groupby('Hour of Day')[metric].sum()
+        hour_b = sums_b['Hour of Day'].series()
         total_b = hour_b.sum()
         hour_b_pct = (hour_b / total_b * 100).round(1) if total_b > 0 else hour_b * 0
         
         # Vehicle patterns
-        vehicle_a = df_a.groupby('Vehicle Class')[metric].sum()
+        vehicle_a = sums_a['Vehicle Class'].series()
         vehicle_a_pct = (vehicle_a / total_a * 100).round(1) if total_a > 0 else vehicle_a * 0
         
-        vehicle_b = df_b.groupby('Vehicle Class')[metric].sum()
+        vehicle_b = sums_b['Vehicle Class'].series()
         vehicle_b_pct = (vehicle_b / total_b * 100).round(1) if total_b > 0 else vehicle_b * 0
         
         # Calculate differences
@@ -879,10 +969,10 @@ def compare_traffic_segments(df,
         peak_hour_b = hour_b.idxmax() if not hour_b.empty else None
         
         # Excluded roadway usage
-        excluded_a = df_a['Excluded Roadway Entries'].sum()
+        excluded_a = excluded_total_a.value['Excluded Roadway Entries']
         excluded_pct_a = (excluded_a / (total_a + excluded_a) * 100).round(1) if (total_a + excluded_a) > 0 else 0
         
-        excluded_b = df_b['Excluded Roadway Entries'].sum()
+        excluded_b = excluded_total_b.value['Excluded Roadway Entries']
         excluded_pct_b = (excluded_b / (total_b + excluded_b) * 100).round(1) if (total_b + excluded_b) > 0 else 0
         
         # Prepare results
@@ -5,26 +5,112 @@ from src.workflow.agents import reception_agent, function_selection_agent, data_
 import json
 from typing import Any
 from src.workflow.other_tools import execute_crz_function
-from src.utils.data_loader import load_and_process_data
-from src.models.schemas import functions_info
-
-
-def run_workflow(user_query: str):
-    file_path = "data/MTA_Congestion_Relief_Zone_Vehicle_Entries__Beginning_2025_20250404.csv"
-    df, aggregations = load_and_process_data(file_path)
-    reception_response = reception_agent(user_query)
-    print("\n\nReception Response:")
-    print(reception_response)
-    function_selection_response = function_selection_agent(user_query, reception_response.data_description, functions_info)
-    print("\n\nFunction Selection Response:")
-    print(function_selection_response)
-    data_retrieval_response = data_retrieval_agent(user_query, function_selection_response.function_name)
-    print("\n\nData Retrieval Response:")
-    print(data_retrieval_response)
-    data_retrieval_response = execute_crz_function(function_name=function_selection_response.function_name, params=data_retrieval_response, df=df)
-    final_answer_response = final_answer_agent(user_query, data_retrieval_response)
-    print("\n\nFinal Answer:")
-    print(final_answer_response)
+from src.utils.data_loader import DEFAULT_DATA_PATH, get_processed_data
+from src.utils.deadline import deadline
+from src.utils.profiling import profile_request
+from src.utils.singleflight import SingleFlight
+from src.utils.tracing import format_trace_summary, trace_span
+from src.workflow.router import record_decision, route_question
+from src.workflow.session import ConversationSession
+
+# Overall time budget for a question in seconds; unset means no deadline
+WORKFLOW_TIMEOUT_S = float(os.environ["CRZ_WORKFLOW_TIMEOUT"]) if os.getenv("CRZ_WORKFLOW_TIMEOUT") else None
+
+
+# Identical questions being answered at the same time
+WORKFLOW_FLIGHTS = SingleFlight('workflow')
+
+
+def question_key(user_query: str, data_path: str, use_router: bool, timeout: float | None = None) -> tuple:
+    """
+    Key under which concurrent runs of the same question are coalesced (case and spacing ignored)
+
+    The time budget is part of the key: a run under a tight deadline may answer with
+    fallback responses that a caller with more time should not be handed.
+    """
+    return (" ".join(user_query.lower().split()), data_path, use_router, timeout)
+
+
+def run_workflow(user_query: str, profile: bool = False, data_path: str = DEFAULT_DATA_PATH, verbose: bool = True,
+                 use_router: bool = True, timeout: float | None = WORKFLOW_TIMEOUT_S,
+                 session: ConversationSession | None = None):
+    """
+    Answer a question with the agent pipeline and return the FinalAnswer
+    
+    Stereotyped questions the rule-based router maps confidently to a function
+    skip the reception, function selection and data retrieval agents.
+    verbose=False skips printing the intermediate responses and the timing breakdown.
+    timeout is the budget for the whole question: each LLM call only gets the time
+    left by the stages before it, and falls back to its default response when it runs out.
+    A question asked while the same question is being answered with the same timeout
+    waits for that run and gets a copy of its answer; profiled runs always run on their own.
+    With a session (src.workflow.session), the question is read as a follow-up to the
+    session's earlier questions and its tool call starts from their filtered rows
+    when it narrows them; data_path is then the session's. The router only sees the
+    question itself, so follow-ups always go to the agents.
+    """
+    if profile or session is not None:
+        return _run_workflow(user_query, profile, data_path, verbose, use_router, timeout, session)
+    with deadline(timeout):
+        return WORKFLOW_FLIGHTS.do(question_key(user_query, data_path, use_router, timeout), _run_workflow,
+                                   user_query, profile, data_path, verbose, use_router, timeout)
+
+
+def _run_workflow(user_query: str, profile: bool, data_path: str, verbose: bool, use_router: bool,
+                  timeout: float | None, session: ConversationSession | None = None):
+    log = print if verbose else (lambda *args: None)
+    with trace_span("run_workflow", query_chars=len(user_query)) as root, deadline(timeout), \
+            profile_request("run_workflow", {"query": user_query}, force=profile) as profile_id:
+        if profile_id:
+            root.set_attribute("profile_id", profile_id)
+        with trace_span("load_data") as span:
+            df = session.dataframe() if session else get_processed_data(data_path)[0]
+            span.set_attribute("rows", len(df))
+        question = user_query
+        # A follow-up depends on the earlier questions, which only the agents read
+        follow_up = session is not None and bool(session.questions)
+        if session:
+            user_query = session.contextualize(user_query)
+        routed = False
+        if use_router and not follow_up:
+            with trace_span("route_question") as span:
+                decision = route_question(question, reference_date=df['Toll Date'].max())
+                routed = record_decision(decision)
+                span.set_attribute("confidence", decision.confidence)
+                span.set_attribute("routed", routed)
+        if routed:
+            function_name, function_params = decision.function_name, decision.params
+            log(f"\n\nRouted to {function_name} (confidence {decision.confidence:.2f}):")
+            log(function_params)
+        else:
+            with trace_span("reception_agent"):
+                reception_response = reception_agent(user_query)
+            log("\n\nReception Response:")
+            log(reception_response)
+            with trace_span("function_selection_agent"):
+                function_selection_response = function_selection_agent(user_query, reception_response.data_description)
+            log("\n\nFunction Selection Response:")
+            log(function_selection_response)
+            function_name = function_selection_response.function_name
+            with trace_span("data_retrieval_agent", function=function_name):
+                function_params = data_retrieval_agent(user_query, function_name)
+            log("\n\nData Retrieval Response:")
+            log(function_params)
+        if session:
+            data_retrieval_response = session.execute(function_name, function_params)
+        else:
+            data_retrieval_response = execute_crz_function(function_name=function_name, params=function_params, df=df)
+        with trace_span("final_answer_agent", retrieved_chars=len(str(data_retrieval_response))):
+            final_answer_response = final_answer_agent(user_query, data_retrieval_response)
+        log("\n\nFinal Answer:")
+        log(final_answer_response)
+        if session:
+            session.remember(question)
+    log("\n\nTiming:")
+    log(format_trace_summary(root))
+    if profile_id:
+        print(f"Profile saved as {profile_id} (python -m src.utils.profiling show {profile_id})")
+    return final_answer_response
 
 if __name__ == "__main__":
     run_workflow("What is the total number of vehicles that entered the CRZ in the last 30 days?")
\ No newline at end of file